@@ -0,0 +1,179 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+#【定数】
+#検証用のヘッダ（ETag/Last-Modified）がない応答を新鮮とみなす秒数（ある応答は毎回再検証する）
+DEFAULT_TTL = 600
+#キャッシュの最大サイズ（超えた場合は最後に使ってから最も古いものを削除する）
+DEFAULT_MAX_BYTES = 100 * 1024 * 1024
+#キャッシュのキーから除くクエリパラメータ（値はハッシュにしてキーに含める）
+SECRET_PARAMS = ('api_key',)
+#キャッシュのキーに含める認証情報のハッシュのクエリパラメータ名
+CREDENTIAL_PARAM = 'credential'
+#キャッシュしないエンドポイント（APIキーの確認に使うため毎回送信する）
+UNCACHED_PATHS = ('current_project',)
+#キャッシュに保存する応答ヘッダ
+STORED_HEADERS = ('Content-Type', 'ETag', 'Last-Modified')
+
+# -----------------------------------------------------------
+# キャッシュのキーを作成する
+#   api_keyはURLから除き、代わりにハッシュを含める（別のAPIキーの応答を返さないようにする）
+#
+# Parameters:
+#  url（str）：APIのURL
+#
+# Returns:
+#  key（str）：キャッシュのキー
+# -----------------------------------------------------------
+def cache_key(url):
+    split = urlsplit(url)
+    params = parse_qsl(split.query, keep_blank_values=True)
+    query = [(k, v) for k, v in params if k not in SECRET_PARAMS]
+    secrets = [(k, v) for k, v in params if k in SECRET_PARAMS]
+    if len(secrets) > 0:
+        query.append((CREDENTIAL_PARAM, hashlib.sha256(json.dumps(secrets).encode('utf-8')).hexdigest()))
+    return urlunsplit((split.scheme, split.netloc, split.path.rstrip('/'), urlencode(query), ''))
+
+def is_cacheable(url):
+    return urlsplit(url).path.rstrip('/').rsplit('/', 1)[-1] not in UNCACHED_PATHS
+
+# -----------------------------------------------------------
+# キャッシュした応答
+# -----------------------------------------------------------
+class CacheEntry:
+    def __init__(self, key, headers, body, stored_at):
+        self.key = key
+        self.headers = headers
+        self.body = body
+        self.stored_at = stored_at
+
+    @property
+    def etag(self):
+        return self.headers.get('ETag')
+
+    @property
+    def last_modified(self):
+        return self.headers.get('Last-Modified')
+
+    # -----------------------------------------------------------
+    # 再検証用のリクエストヘッダ（If-None-Match/If-Modified-Since）
+    # -----------------------------------------------------------
+    def validators(self):
+        headers = {}
+        if self.etag is not None:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified is not None:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+# -----------------------------------------------------------
+# GETの応答をSQLiteに保存するキャッシュ
+#   検証用のヘッダ（ETag/Last-Modified）がある応答は毎回条件付きGETで再検証する（304の場合は本文を使う）
+#   検証用のヘッダがない応答だけ、TTL以内であれば送信せずに使う
+#   POST/PATCH/DELETEを送信したURLの上位と下位のキャッシュは破棄する
+#
+# Parameters:
+#  path（str）：キャッシュファイルのパス
+#  ttl（float）：キャッシュを新鮮とみなす秒数
+#  max_bytes（int）：キャッシュの最大サイズ
+# -----------------------------------------------------------
+class HTTPCache:
+    def __init__(self, path, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS responses ('
+                           'key TEXT PRIMARY KEY, path TEXT NOT NULL, headers TEXT NOT NULL, body BLOB NOT NULL, '
+                           'size INTEGER NOT NULL, stored_at REAL NOT NULL, accessed_at REAL NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS responses_path ON responses (path)')
+
+    def lookup(self, key):
+        with self._lock:
+            row = self._conn.execute('SELECT headers, body, stored_at FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return None
+            self._conn.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (time.time(), key))
+        return CacheEntry(key, json.loads(row[0]), row[1], row[2])
+
+    def is_fresh(self, entry):
+        return len(entry.validators()) == 0 and time.time() - entry.stored_at < self.ttl
+
+    # -----------------------------------------------------------
+    # 応答を保存する（最大サイズを超えた場合は古いものから削除する）
+    #
+    # Parameters:
+    #  key（str）：キャッシュのキー
+    #  headers（dict）：応答ヘッダ
+    #  body（bytes）：応答の本文
+    # -----------------------------------------------------------
+    def store(self, key, headers, body):
+        headers = {k: headers[k] for k in STORED_HEADERS if headers.get(k) is not None}
+        now = time.time()
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)',
+                               (key, _key_path(key), json.dumps(headers), body, len(body), now, now))
+            self._evict()
+
+    # -----------------------------------------------------------
+    # 再検証（304）が成功した応答を新鮮な状態に戻す
+    # -----------------------------------------------------------
+    def touch(self, entry):
+        now = time.time()
+        with self._lock:
+            self._conn.execute('UPDATE responses SET stored_at = ?, accessed_at = ? WHERE key = ?', (now, now, entry.key))
+
+    # -----------------------------------------------------------
+    # 更新したURLに関係するキャッシュを破棄する
+    #   例：PATCH test_suites/1 → test_suites（一覧）、test_suites/1、test_suites/1/... を破棄する
+    #
+    # Parameters:
+    #  url（str）：POST/PATCH/DELETEを送信したURL
+    #
+    # Returns:
+    #  破棄した件数
+    # -----------------------------------------------------------
+    def invalidate(self, url):
+        path = _key_path(cache_key(url))
+        ancestors = [path]
+        while '/' in ancestors[-1]:
+            ancestors.append(ancestors[-1].rsplit('/', 1)[0])
+        with self._lock:
+            cur = self._conn.execute('DELETE FROM responses WHERE path IN ({}) OR path LIKE ? ESCAPE ?'.format(
+                ','.join('?' * len(ancestors))), ancestors + [_escape_like(path) + '/%', '\\'])
+            return cur.rowcount
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute('DELETE FROM responses')
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def _evict(self):
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute('SELECT key, size FROM responses ORDER BY accessed_at').fetchall():
+            self._conn.execute('DELETE FROM responses WHERE key = ?', (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+def _key_path(key):
+    split = urlsplit(key)
+    return split.netloc + split.path
+
+def _escape_like(value):
+    return value.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
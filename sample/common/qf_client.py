@@ -0,0 +1,501 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import asyncio
+import threading
+import time
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+import http_cache
+import qf_metrics
+
+#【定数】
+#ホストごとに保持するコネクションの最大数
+DEFAULT_POOL_SIZE = 10
+#レスポンスの圧縮（gzip）を要求する
+ACCEPT_ENCODING = 'gzip, deflate'
+#QFサービス規約対応のため（1秒あたりのリクエスト数と連続送信できる数）
+DEFAULT_RATE = 1.0
+DEFAULT_BURST = 1
+#429/503を受けた時の再送回数
+DEFAULT_MAX_RETRIES = 5
+#Retry-Afterがない場合の待機秒数（再送ごとに倍にする）
+DEFAULT_BACKOFF = 1.0
+#再送対象のステータスコード
+RETRY_STATUS_CODES = (429, 503)
+#429を受けた時に下げられる送信レートの下限（設定値に対する割合）
+MIN_RATE_FACTOR = 0.1
+#送信したURLの上位・下位のキャッシュを破棄するメソッド
+WRITE_METHODS = ('POST', 'PUT', 'PATCH', 'DELETE')
+
+#通信エラー（接続できない・応答を受け取れない）の例外。ツールはrequestsをimportせずにこれで捕捉する
+RequestError = requests.RequestException
+
+# -----------------------------------------------------------
+# 通信の統計情報
+#   ホストごとに送信したリクエスト数と新規に開いたコネクション数を数える
+#   キャッシュを使った場合は、送信せずに返した数（hit）と304で再検証した数（revalidated）を数える
+# -----------------------------------------------------------
+class ClientStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = {}
+        self._connections = {}
+        self._cache = {}
+
+    def count_request(self, host):
+        with self._lock:
+            self._requests[host] = self._requests.get(host, 0) + 1
+
+    def count_connection(self, host):
+        with self._lock:
+            self._connections[host] = self._connections.get(host, 0) + 1
+
+    def count_cache(self, host, kind):
+        with self._lock:
+            counts = self._cache.setdefault(host, {})
+            counts[kind] = counts.get(kind, 0) + 1
+
+    # -----------------------------------------------------------
+    # 統計情報のスナップショットを取得する
+    #
+    # Returns:
+    #  ret（dict）：ホスト名 → {'requests': 件数, 'connections': 件数, 'cache': {種類: 件数}}
+    # -----------------------------------------------------------
+    def snapshot(self):
+        with self._lock:
+            hosts = set(self._requests) | set(self._connections) | set(self._cache)
+            return {
+                host: {
+                    'requests': self._requests.get(host, 0),
+                    'connections': self._connections.get(host, 0),
+                    'cache': dict(self._cache.get(host, {})),
+                }
+                for host in sorted(hosts)
+            }
+
+# -----------------------------------------------------------
+# トークンバケット方式のレートリミッター
+#   1秒あたりrate個のトークンを補充し、リクエストごとに1個消費する
+#   リクエストにかかった時間もトークンの補充に含まれるため、
+#   固定時間のスリープと違い応答待ちの時間が無駄にならない
+#   429を受けた場合は全スレッドの送信を止め、送信レートを一時的に下げる
+#
+# Parameters:
+#  rate（float）：1秒あたりのリクエスト数（Noneの場合は制限しない）
+#  burst（int）：連続して送信できるリクエスト数
+# -----------------------------------------------------------
+class RateLimiter:
+    def __init__(self, rate=DEFAULT_RATE, burst=DEFAULT_BURST):
+        self.max_rate = rate
+        self.rate = rate
+        self.burst = max(1, burst)
+        self._tokens = float(self.burst)
+        self._last = time.monotonic()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+        self._last = now
+
+    # -----------------------------------------------------------
+    # 送信できるまで待機してトークンを1個消費する
+    #
+    # Returns:
+    #  waited（float）：待機した秒数
+    # -----------------------------------------------------------
+    def acquire(self):
+        if self.max_rate is None:
+            #送信レートを制限しない場合も、サーバから受けた送信制限の間は待機する
+            with self._lock:
+                wait = self._blocked_until - time.monotonic()
+            if wait <= 0:
+                return 0.0
+            time.sleep(wait)
+            return wait
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                wait = self._blocked_until - now
+                if wait <= 0:
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return waited
+                    wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    # -----------------------------------------------------------
+    # サーバから送信制限（429、Retry-After）を受けた時に送信を止める
+    #
+    # Parameters:
+    #  delay（float）：送信を止める秒数
+    # -----------------------------------------------------------
+    def backoff(self, delay):
+        with self._lock:
+            now = time.monotonic()
+            self._blocked_until = max(self._blocked_until, now + delay)
+            if self.max_rate is None:
+                return
+            self._tokens = 0.0
+            self._last = now
+            self.rate = max(self.max_rate * MIN_RATE_FACTOR, self.rate / 2)
+
+    # -----------------------------------------------------------
+    # 成功した時に下げた送信レートを少しずつ元に戻す
+    # -----------------------------------------------------------
+    def recover(self):
+        if self.max_rate is None:
+            return
+        with self._lock:
+            if self.rate >= self.max_rate:
+                return
+            #変更前のレートで貯まったトークンを補充してからレートを上げる
+            self._refill(time.monotonic())
+            self.rate = min(self.max_rate, self.rate + self.max_rate * MIN_RATE_FACTOR)
+
+# -----------------------------------------------------------
+# asyncio用のトークンバケット方式のレートリミッター
+#   待機中はイベントループを止めず、他のコルーチンの送信を妨げない
+#   1つのイベントループの中だけで使う（補充・送信制限の計算はRateLimiterと同じ）
+# -----------------------------------------------------------
+class AsyncRateLimiter(RateLimiter):
+    async def acquire(self):
+        if self.max_rate is None:
+            wait = self._blocked_until - time.monotonic()
+            if wait <= 0:
+                return 0.0
+            await asyncio.sleep(wait)
+            return wait
+        waited = 0.0
+        while True:
+            now = time.monotonic()
+            self._refill(now)
+            wait = self._blocked_until - now
+            if wait <= 0:
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                wait = (1 - self._tokens) / self.rate
+            await asyncio.sleep(wait)
+            waited += wait
+
+# -----------------------------------------------------------
+# Retry-Afterヘッダから待機秒数を取得する
+#
+# Parameters:
+#  response（requests.Response）：APIの応答
+#
+# Returns:
+#  待機秒数（ヘッダがない、または解析できない場合はNone）
+# -----------------------------------------------------------
+def retry_after_seconds(response):
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+
+# -----------------------------------------------------------
+# 新規コネクションを開いた時に統計情報へ記録するプールクラスを作成する
+#
+# Parameters:
+#  base（class）：urllib3のコネクションプールクラス
+#  stats（ClientStats）：記録先の統計情報
+#
+# Returns:
+#  コネクションプールのサブクラス
+# -----------------------------------------------------------
+def _counting_pool(base, stats):
+    class CountingConnectionPool(base):
+        def _new_conn(self):
+            stats.count_connection(self.host)
+            return super()._new_conn()
+    return CountingConnectionPool
+
+# -----------------------------------------------------------
+# ホストごとにコネクションを再利用するアダプター
+# -----------------------------------------------------------
+class _PooledAdapter(HTTPAdapter):
+    def __init__(self, stats, pool_size):
+        #HTTPAdapter.__init__からinit_poolmanagerが呼ばれるため先に設定する
+        self._stats = stats
+        super().__init__(pool_connections=pool_size, pool_maxsize=pool_size, pool_block=True)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool(HTTPConnectionPool, self._stats),
+            'https': _counting_pool(HTTPSConnectionPool, self._stats),
+        }
+
+# -----------------------------------------------------------
+# QualityForward APIのクライアント
+#   keep-aliveのrequests.Sessionを共有し、コネクションを使い回す
+#   全てのリクエストはレートリミッターを通して送信する
+#   リクエストごとのステータスコード・レイテンシ・送受信バイト数などをmetricsに記録する
+#
+# Parameters:
+#  pool_size（int）：ホストごとに保持するコネクションの最大数
+#  verify（bool）：SSL証明書を検証するかどうか
+#  rate（float）：1秒あたりのリクエスト数（Noneの場合は制限しない）
+#  burst（int）：連続して送信できるリクエスト数
+#  max_retries（int）：429/503を受けた時の再送回数
+#  cache（HTTPCache）：GETの応答のキャッシュ（Noneの場合は使わない）
+# -----------------------------------------------------------
+class QFClient:
+    def __init__(self, pool_size=DEFAULT_POOL_SIZE, verify=True, rate=DEFAULT_RATE,
+                 burst=DEFAULT_BURST, max_retries=DEFAULT_MAX_RETRIES, cache=None):
+        self.stats = ClientStats()
+        self.metrics = qf_metrics.Metrics()
+        self.verify = verify
+        self.limiter = RateLimiter(rate, burst)
+        self.max_retries = max_retries
+        self.cache = cache
+        self.session = requests.Session()
+        self.session.headers['Accept-Encoding'] = ACCEPT_ENCODING
+        adapter = _PooledAdapter(self.stats, pool_size)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    # -----------------------------------------------------------
+    # APIにリクエストを送信する
+    #
+    # Parameters:
+    #  method（str）：HTTPメソッド
+    #  url（str）：APIのURL
+    #  kwargs：requestsに渡す引数
+    #
+    # Returns:
+    #  response（requests.Response）：APIの応答
+    # -----------------------------------------------------------
+    def request(self, method, url, **kwargs):
+        #ストリーミングの応答（CSVのダウンロードなど）はキャッシュしない
+        if self.cache is not None and method == 'GET' and not kwargs.get('stream') and http_cache.is_cacheable(url):
+            return self._cached_get(url, **kwargs)
+        response = self._send(method, url, **kwargs)
+        if self.cache is not None and method in WRITE_METHODS:
+            #自分で更新したリソースのキャッシュを破棄する
+            self.cache.invalidate(url)
+        return response
+
+    # -----------------------------------------------------------
+    # キャッシュを使ってGETを送信する
+    #   検証用のヘッダがある応答は条件付きGETで再検証し、ない応答はTTL以内であれば送信せずに返す
+    # -----------------------------------------------------------
+    def _cached_get(self, url, **kwargs):
+        host = urlsplit(url).hostname
+        key = http_cache.cache_key(url)
+        entry = self.cache.lookup(key)
+        if entry is not None and self.cache.is_fresh(entry):
+            self.stats.count_cache(host, 'hit')
+            self.metrics.count_cache_hit('GET', url)
+            return _cached_response(url, entry)
+
+        if entry is not None:
+            headers = dict(kwargs.pop('headers', None) or {})
+            headers.update(entry.validators())
+            kwargs['headers'] = headers
+        response = self._send('GET', url, **kwargs)
+        if response.status_code == 304 and entry is not None:
+            self.stats.count_cache(host, 'revalidated')
+            self.cache.touch(entry)
+            return _cached_response(url, entry)
+        if response.status_code == 200:
+            self.cache.store(key, response.headers, response.content)
+        return response
+
+    def _send(self, method, url, **kwargs):
+        kwargs.setdefault('verify', self.verify)
+        host = urlsplit(url).hostname
+        attempt = 0
+        while True:
+            self.metrics.add_throttled(self.limiter.acquire())
+            self.stats.count_request(host)
+            start = time.perf_counter()
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except RequestError:
+                self.metrics.observe(method, url, qf_metrics.STATUS_ERROR, time.perf_counter() - start)
+                raise
+            self.metrics.observe(method, url, response.status_code, time.perf_counter() - start,
+                                 _bytes_in(response, kwargs.get('stream')), _bytes_out(response))
+            if response.status_code not in RETRY_STATUS_CODES or attempt >= self.max_retries:
+                break
+            self.metrics.count_retry(method, url)
+            #送信制限を受けた場合は待機してから再送する
+            delay = retry_after_seconds(response)
+            if delay is None:
+                delay = DEFAULT_BACKOFF * (2 ** attempt)
+            response.close()
+            self.limiter.backoff(delay)
+            attempt += 1
+        if response.status_code not in RETRY_STATUS_CODES:
+            self.limiter.recover()
+        return response
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
+
+    def patch(self, url, **kwargs):
+        return self.request('PATCH', url, **kwargs)
+
+    def delete(self, url, **kwargs):
+        return self.request('DELETE', url, **kwargs)
+
+    def close(self):
+        self.session.close()
+        if self.cache is not None:
+            self.cache.close()
+
+# -----------------------------------------------------------
+# 受信したバイト数を取得する
+#   Content-Lengthがある場合はその値（圧縮された転送量）、ない場合は本文の長さ
+#   ストリーミングの応答は本文を読み込まないため、Content-Lengthがない場合は0とする
+# -----------------------------------------------------------
+def _bytes_in(response, stream):
+    length = response.headers.get('Content-Length')
+    if length is not None and length.isdigit():
+        return int(length)
+    if stream:
+        return 0
+    return len(response.content)
+
+def _bytes_out(response):
+    body = response.request.body if response.request is not None else None
+    if body is None:
+        return 0
+    if isinstance(body, str):
+        return len(body.encode('utf-8'))
+    if isinstance(body, bytes):
+        return len(body)
+    return 0
+
+# -----------------------------------------------------------
+# キャッシュした応答からrequests.Responseを作成する
+# -----------------------------------------------------------
+def _cached_response(url, entry):
+    response = requests.Response()
+    response.status_code = 200
+    response.reason = 'OK'
+    response.url = url
+    response.headers = CaseInsensitiveDict(entry.headers)
+    response._content = entry.body
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    return response
+
+#全ツールで共有するクライアント
+_client = None
+_client_lock = threading.Lock()
+
+# -----------------------------------------------------------
+# 共有クライアントを設定する
+#
+# Parameters:
+#  pool_size（int）：ホストごとに保持するコネクションの最大数
+#  verify（bool）：SSL証明書を検証するかどうか
+#  rate（float）：1秒あたりのリクエスト数（Noneの場合は制限しない）
+#  burst（int）：連続して送信できるリクエスト数
+#  max_retries（int）：429/503を受けた時の再送回数
+#  cache_path（str）：GETの応答をキャッシュするファイルのパス（Noneの場合はキャッシュしない）
+#  cache_ttl（float）：検証用のヘッダがないキャッシュを新鮮とみなす秒数
+#  cache_max_bytes（int）：キャッシュの最大サイズ
+#
+# Returns:
+#  _client（QFClient）：共有クライアント
+# -----------------------------------------------------------
+def configure(pool_size=DEFAULT_POOL_SIZE, verify=True, rate=DEFAULT_RATE,
+              burst=DEFAULT_BURST, max_retries=DEFAULT_MAX_RETRIES, cache_path=None,
+              cache_ttl=http_cache.DEFAULT_TTL, cache_max_bytes=http_cache.DEFAULT_MAX_BYTES):
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.close()
+        cache = None
+        if cache_path is not None:
+            cache = http_cache.HTTPCache(cache_path, ttl=cache_ttl, max_bytes=cache_max_bytes)
+        _client = QFClient(pool_size=pool_size, verify=verify, rate=rate,
+                           burst=burst, max_retries=max_retries, cache=cache)
+        return _client
+
+# -----------------------------------------------------------
+# 共有クライアントを取得する（未設定の場合は既定値で作成する）
+#
+# Returns:
+#  _client（QFClient）：共有クライアント
+# -----------------------------------------------------------
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = QFClient()
+        return _client
+
+def get(url, **kwargs):
+    return get_client().get(url, **kwargs)
+
+def post(url, **kwargs):
+    return get_client().post(url, **kwargs)
+
+def patch(url, **kwargs):
+    return get_client().patch(url, **kwargs)
+
+def delete(url, **kwargs):
+    return get_client().delete(url, **kwargs)
+
+# -----------------------------------------------------------
+# 送信したリクエスト数と新規に開いたコネクション数を表示する
+#
+# Parameters:
+#  client_stats（ClientStats）：表示する統計情報（Noneの場合は共有クライアント）
+# -----------------------------------------------------------
+def print_stats(client_stats=None):
+    if client_stats is None:
+        client_stats = get_client().stats
+    for host, stats in client_stats.snapshot().items():
+        line = ('通信統計[' + str(host) + ']: リクエスト数 ' + str(stats['requests'])
+                + '件、新規コネクション数 ' + str(stats['connections']) + '件')
+        if stats['cache']:
+            line += ('、キャッシュ使用 ' + str(stats['cache'].get('hit', 0))
+                     + '件、再検証 ' + str(stats['cache'].get('revalidated', 0)) + '件')
+        print(line)
+
+# -----------------------------------------------------------
+# リクエスト単位の計測結果（JSON・Prometheusのテキストファイル）を出力する
+#
+# Parameters:
+#  directory（str）：出力先のフォルダ（Noneの場合は出力しない）
+#  tool（str）：ツール名（ファイル名は<tool>.json・<tool>.prom）
+#  metrics（Metrics）：出力する計測結果（Noneの場合は共有クライアント）
+# -----------------------------------------------------------
+def export_metrics(directory, tool, metrics=None):
+    if directory is None:
+        return
+    if metrics is None:
+        metrics = get_client().metrics
+    try:
+        paths = metrics.export(directory, tool)
+    except OSError as e:
+        print('計測結果の出力に失敗しました。: ' + str(e))
+        return
+    print('計測結果を出力しました: ' + '、'.join(paths))
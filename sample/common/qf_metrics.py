@@ -0,0 +1,253 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import json
+import math
+import os
+import re
+import threading
+import time
+from urllib.parse import urlsplit
+
+#【定数】
+#Prometheusに出力するレイテンシのヒストグラムの境界（秒）
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+#集計するレイテンシのパーセンタイル
+QUANTILES = (0.5, 0.95, 0.99)
+#通信エラー（応答がない場合）のステータス
+STATUS_ERROR = 'error'
+#Prometheusのメトリクス名の接頭辞
+PREFIX = 'qf_'
+#パスのうちIDとみなす部分（数字のみ、または数字＋拡張子）
+_ID_SEGMENT = re.compile(r'^\d+(?=(\.\w+)?$)')
+
+# -----------------------------------------------------------
+# URLからエンドポイント名を作成する
+#   クエリ（api_keyなど）を除き、パスのIDを{id}に置き換える（123.csvは{id}.csv）
+#
+# Parameters:
+#  url（str）：APIのURL
+#
+# Returns:
+#  endpoint（str）：エンドポイント名（例：/api/v2/test_suites/{id}/test_suite_versions）
+# -----------------------------------------------------------
+def endpoint_name(url):
+    path = urlsplit(url).path.rstrip('/') or '/'
+    return '/'.join(_ID_SEGMENT.sub('{id}', x) for x in path.split('/'))
+
+# -----------------------------------------------------------
+# パーセンタイルを計算する（最近傍順位法）
+#
+# Parameters:
+#  values（array）：昇順に並べた値のリスト
+#  q（float）：0〜1
+#
+# Returns:
+#  値（リストが空の場合はNone）
+# -----------------------------------------------------------
+def quantile(values, q):
+    if not values:
+        return None
+    return values[max(0, math.ceil(q * len(values)) - 1)]
+
+# -----------------------------------------------------------
+# エンドポイントごとの集計
+# -----------------------------------------------------------
+class EndpointMetrics:
+    def __init__(self):
+        self.status = {}
+        self.latencies = []
+        self.bytes_in = 0
+        self.bytes_out = 0
+        self.retries = 0
+        self.cache_hits = 0
+
+    # -----------------------------------------------------------
+    # 集計結果を取得する
+    #
+    # Returns:
+    #  ret（dict）：件数・ステータスコード・レイテンシ（秒）・バイト数・再送数
+    # -----------------------------------------------------------
+    def summary(self):
+        latencies = sorted(self.latencies)
+        latency = {'p' + str(int(q * 100)): quantile(latencies, q) for q in QUANTILES}
+        latency['max'] = latencies[-1] if latencies else None
+        latency['mean'] = sum(latencies) / len(latencies) if latencies else None
+        return {
+            'requests': len(latencies),
+            'status': {str(k): v for k, v in sorted(self.status.items(), key=lambda x: str(x[0]))},
+            'latency_seconds': latency,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'retries': self.retries,
+            'cache_hits': self.cache_hits,
+        }
+
+    def buckets(self):
+        counts = []
+        for bound in LATENCY_BUCKETS:
+            counts.append(sum(1 for x in self.latencies if x <= bound))
+        return counts
+
+# -----------------------------------------------------------
+# リクエスト単位の計測結果
+#   メソッドとエンドポイントごとに件数・ステータスコード・レイテンシ・送受信バイト数・再送数を記録し、
+#   レートリミッターで待機した秒数（送信制限による待機を含む）を合計する
+#   レイテンシは全件を保持してパーセンタイルを正確に計算する
+#   （送信レートを制限しているため、1回の実行のリクエスト数は保持できる範囲に収まる）
+# -----------------------------------------------------------
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        self.throttled_seconds = 0.0
+        self.started_at = time.time()
+
+    def _get(self, method, url):
+        key = (method, endpoint_name(url))
+        if key not in self._endpoints:
+            self._endpoints[key] = EndpointMetrics()
+        return self._endpoints[key]
+
+    # -----------------------------------------------------------
+    # 1リクエスト分の結果を記録する
+    #
+    # Parameters:
+    #  method（str）：HTTPメソッド
+    #  url（str）：APIのURL
+    #  status（int）：ステータスコード（応答がない場合はSTATUS_ERROR）
+    #  elapsed（float）：送信から応答を受け取るまでの秒数
+    #  bytes_in（int）：受信したバイト数
+    #  bytes_out（int）：送信したバイト数（本文）
+    # -----------------------------------------------------------
+    def observe(self, method, url, status, elapsed, bytes_in=0, bytes_out=0):
+        with self._lock:
+            endpoint = self._get(method, url)
+            endpoint.status[status] = endpoint.status.get(status, 0) + 1
+            endpoint.latencies.append(elapsed)
+            endpoint.bytes_in += bytes_in
+            endpoint.bytes_out += bytes_out
+
+    def count_retry(self, method, url):
+        with self._lock:
+            self._get(method, url).retries += 1
+
+    def count_cache_hit(self, method, url):
+        with self._lock:
+            self._get(method, url).cache_hits += 1
+
+    def add_throttled(self, seconds):
+        if seconds <= 0:
+            return
+        with self._lock:
+            self.throttled_seconds += seconds
+
+    # -----------------------------------------------------------
+    # 集計結果を取得する
+    #
+    # Parameters:
+    #  tool（str）：ツール名
+    #
+    # Returns:
+    #  ret（dict）：実行全体とエンドポイントごとの集計結果
+    # -----------------------------------------------------------
+    def summary(self, tool):
+        with self._lock:
+            endpoints = []
+            total = EndpointMetrics()
+            for (method, endpoint), metrics in sorted(self._endpoints.items()):
+                endpoints.append(dict({'method': method, 'endpoint': endpoint}, **metrics.summary()))
+                for status, count in metrics.status.items():
+                    total.status[status] = total.status.get(status, 0) + count
+                total.latencies.extend(metrics.latencies)
+                total.bytes_in += metrics.bytes_in
+                total.bytes_out += metrics.bytes_out
+                total.retries += metrics.retries
+                total.cache_hits += metrics.cache_hits
+            return {
+                'tool': tool,
+                'started_at': self.started_at,
+                'duration_seconds': time.time() - self.started_at,
+                'throttled_seconds': self.throttled_seconds,
+                'total': total.summary(),
+                'endpoints': endpoints,
+            }
+
+    # -----------------------------------------------------------
+    # Prometheusのテキスト形式（node_exporterのtextfile collector）に変換する
+    #
+    # Parameters:
+    #  tool（str）：ツール名（全てのメトリクスのtoolラベル）
+    #
+    # Returns:
+    #  text（str）：メトリクス
+    # -----------------------------------------------------------
+    def to_prometheus(self, tool):
+        with self._lock:
+            items = sorted(self._endpoints.items())
+            lines = []
+
+            def metric(name, kind, help_text):
+                lines.append('# HELP ' + PREFIX + name + ' ' + help_text)
+                lines.append('# TYPE ' + PREFIX + name + ' ' + kind)
+
+            def sample(name, labels, value):
+                text = ','.join(k + '="' + _escape(str(v)) + '"' for k, v in [('tool', tool)] + labels)
+                lines.append(PREFIX + name + '{' + text + '} ' + _format_value(value))
+
+            metric('requests_total', 'counter', 'Requests sent to the QualityForward API.')
+            for (method, endpoint), metrics in items:
+                for status, count in sorted(metrics.status.items(), key=lambda x: str(x[0])):
+                    sample('requests_total', [('method', method), ('endpoint', endpoint), ('status', status)], count)
+            metric('request_duration_seconds', 'histogram', 'Latency of requests to the QualityForward API.')
+            for (method, endpoint), metrics in items:
+                labels = [('method', method), ('endpoint', endpoint)]
+                for bound, count in zip(LATENCY_BUCKETS, metrics.buckets()):
+                    sample('request_duration_seconds_bucket', labels + [('le', _format_value(bound))], count)
+                sample('request_duration_seconds_bucket', labels + [('le', '+Inf')], len(metrics.latencies))
+                sample('request_duration_seconds_sum', labels, sum(metrics.latencies))
+                sample('request_duration_seconds_count', labels, len(metrics.latencies))
+            for name, attr, help_text in (('response_bytes_total', 'bytes_in', 'Bytes received from the QualityForward API.'),
+                                          ('request_bytes_total', 'bytes_out', 'Request body bytes sent to the QualityForward API.'),
+                                          ('retries_total', 'retries', 'Requests retried after 429/503.'),
+                                          ('cache_hits_total', 'cache_hits', 'GET requests answered from the local cache.')):
+                metric(name, 'counter', help_text)
+                for (method, endpoint), metrics in items:
+                    sample(name, [('method', method), ('endpoint', endpoint)], getattr(metrics, attr))
+            metric('throttled_seconds_total', 'counter', 'Seconds spent waiting for the rate limiter.')
+            sample('throttled_seconds_total', [], self.throttled_seconds)
+            metric('run_duration_seconds', 'gauge', 'Duration of the last run.')
+            sample('run_duration_seconds', [], time.time() - self.started_at)
+            metric('run_timestamp_seconds', 'gauge', 'Start time of the last run.')
+            sample('run_timestamp_seconds', [], self.started_at)
+            return '\n'.join(lines) + '\n'
+
+    # -----------------------------------------------------------
+    # JSONの集計結果とPrometheusのテキストファイルを出力する
+    #   書き込み中のファイルを読まれないように、一時ファイルに書いてから置き換える
+    #
+    # Parameters:
+    #  directory（str）：出力先のフォルダ
+    #  tool（str）：ツール名（ファイル名は<tool>.json・<tool>.prom）
+    #
+    # Returns:
+    #  paths（array）：出力したファイルのパス
+    # -----------------------------------------------------------
+    def export(self, directory, tool):
+        os.makedirs(directory, exist_ok=True)
+        paths = []
+        for ext, text in (('.json', json.dumps(self.summary(tool), ensure_ascii=False, indent=2)),
+                          ('.prom', self.to_prometheus(tool))):
+            path = os.path.join(directory, tool + ext)
+            with open(path + '.tmp', 'w', encoding='utf-8', newline='\n') as f:
+                f.write(text)
+            os.replace(path + '.tmp', path)
+            paths.append(path)
+        return paths
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _format_value(value):
+    if isinstance(value, float):
+        return repr(value)
+    return str(value)
@@ -0,0 +1,331 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+import qf_pages
+
+#【定数】
+DEFAULT_PATH = 'qf_mirror.sqlite3'
+#ミラーを最新とみなす秒数（過ぎた場合は各ツールはAPIから取得する）
+DEFAULT_MAX_AGE = 3600
+DEFAULT_WORKERS = 4
+#同期する一覧（最上位）
+ROOT_KINDS = ('test_suites', 'test_phases')
+#各要素の下位の一覧（URLは「一覧のパス/要素のID/下位の一覧」）
+CHILD_KINDS = {
+    'test_suites': 'test_suite_versions',
+    'test_suite_versions': 'test_cases',
+    'test_phases': 'test_suite_assignments',
+    'test_suite_assignments': 'test_cycles',
+    'test_cycles': 'test_results',
+}
+#ビューの上位のIDの列名
+PARENT_COLUMNS = {
+    'test_suites': None,
+    'test_suite_versions': 'test_suite_id',
+    'test_cases': 'test_suite_version_id',
+    'test_phases': None,
+    'test_suite_assignments': 'test_phase_id',
+    'test_cycles': 'test_suite_assignment_id',
+    'test_results': 'test_cycle_id',
+}
+
+def _digest(value):
+    return hashlib.sha1(json.dumps(value, ensure_ascii=False, sort_keys=True).encode('utf-8')).hexdigest()
+
+# 同期した接続先とAPIキーを表す値（APIキーはハッシュ値だけを保存する）
+def mirror_scope(api_url, api_key):
+    api_url = api_url if api_url.endswith('/') else api_url + '/'
+    return hashlib.sha256(json.dumps([api_url, api_key], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+# -----------------------------------------------------------
+# プロジェクトのテストデータのローカルミラー（SQLite）
+#   一覧APIの各要素をentities、取得した一覧をlistsに保存する
+#   要素の種類ごとのビュー（test_cases・test_cyclesなど）でレポート用のクエリを実行できる
+#
+# Parameters:
+#  path（str）：ミラーファイルのパス
+# -----------------------------------------------------------
+class Mirror:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        #同期は複数のスレッドから記録する
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS entities ('
+                           'kind TEXT NOT NULL, id INTEGER NOT NULL, parent_id INTEGER, list_path TEXT NOT NULL, '
+                           'position INTEGER NOT NULL, updated_at TEXT, digest TEXT NOT NULL, body TEXT NOT NULL, '
+                           'PRIMARY KEY (kind, id))')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS entities_list ON entities (list_path, position)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS lists ('
+                           'path TEXT PRIMARY KEY, kind TEXT NOT NULL, parent_id INTEGER, digest TEXT NOT NULL, '
+                           'watermark TEXT, synced_at REAL NOT NULL)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)')
+        for kind, parent in PARENT_COLUMNS.items():
+            parent_column = 'parent_id AS ' + parent + ', ' if parent is not None else ''
+            self._conn.execute('CREATE VIEW IF NOT EXISTS ' + kind + ' AS SELECT id, ' + parent_column
+                               + 'updated_at, body FROM entities WHERE kind = \'' + kind + '\'')
+
+    # -----------------------------------------------------------
+    # 最後に全体の同期が完了した時刻（完了したことがない場合はNone）
+    # -----------------------------------------------------------
+    def synced_at(self):
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM meta WHERE key = \'synced_at\'').fetchone()
+        return None if row is None else float(row[0])
+
+    def is_fresh(self, max_age):
+        synced_at = self.synced_at()
+        return synced_at is not None and time.time() - synced_at < max_age
+
+    # -----------------------------------------------------------
+    # 同期した接続先とAPIキー（mirror_scope）。同期したことがない場合はNone
+    # -----------------------------------------------------------
+    def scope(self):
+        with self._lock:
+            row = self._conn.execute('SELECT value FROM meta WHERE key = \'scope\'').fetchone()
+        return None if row is None else row[0]
+
+    # -----------------------------------------------------------
+    # 別の接続先・APIキーで同期したミラーの場合は、全ての要素を削除して接続先を記録し直す
+    # -----------------------------------------------------------
+    def bind_scope(self, scope):
+        if self.scope() == scope:
+            return
+        with self._lock:
+            self._conn.execute('DELETE FROM entities')
+            self._conn.execute('DELETE FROM lists')
+            self._conn.execute('DELETE FROM meta')
+            self._conn.execute('INSERT INTO meta VALUES (\'scope\', ?)', (scope,))
+
+    # -----------------------------------------------------------
+    # 一覧の要素をAPIの応答と同じ順番で取得する
+    #
+    # Parameters:
+    #  kind（str）：要素の種類（例：test_cases）
+    #  parent_id（int）：上位の要素のID（最上位の一覧の場合はNone）
+    #
+    # Returns:
+    #  ret（array）：要素のリスト（同期していない一覧の場合はNone）
+    # -----------------------------------------------------------
+    def list(self, kind, parent_id=None):
+        with self._lock:
+            if parent_id is None:
+                row = self._conn.execute('SELECT path FROM lists WHERE kind = ? AND parent_id IS NULL', (kind,)).fetchone()
+            else:
+                row = self._conn.execute('SELECT path FROM lists WHERE kind = ? AND parent_id = ?', (kind, parent_id)).fetchone()
+            if row is None:
+                return None
+            rows = self._conn.execute('SELECT body FROM entities WHERE list_path = ? ORDER BY position', (row[0],)).fetchall()
+        return [json.loads(x[0]) for x in rows]
+
+    def find(self, kind, entity_id):
+        with self._lock:
+            row = self._conn.execute('SELECT body FROM entities WHERE kind = ? AND id = ?', (kind, entity_id)).fetchone()
+        return None if row is None else json.loads(row[0])
+
+    def list_digest(self, path):
+        with self._lock:
+            row = self._conn.execute('SELECT digest FROM lists WHERE path = ?', (path,)).fetchone()
+        return None if row is None else row[0]
+
+    # -----------------------------------------------------------
+    # 一覧に保存済みの要素のupdated_atと、下位の一覧を同期済みかどうかを取得する
+    #
+    # Returns:
+    #  ret（dict）：要素のID → (updated_at, 下位の一覧を同期済みならTrue)
+    # -----------------------------------------------------------
+    def list_state(self, path):
+        with self._lock:
+            rows = self._conn.execute('SELECT e.id, e.updated_at, l.path IS NOT NULL FROM entities e '
+                                      'LEFT JOIN lists l ON l.path = e.list_path || \'/\' || e.id || \'/\' || ? '
+                                      'WHERE e.list_path = ?', (CHILD_KINDS.get(self._kind_of(path), ''), path)).fetchall()
+        return {x[0]: (x[1], bool(x[2])) for x in rows}
+
+    # -----------------------------------------------------------
+    # 取得した一覧を保存する
+    #   内容（digest）が変わった要素だけを書き込み、一覧からなくなった要素は下位の一覧と共に削除する
+    #   updated_atが変わった要素は下位の一覧の同期済みの記録を消す（下位の同期が完了するまで最新とみなさない）
+    #
+    # Parameters:
+    #  path（str）：一覧のパス（例：test_suites/1/test_suite_versions）
+    #  kind（str）：要素の種類
+    #  parent_id（int）：上位の要素のID
+    #  items（array）：一覧の要素
+    #  digest（str）：一覧全体のハッシュ
+    #
+    # Returns:
+    #  written（int）：書き込んだ要素数
+    #  deleted（int）：削除した要素数
+    # -----------------------------------------------------------
+    def save_list(self, path, kind, parent_id, items, digest):
+        child = CHILD_KINDS.get(kind)
+        watermark = max((x['updated_at'] for x in items if x.get('updated_at') is not None), default=None)
+        with self._lock:
+            stored = {x[0]: (x[1], x[2]) for x in
+                      self._conn.execute('SELECT id, updated_at, digest FROM entities WHERE list_path = ?', (path,))}
+            self._conn.execute('BEGIN')
+            written = 0
+            for position, item in enumerate(items):
+                item_digest = _digest(item)
+                previous = stored.pop(item['id'], None)
+                if previous is not None and previous[1] == item_digest:
+                    continue
+                if child is not None and (previous is None or previous[0] != item.get('updated_at') or previous[0] is None):
+                    self._conn.execute('DELETE FROM lists WHERE path = ?', (path + '/' + str(item['id']) + '/' + child,))
+                self._conn.execute('INSERT OR REPLACE INTO entities VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                                   (kind, item['id'], parent_id, path, position, item.get('updated_at'), item_digest,
+                                    json.dumps(item, ensure_ascii=False)))
+                written += 1
+            for entity_id in stored:
+                self._delete_tree(path + '/' + str(entity_id))
+                self._conn.execute('DELETE FROM entities WHERE kind = ? AND id = ?', (kind, entity_id))
+            self._conn.execute('INSERT OR REPLACE INTO lists VALUES (?, ?, ?, ?, ?, ?)',
+                               (path, kind, parent_id, digest, watermark, time.time()))
+            self._conn.execute('COMMIT')
+        return written, len(stored)
+
+    # -----------------------------------------------------------
+    # 一覧の内容が変わっていない場合は同期した時刻だけを更新する
+    # -----------------------------------------------------------
+    def touch_list(self, path):
+        with self._lock:
+            self._conn.execute('UPDATE lists SET synced_at = ? WHERE path = ?', (time.time(), path))
+
+    def mark_synced(self):
+        with self._lock:
+            self._conn.execute('INSERT OR REPLACE INTO meta VALUES (\'synced_at\', ?)', (str(time.time()),))
+
+    def close(self):
+        self._conn.close()
+
+    def _delete_tree(self, prefix):
+        pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '/%'
+        self._conn.execute('DELETE FROM entities WHERE list_path LIKE ? ESCAPE \'\\\'', (pattern,))
+        self._conn.execute('DELETE FROM lists WHERE path LIKE ? ESCAPE \'\\\'', (pattern,))
+
+    @staticmethod
+    def _kind_of(path):
+        return path.rsplit('/', 1)[-1]
+
+# -----------------------------------------------------------
+# 最新のミラーを開く
+#   別の接続先・APIキーで同期したミラーは使わない
+#   ミラーは同期した時点の内容のため、各ツールは読み取りだけに使い、送信の判断にはAPIの応答を使う
+#
+# Parameters:
+#  path（str）：ミラーファイルのパス（Noneまたは空の場合は使わない）
+#  api_url（str）：APIのURL（例：https://cloud.veriserve.co.jp/api/v2/）
+#  api_key（str）：APIキー
+#  max_age（float）：最後の同期からの秒数の上限
+#
+# Returns:
+#  mirror（Mirror）：ミラー（ない場合、古い場合、接続先が異なる場合はNone）
+# -----------------------------------------------------------
+def open_mirror(path, api_url, api_key, max_age=DEFAULT_MAX_AGE):
+    if not path or not os.path.exists(path):
+        return None
+    mirror = Mirror(path)
+    if mirror.scope() != mirror_scope(api_url, api_key) or not mirror.is_fresh(max_age):
+        mirror.close()
+        return None
+    return mirror
+
+# -----------------------------------------------------------
+# プロジェクトのテストデータをミラーに同期する
+#   テストスイート（バージョン・テストケース）とテストフェーズ（割り当て・テストサイクル・テスト結果）の一覧を
+#   上位から順に並列で取得する
+#   updated_atがある要素は、前回の同期から変わっていなければ下位の一覧を取得しない（ウォーターマーク）
+#   updated_atがない要素の下位の一覧は毎回取得し、一覧全体のハッシュが同じであれば書き込まない
+#
+# Parameters:
+#  mirror（Mirror）：ミラー
+#  api_url（str）：APIのURL（例：https://cloud.veriserve.co.jp/api/v2/）
+#  api_key（str）：APIキー
+#  workers（int）：並列で一覧を取得する数
+#  page_workers（int）：一覧の2ページ目以降を並列で取得する数
+#  full（bool）：Trueの場合はupdated_atに関係なく全ての一覧を取得する
+# -----------------------------------------------------------
+class MirrorSync:
+    def __init__(self, mirror, api_url, api_key, workers=DEFAULT_WORKERS, page_workers=1, full=False):
+        self.mirror = mirror
+        self.api_url = api_url
+        self.api_key = api_key
+        self.workers = workers
+        self.page_workers = page_workers
+        self.full = full
+        self.stats = {'fetched': 0, 'unchanged': 0, 'skipped': 0, 'written': 0, 'deleted': 0}
+        self.failures = []
+        self._stats_lock = threading.Lock()
+
+    # -----------------------------------------------------------
+    # 同期する（全ての一覧を取得できた場合だけ同期の完了時刻を記録する）
+    #   別の接続先・APIキーで同期したミラーは、全ての要素を削除してから同期する
+    #
+    # Returns:
+    #  failures（array）：取得に失敗した一覧のパス
+    # -----------------------------------------------------------
+    def run(self):
+        self.mirror.bind_scope(mirror_scope(self.api_url, self.api_key))
+        with ThreadPoolExecutor(max_workers=max(1, self.workers)) as executor:
+            pending = {executor.submit(self._sync_list, kind, kind, None) for kind in ROOT_KINDS}
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    for path, kind, parent_id in future.result():
+                        pending.add(executor.submit(self._sync_list, path, kind, parent_id))
+        if len(self.failures) == 0:
+            self.mirror.mark_synced()
+        return self.failures
+
+    def _count(self, **counts):
+        with self._stats_lock:
+            for key, value in counts.items():
+                self.stats[key] += value
+
+    # -----------------------------------------------------------
+    # 一覧を取得して保存し、取得が必要な下位の一覧を返す
+    #
+    # Returns:
+    #  children（array）：(パス, 種類, 上位の要素のID)のリスト
+    # -----------------------------------------------------------
+    def _sync_list(self, path, kind, parent_id):
+        try:
+            items = qf_pages.get_pages(self.api_url + path + '?api_key=' + self.api_key, kind, self.page_workers)
+        except Exception:
+            items = None
+        if items is None:
+            with self._stats_lock:
+                self.failures.append(path)
+            return []
+
+        previous = self.mirror.list_state(path)
+        digest = _digest(items)
+        if digest == self.mirror.list_digest(path):
+            self.mirror.touch_list(path)
+            self._count(fetched=1, unchanged=1)
+        else:
+            written, deleted = self.mirror.save_list(path, kind, parent_id, items, digest)
+            self._count(fetched=1, written=written, deleted=deleted)
+
+        child = CHILD_KINDS.get(kind)
+        if child is None:
+            return []
+        children = []
+        for item in items:
+            updated_at, child_synced = previous.get(item['id'], (None, False))
+            #updated_atが前回と同じで、下位の一覧も同期済みの場合は取得しない
+            if (not self.full and child_synced and item.get('updated_at') is not None
+                    and item.get('updated_at') == updated_at):
+                self._count(skipped=1)
+                continue
+            children.append((path + '/' + str(item['id']) + '/' + child, child, item['id']))
+        return children
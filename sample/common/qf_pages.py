@@ -0,0 +1,156 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import json
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import qf_client
+
+#【定数】
+#2ページ目以降を並列で取得する数（送信レートは共有クライアントのレートリミッターで制限される）
+DEFAULT_WORKERS = 4
+#ページ番号のクエリパラメータ
+PAGE_PARAM = 'page'
+
+# -----------------------------------------------------------
+# 一覧APIの全ページを取得する
+#   1ページ目のtotal_pagesから残りのページのURLを作成し、並列で取得してページ順に結合する
+#   ページ番号のURLを作成できない場合はnext_urlを順番にたどる
+#   結合した結果に重複・欠落がある場合（取得中に一覧が変わった場合など）はnext_urlをたどって取得し直す
+#
+# Parameters:
+#  url（str）：1ページ目のURL
+#  content_name（str）：コンテンツのキー名
+#  workers（int）：並列で取得する数（1の場合はnext_urlを順番にたどる）
+#  content（dict）：取得済みの1ページ目の応答（省略時は取得する）
+#
+# Returns:
+#  ret（array）：APIから応答された結果のリスト（取得に失敗した場合はNone）
+# -----------------------------------------------------------
+def get_pages(url, content_name, workers=DEFAULT_WORKERS, content=None):
+    if content is None:
+        content = get_page(url)
+    if content is None:
+        return None
+    if not has_next(content):
+        return content[content_name]
+
+    page_urls = None
+    if workers > 1:
+        page_urls = build_page_urls(url, content)
+    if page_urls is None:
+        return follow_next_urls(content, content_name)
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(page_urls))) as executor:
+        pages = list(executor.map(get_page, page_urls))
+    if any(page is None for page in pages):
+        return None
+
+    ret = list(content[content_name])
+    for page in pages:
+        ret.extend(page[content_name])
+    if not is_complete(ret, [content] + pages):
+        print('ページの取得中に一覧が変更されました。順番に取得し直します。')
+        return follow_next_urls(get_page(url), content_name)
+    return ret
+
+# -----------------------------------------------------------
+# 1ページ分を取得する
+#
+# Parameters:
+#  url（str）：ページのURL
+#
+# Returns:
+#  content（dict）：応答のJSON（ステータスが200以外の場合はNone）
+# -----------------------------------------------------------
+def get_page(url):
+    response = qf_client.get(url)
+    if response.status_code != 200:
+        return None
+    return json.loads(response.content)
+
+def has_next(content):
+    return content.get('next_url') is not None and content.get('total_pages', 0) != 0
+
+# -----------------------------------------------------------
+# next_urlを順番にたどって残りのページを取得する
+#
+# Parameters:
+#  content（dict）：1ページ目の応答
+#  content_name（str）：コンテンツのキー名
+#
+# Returns:
+#  ret（array）：全ページの結果のリスト（取得に失敗した場合はNone）
+# -----------------------------------------------------------
+def follow_next_urls(content, content_name):
+    if content is None:
+        return None
+    ret = list(content[content_name])
+    while has_next(content):
+        content = get_page(content['next_url'])
+        if content is None:
+            return None
+        ret.extend(content[content_name])
+    return ret
+
+# -----------------------------------------------------------
+# 2ページ目以降のURLを作成する
+#   next_urlが1ページ目のURLのページ番号だけを変えたものである場合に限り、
+#   next_urlのページ番号を置き換えて作成する
+#
+# Parameters:
+#  url（str）：1ページ目のURL
+#  content（dict）：1ページ目の応答
+#
+# Returns:
+#  page_urls（array）：2ページ目からtotal_pagesまでのURL（作成できない場合はNone）
+# -----------------------------------------------------------
+def build_page_urls(url, content):
+    total_pages = content.get('total_pages')
+    if not isinstance(total_pages, int) or total_pages < 2:
+        return None
+    first = urlsplit(url)
+    next_split = urlsplit(content['next_url'])
+    first_query = dict(parse_qsl(first.query, keep_blank_values=True))
+    next_query = parse_qsl(next_split.query, keep_blank_values=True)
+    next_params = dict(next_query)
+    current_page = int(first_query.get(PAGE_PARAM, content.get('current_page', 1)))
+    if next_split.path.rstrip('/') != first.path.rstrip('/') or next_params.get(PAGE_PARAM) != str(current_page + 1):
+        return None
+    first_query.pop(PAGE_PARAM, None)
+    next_params.pop(PAGE_PARAM)
+    if first_query != next_params:
+        return None
+
+    page_urls = []
+    for page in range(current_page + 1, total_pages + 1):
+        query = [(k, str(page) if k == PAGE_PARAM else v) for k, v in next_query]
+        page_urls.append(urlunsplit(next_split._replace(query=urlencode(query))))
+    return page_urls
+
+# -----------------------------------------------------------
+# 結合した結果に重複・欠落がないかを確認する
+#   各ページのcurrent_page・total_pages・total_countが揃っていること、
+#   件数がtotal_countと一致すること、idに重複がないことを確認する
+#
+# Parameters:
+#  records（array）：結合した結果のリスト
+#  pages（array）：各ページの応答のリスト（ページ順）
+#
+# Returns:
+#  True（bool）：重複・欠落がない場合
+# -----------------------------------------------------------
+def is_complete(records, pages):
+    first_page = pages[0].get('current_page', 1)
+    for offset, page in enumerate(pages):
+        if page.get('total_pages') != pages[0].get('total_pages') or page.get('total_count') != pages[0].get('total_count'):
+            return False
+        if 'current_page' in page and page['current_page'] != first_page + offset:
+            return False
+    total_count = pages[0].get('total_count')
+    if first_page == 1 and total_count is not None and total_count != len(records):
+        return False
+    if all(isinstance(record, dict) and 'id' in record for record in records):
+        if len(set(record['id'] for record in records)) != len(records):
+            return False
+    return True
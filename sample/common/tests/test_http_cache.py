@@ -0,0 +1,102 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import os
+import sys
+
+import pytest
+import requests
+
+#commonのモジュールを読み込む
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import http_cache
+import qf_client
+
+BASE_URL = 'https://cloud.veriserve.co.jp/api/v2/'
+
+def url(path, api_key='key-a', **params):
+    query = '&'.join(k + '=' + str(v) for k, v in params.items())
+    return BASE_URL + path + '?api_key=' + api_key + ('&' + query if query else '')
+
+def response(status_code, body=b'{}'):
+    res = requests.Response()
+    res.status_code = status_code
+    res._content = body
+    return res
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = http_cache.HTTPCache(str(tmp_path / 'qf_cache.sqlite3'))
+    yield cache
+    cache.close()
+
+# 更新したURLの上位（一覧）と下位のキャッシュだけを破棄する
+def test_invalidate_ancestors_and_descendants(cache):
+    related = ['test_suites', 'test_suites/1', 'test_suites/1/test_suite_versions', 'test_suites/1/test_suite_versions/2']
+    unrelated = ['test_suites/10', 'test_suites/10/test_suite_versions', 'test_phases', 'test_suites_x']
+    for path in related + unrelated:
+        cache.store(http_cache.cache_key(url(path)), {}, path.encode('utf-8'))
+    assert cache.invalidate(url('test_suites/1')) == len(related)
+    for path in related:
+        assert cache.lookup(http_cache.cache_key(url(path))) is None
+    for path in unrelated:
+        assert cache.lookup(http_cache.cache_key(url(path))).body == path.encode('utf-8')
+
+# ページごとのキャッシュ（クエリパラメータが異なる）も破棄する
+def test_invalidate_all_pages(cache):
+    for page in range(1, 4):
+        cache.store(http_cache.cache_key(url('test_suites', page=page)), {}, b'[]')
+    assert cache.invalidate(url('test_suites/1/test_suite_versions')) == 3
+
+# POST/PATCH/DELETEを送信すると、QFClientが関係するキャッシュを破棄する
+@pytest.mark.parametrize('method', qf_client.WRITE_METHODS)
+def test_write_invalidates_cache(cache, monkeypatch, method):
+    client = qf_client.QFClient(rate=None, cache=cache)
+    sent = []
+
+    def send(sent_method, sent_url, **kwargs):
+        sent.append(sent_method)
+        return response(200, ('{"n": ' + str(len(sent)) + '}').encode('utf-8'))
+    monkeypatch.setattr(client, '_send', send)
+    try:
+        assert client.get(url('test_suites')).json() == {'n': 1}
+        assert client.get(url('test_suites')).json() == {'n': 1}
+        client.request(method, url('test_suites/1'))
+        assert client.get(url('test_suites')).json() == {'n': 3}
+        assert sent == ['GET', method, 'GET']
+    finally:
+        client.session.close()
+
+# 書き込みに失敗した場合も、サーバ側が変わった可能性があるため破棄する
+def test_failed_write_invalidates_cache(cache, monkeypatch):
+    client = qf_client.QFClient(rate=None, cache=cache)
+    monkeypatch.setattr(client, '_send', lambda m, u, **kwargs: response(422 if m == 'PATCH' else 200))
+    try:
+        client.get(url('test_suites'))
+        client.patch(url('test_suites/1'))
+        assert cache.lookup(http_cache.cache_key(url('test_suites'))) is None
+    finally:
+        client.session.close()
+
+# APIキーはキーに含めず、ハッシュで区別する
+def test_cache_key_scoped_by_credential():
+    key_a = http_cache.cache_key(url('test_suites', page=2))
+    key_b = http_cache.cache_key(url('test_suites', api_key='key-b', page=2))
+    assert key_a != key_b
+    assert 'key-a' not in key_a and 'key-b' not in key_b
+    assert key_a == http_cache.cache_key(url('test_suites/', page=2))
+    assert http_cache.CREDENTIAL_PARAM + '=' not in http_cache.cache_key(BASE_URL + 'test_suites?page=2')
+
+# 別のAPIキーで保存した応答は使わない
+def test_cache_lookup_scoped_by_credential(cache):
+    cache.store(http_cache.cache_key(url('test_suites')), {}, b'a')
+    assert cache.lookup(http_cache.cache_key(url('test_suites', api_key='key-b'))) is None
+    assert cache.lookup(http_cache.cache_key(url('test_suites'))).body == b'a'
+
+# 書き込みは全てのAPIキーのキャッシュを破棄する（別のキーの一覧にも反映されるため）
+def test_invalidate_ignores_credential(cache):
+    cache.store(http_cache.cache_key(url('test_suites', api_key='key-b')), {}, b'b')
+    assert cache.invalidate(url('test_suites/1')) == 1
+
+def test_uncached_paths():
+    assert not http_cache.is_cacheable(url('current_project'))
+    assert http_cache.is_cacheable(url('test_suites'))
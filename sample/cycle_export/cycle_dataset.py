@@ -0,0 +1,305 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import os
+import re
+import threading
+from contextlib import contextmanager
+
+#【定数】
+DATASET_FORMATS = ('parquet', 'arrow')
+EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+#パーティションのフォルダ名（Hive形式：test_suite_assignment_id=123）
+#  値はフォルダ名だけに持ち、ファイルには列として書き込まない（読み込み時に型が重ならないようにする）
+PARTITION_KEY = 'test_suite_assignment_id'
+#各行の先頭に追加する列（テストフェーズ・テストサイクル）
+KEY_COLUMNS = (('test_phase_id', 'int64'), ('test_phase_name', 'string'),
+               ('test_cycle_id', 'int64'), ('test_cycle_name', 'string'))
+#1回に書き込む行数（Parquetの行グループ・Arrowのレコードバッチの大きさ）
+BATCH_ROWS = 10000
+_INTEGER = re.compile(r'^[+-]?\d{1,18}$')
+
+def import_pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet
+        import pyarrow.ipc
+    except ModuleNotFoundError as err:
+        raise Exception('「' + err.name + '」のモジュールが見つかりません。>> pip install pyarrow')
+    return pa
+
+# -----------------------------------------------------------
+# データセットを読み込む時のパーティションの指定（test_suite_assignment_idをint64で読む）
+#   partitioning='hive'でも読めるが、その場合の型はpyarrowの推定（int32）になる
+#
+# Returns:
+#  partitioning（pyarrow.dataset.Partitioning）：ds.datasetのpartitioningに指定する
+# -----------------------------------------------------------
+def partitioning():
+    pa = import_pyarrow()
+    import pyarrow.dataset as ds
+    return ds.partitioning(pa.schema([(PARTITION_KEY, pa.int64())]), flavor='hive')
+
+# 列名の重複を避ける
+def unique_names(header):
+    names = []
+    for i, name in enumerate(header):
+        names.append(name if name not in names else name + '_' + str(i))
+    return names
+
+# -----------------------------------------------------------
+# 列の型を推定する（空欄を除いた全ての値が整数ならint64、数値ならfloat64、それ以外はstring）
+#
+# Parameters:
+#  values（array）：CSVの値のリスト
+#
+# Returns:
+#  type（str）：型名（空欄しかなく推定できない場合はNone）
+# -----------------------------------------------------------
+def infer_type(values):
+    values = [x for x in values if x != '']
+    if len(values) == 0:
+        return None
+    if all(_INTEGER.match(x) for x in values):
+        return 'int64'
+    try:
+        for x in values:
+            float(x)
+    except ValueError:
+        return 'string'
+    return 'float64'
+
+# 2つの型の両方を表せる型（整数と小数はfloat64、それ以外の組み合わせはstring）
+def widen_type(a, b):
+    if a is None or a == b:
+        return b
+    if b is None:
+        return a
+    if {a, b} == {'int64', 'float64'}:
+        return 'float64'
+    return 'string'
+
+# 列の値を型に変換する（変換できない値がある場合はNone）
+def convert_column(values, type_name):
+    if type_name == 'string':
+        return values
+    if type_name is None:
+        return [None] * len(values) if all(x == '' for x in values) else None
+    if type_name == 'int64' and not all(_INTEGER.match(x) for x in values if x != ''):
+        return None
+    convert = int if type_name == 'int64' else float
+    try:
+        return [convert(x) if x != '' else None for x in values]
+    except ValueError:
+        return None
+
+# -----------------------------------------------------------
+# プロジェクト全体のテストサイクルのCSVを1つのデータセットに出力する
+#   テストスイート割り当てごとにパーティション（フォルダ）を分け、テストサイクルごとに1ファイルを書き込む
+#   列の型はデータセット全体で列名ごとに1つとし、既存のファイルのスキーマと書き込む行から推定する
+#   型が合わない値（別のテストサイクルの小数・文字列や、後の行の「N/A」など）があれば、
+#   その列をfloat64・stringに広げて書き込み、finishで古い型のファイルを書き直す
+#   arrowはArrow IPCのファイル形式（非圧縮）のため、メモリマップで読み込める
+#
+# Parameters:
+#  root（str）：データセットのフォルダ
+#  output_format（str）：parquet・arrow
+#  infer_types（bool）：Falseの場合は全ての列を文字列として出力する
+# -----------------------------------------------------------
+class CycleDataset:
+    def __init__(self, root, output_format, infer_types=True):
+        self.root = root
+        self.output_format = output_format
+        self.infer_types = infer_types
+        self._pa = import_pyarrow()
+        self._lock = threading.Lock()
+        #列名 → 型名（Noneは空欄しかなく未定）。最初の書き込みで既存のファイルから読み込む
+        self._types = None
+
+    def output_path(self, assignment_id, cycle):
+        return os.path.join(self.root, PARTITION_KEY + '=' + str(assignment_id),
+                            'part-' + str(cycle['id']) + EXTENSIONS[self.output_format])
+
+    # -----------------------------------------------------------
+    # テストサイクルのCSVの行をデータセットに書き込む
+    #   書き込み中のファイルを読まれないように、隠しファイルに書いてから置き換える
+    #
+    # Parameters:
+    #  rows（iterator）：CSVの行（1行目は見出し）
+    #  output_path（str）：output_pathで作成した出力先
+    #  keys（dict）：KEY_COLUMNSの列名 → 値
+    # -----------------------------------------------------------
+    def write(self, rows, output_path, keys):
+        directory = os.path.dirname(output_path)
+        os.makedirs(directory, exist_ok=True)
+        names = unique_names(next(rows, []))
+        batch = _read_batch(rows)
+        schema = self._get_schema(names, batch)
+
+        tmp_path = os.path.join(directory, '.' + os.path.basename(output_path) + '.tmp')
+        try:
+            while batch is not None:
+                schema, batch = self._write_batches(tmp_path, schema, keys, batch, rows)
+            os.replace(tmp_path, output_path)
+        finally:
+            for path in (tmp_path, tmp_path + '.old'):
+                if os.path.exists(path):
+                    os.remove(path)
+
+    # -----------------------------------------------------------
+    # 全てのファイルを、列名ごとに1つにした型で書き直す（型を広げた列があるファイルのみ）
+    #   書き込みが終わった後に呼ぶ。中断した場合も次回の実行で書き直す
+    #
+    # Returns:
+    #  count（int）：書き直したファイル数
+    # -----------------------------------------------------------
+    def finish(self):
+        count = 0
+        with self._lock:
+            types = self._load_types()
+            for path, schema in self._read_schemas():
+                target = self._schema(list(KEY_COLUMNS) + [(x.name, types.get(x.name)) for x in list(schema)[len(KEY_COLUMNS):]])
+                if schema.equals(target):
+                    continue
+                tmp_path = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.tmp')
+                try:
+                    with self._open_writer(tmp_path, target) as write_table:
+                        for table in self._read_tables(path):
+                            write_table(table.cast(target))
+                    os.replace(tmp_path, path)
+                finally:
+                    if os.path.exists(tmp_path):
+                        os.remove(tmp_path)
+                count += 1
+        return count
+
+    # -----------------------------------------------------------
+    # 書き込むファイルのスキーマを取得する（データセットの型と行から推定した型を合わせる）
+    #
+    # Returns:
+    #  schema（pyarrow.Schema）：スキーマ
+    # -----------------------------------------------------------
+    def _get_schema(self, names, batch):
+        with self._lock:
+            types = self._load_types()
+            for i, name in enumerate(names):
+                type_name = infer_type(_column(batch, i)) if self.infer_types else 'string'
+                types[name] = widen_type(types.get(name), type_name)
+            return self._schema(list(KEY_COLUMNS) + [(name, types[name]) for name in names])
+
+    # 変換できない値があった列の型を広げる
+    def _widen_schema(self, schema, failed, batch):
+        with self._lock:
+            types = self._load_types()
+            for i, name in failed:
+                types[name] = widen_type(types.get(name), infer_type(_column(batch, i)))
+                print('データセットの列「' + name + '」の型を' + types[name] + 'に変更します。')
+            return self._schema(list(KEY_COLUMNS) + [(x.name, types[x.name]) for x in list(schema)[len(KEY_COLUMNS):]])
+
+    def _load_types(self):
+        if self._types is None:
+            self._types = {}
+            for _, schema in self._read_schemas():
+                for field in list(schema)[len(KEY_COLUMNS):]:
+                    self._types[field.name] = widen_type(self._types.get(field.name), _type_name(self._pa, field.type))
+        return self._types
+
+    def _read_schemas(self):
+        pa = self._pa
+        if not os.path.isdir(self.root):
+            return
+        for directory, _, files in os.walk(self.root):
+            for name in sorted(files):
+                if name.startswith('.') or not name.endswith(EXTENSIONS[self.output_format]):
+                    continue
+                path = os.path.join(directory, name)
+                if self.output_format == 'parquet':
+                    yield path, pa.parquet.read_schema(path)
+                else:
+                    with pa.memory_map(path) as source:
+                        yield path, pa.ipc.open_file(source).schema
+
+    def _read_tables(self, path):
+        pa = self._pa
+        if self.output_format == 'parquet':
+            parquet_file = pa.parquet.ParquetFile(path)
+            for i in range(parquet_file.num_row_groups):
+                yield parquet_file.read_row_group(i)
+            return
+        with pa.memory_map(path) as source:
+            reader = pa.ipc.open_file(source)
+            for i in range(reader.num_record_batches):
+                yield pa.Table.from_batches([reader.get_batch(i)])
+
+    def _schema(self, fields):
+        pa = self._pa
+        return pa.schema([(name, pa.null() if type_name is None else getattr(pa, type_name)()) for name, type_name in fields])
+
+    # -----------------------------------------------------------
+    # 行をファイルに書き込む
+    #   既にファイルがある場合（型を広げて書き直す場合）は、書き込み済みの行をスキーマに合わせて先に書き込む
+    #
+    # Returns:
+    #  schema（pyarrow.Schema）：書き込んだスキーマ
+    #  batch（list）：変換できない値があったバッチ（全て書き込んだ場合はNone）
+    # -----------------------------------------------------------
+    def _write_batches(self, path, schema, keys, batch, rows):
+        previous = None
+        if os.path.exists(path):
+            previous = path + '.old'
+            os.replace(path, previous)
+        with self._open_writer(path, schema) as write_table:
+            if previous is not None:
+                for table in self._read_tables(previous):
+                    write_table(table.cast(schema))
+            while True:
+                table, failed = self._to_table(schema, keys, batch)
+                if len(failed) > 0:
+                    return self._widen_schema(schema, failed, batch), batch
+                write_table(table)
+                batch = _read_batch(rows)
+                if len(batch) == 0:
+                    return schema, None
+
+    def _to_table(self, schema, keys, batch):
+        pa = self._pa
+        arrays = [pa.array([keys[name]] * len(batch), schema.field(name).type) for name, _ in KEY_COLUMNS]
+        failed = []
+        for i, field in enumerate(list(schema)[len(KEY_COLUMNS):]):
+            values = convert_column(_column(batch, i), _type_name(pa, field.type))
+            if values is None:
+                failed.append((i, field.name))
+                continue
+            arrays.append(pa.array(values, field.type))
+        if len(failed) > 0:
+            return None, failed
+        return pa.Table.from_arrays(arrays, schema=schema), failed
+
+    @contextmanager
+    def _open_writer(self, path, schema):
+        pa = self._pa
+        if self.output_format == 'parquet':
+            with pa.parquet.ParquetWriter(path, schema) as writer:
+                yield lambda table: writer.write_table(table, row_group_size=BATCH_ROWS)
+        else:
+            with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, schema) as writer:
+                yield lambda table: writer.write_table(table, max_chunksize=BATCH_ROWS)
+
+def _read_batch(rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_ROWS:
+            break
+    return batch
+
+def _type_name(pa, data_type):
+    if pa.types.is_null(data_type):
+        return None
+    if pa.types.is_integer(data_type):
+        return 'int64'
+    if pa.types.is_floating(data_type):
+        return 'float64'
+    return 'string'
+
+def _column(batch, i):
+    return [row[i] if i < len(row) else '' for row in batch]
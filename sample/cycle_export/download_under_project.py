@@ -3,21 +3,37 @@
 
 import os
 import io
+import codecs
 import csv
 import re
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from functools import partial
 
 import json
 import requests
-from urllib.request import urlretrieve
-from urllib.error import URLError,HTTPError
-import pandas as pd
-from pyexcelerate import Workbook
+from openpyxl import Workbook
 
-import time
+#共通モジュール（sample/common）を読み込む
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import qf_client
+import qf_pages
+import cycle_dataset
 
 #【定数】
 BASE_API_URL = 'https://cloud.veriserve.co.jp/'
-SLEEP_TIME = 1.0
+DEFAULT_WORKERS = 4
+#一覧の2ページ目以降を並列で取得する数（エクスポートの並列数と掛け合わせた数のリクエストが同時に送信される）
+DEFAULT_PAGE_WORKERS = 1
+DEFAULT_MANIFEST = 'export_manifest.json'
+DEFAULT_METRICS_DIR = 'metrics'
+OUTPUT_FORMATS = ('xlsx', 'csv', 'parquet')
+#応答を読み込む1回あたりのバイト数
+CHUNK_SIZE = 64 * 1024
+#Parquetに書き込む1回あたりの行数
+PARQUET_BATCH_ROWS = cycle_dataset.BATCH_ROWS
 
 
 def strip_quotes(src):
@@ -27,98 +43,241 @@ def strip_quotes(src):
     return ret
 
 def get_request_pages(mid_url, content_name, response_key = None):
-    ret = None
     url = BASE_API_URL + 'api/v2/' + mid_url + '?api_key=' + _api_key
-    while True:
-        response = requests.get(url)
-        time.sleep(SLEEP_TIME)
-        if response.status_code != 200:
-            return None
-        content = json.loads(response.content)
-        if response_key is None:
-            if ret is None:
-                ret = content[content_name]
-            else:
-                ret.extend(content[content_name])
-        else:
-            if ret is None:
-                ret = []
-            ret.extend(content[response_key])
-        if 'next_url' not in content or content['next_url'] is None or content['total_pages'] == 0:
-            break
-        url = content['next_url']
-    return ret
-
+    #2ページ目以降は並列で取得する
+    return qf_pages.get_pages(url, content_name if response_key is None else response_key, _page_workers)
 
-def download_csv(target_url,file_name):
+# CSVを一時ファイルに保存せず、応答を読みながら1行ずつ返す
+@contextmanager
+def download_csv(target_url):
     url = target_url + '?api_key=' + _api_key
 
-    file_path = ensure_no_kinsoku_chars(file_name + '.csv')
     try:
-        ret = urlretrieve(url,"{0}".format(file_path))
-        time.sleep(SLEEP_TIME)  #【スリープ】
-    except HTTPError as e:
-        print('The server couldn\'t fulfill the request. Error code: ', e.code)
-        exit()
-    except URLError as e:
-        print('We failed to reach a server. Reason: ', e.reason)
-        exit()
-    else:
-        with io.open(ret[0],'r',encoding='utf_8_sig') as f:
-            reader = csv.reader(f)
-            download_data = [row for row in reader]
-            f.close()
-            os.remove(ret[0])
-        return download_data
-
-def save_vals(merged_data,output_path):
-    df = pd.DataFrame(merged_data)
-    wb = Workbook()
-    wb.new_sheet("Sheet1", data=df.values.tolist())
+        response = qf_client.get(url, stream=True)
+        response.raise_for_status()
+    except requests.HTTPError as e:
+        raise Exception('The server couldn\'t fulfill the request. Error code: ' + str(e.response.status_code))
+    except requests.ConnectionError as e:
+        raise Exception('We failed to reach a server. Reason: ' + str(e))
+    try:
+        yield csv.reader(iter_text_lines(response))
+    finally:
+        response.close()
+
+# 応答をutf_8_sigで少しずつデコードし、改行を残したまま1行ずつ返す
+def iter_text_lines(response):
+    decoder = codecs.getincrementaldecoder('utf_8_sig')()
+    pending = ''
+    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+        text = pending + decoder.decode(chunk)
+        #最後の改行までを返し、残りは次のチャンクとつなげる
+        end = text.rfind('\n') + 1
+        pending = text[end:]
+        if end > 0:
+            yield from io.StringIO(text[:end], newline='')
+    pending += decoder.decode(b'', final=True)
+    if pending != '':
+        yield from io.StringIO(pending, newline='')
+
+def save_xlsx(rows, output_path):
+    #書き込み専用モードで1行ずつシートに書き込む
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet("Sheet1")
+    for row in rows:
+        ws.append(row)
     wb.save(output_path)
 
+def save_csv(rows, output_path):
+    with io.open(output_path, 'w', encoding='utf_8_sig', newline='') as f:
+        csv.writer(f).writerows(rows)
+
+def save_parquet(rows, output_path):
+    pa = cycle_dataset.import_pyarrow()
+    pq = pa.parquet
+
+    names = cycle_dataset.unique_names(next(rows, []))
+    schema = pa.schema([(name, pa.string()) for name in names])
+
+    with pq.ParquetWriter(output_path, schema) as writer:
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= PARQUET_BATCH_ROWS:
+                writer.write_table(_rows_to_table(pa, batch, schema))
+                batch = []
+        if len(batch) > 0 or len(names) == 0:
+            writer.write_table(_rows_to_table(pa, batch, schema))
+
+def _rows_to_table(pa, batch, schema):
+    columns = [[row[i] if i < len(row) else None for row in batch] for i in range(len(schema))]
+    return pa.Table.from_arrays([pa.array(c, pa.string()) for c in columns], schema=schema)
+
+SAVERS = {'xlsx': save_xlsx, 'csv': save_csv, 'parquet': save_parquet}
+
 # 禁則文字を_に置き換える
 def ensure_no_kinsoku_chars(filepath):
     return re.sub(r'[\\|/|:|?|"|<|>|\| |]', '_', filepath)
 
-def download_under_project(test_phases):
+# エクスポート済みのテストサイクル（updated_atと出力先）を記録する
+class ExportManifest:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = {}
+        if os.path.exists(path):
+            with io.open(path, 'r', encoding='utf-8') as f:
+                self._entries = json.load(f)
+
+    # 前回から変更のないテストサイクルかどうか
+    def is_exported(self, cycle, output_path):
+        entry = self._entries.get(str(cycle['id']))
+        return (entry is not None
+                and entry['updated_at'] == cycle.get('updated_at')
+                and entry['output_path'] == output_path
+                and os.path.exists(output_path))
+
+    def mark_exported(self, cycle, output_path):
+        with self._lock:
+            self._entries[str(cycle['id'])] = {'updated_at': cycle.get('updated_at'), 'output_path': output_path}
+            # 中断しても記録が壊れないように一時ファイルから置き換える
+            tmp_path = self.path + '.tmp'
+            with io.open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False, indent=1)
+            os.replace(tmp_path, self.path)
+
+def export_cycle(mid_url, cycle, output_path, manifest, save):
+    target_url = BASE_API_URL + 'api/v2/' + mid_url + '/' + str(cycle['id']) + '.csv'
+    with download_csv(target_url) as rows:
+        save(rows, output_path)
+    manifest.mark_exported(cycle, output_path)
+
+# データセットの各行に追加するテストフェーズ・テストスイート割り当て・テストサイクルの列
+def dataset_keys(phase, tsa, cycle):
+    return {'test_phase_id': phase['id'], 'test_phase_name': phase['name'], 'test_suite_assignment_id': tsa['id'],
+            'test_cycle_id': cycle['id'], 'test_cycle_name': cycle['name']}
+
+# datasetを指定した場合は、テストサイクルごとのファイルではなくプロジェクト全体のデータセットに出力する
+def download_under_project(test_phases, workers=DEFAULT_WORKERS, manifest_path=DEFAULT_MANIFEST, output_format='xlsx', dataset=None):
     current_path = os.getcwd()
-    for phase in test_phases:
-        #フォルダ名は「テストフェーズ名」とする
-        output_dir = current_path + '/' + ensure_no_kinsoku_chars(phase['name'])+ '/'
-        os.makedirs(os.path.dirname(output_dir), exist_ok=True)    # Ensure exist dir
-    
-        for tsa in phase['test_suite_assignments']:
-            mid_url = 'test_phases/' + str(phase['id']) + '/test_suite_assignments/' + str(tsa['id']) + '/test_cycles'
-            test_cycles = get_request_pages(mid_url, 'test_cycles')
+    manifest = ExportManifest(manifest_path)
+    failures = []
+    skipped = 0
+    #出力先 → テストサイクル番号（同じファイルに複数のテストサイクルを書き込まないようにする）
+    claimed = {}
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        #テストサイクルの一覧をテスト割り当てごとに並列で取得する
+        cycle_lists = {}
+        for phase in test_phases:
+            #フォルダ名は「テストフェーズ名」とする
+            output_dir = current_path + '/' + ensure_no_kinsoku_chars(phase['name'])+ '/'
+            if dataset is None:
+                os.makedirs(os.path.dirname(output_dir), exist_ok=True)    # Ensure exist dir
+
+            for tsa in phase['test_suite_assignments']:
+                mid_url = 'test_phases/' + str(phase['id']) + '/test_suite_assignments/' + str(tsa['id']) + '/test_cycles'
+                cycle_lists[executor.submit(get_request_pages, mid_url, 'test_cycles')] = (mid_url, output_dir, phase, tsa)
+
+        #テストサイクルのCSVを並列で取得して指定の形式で保存する
+        exports = {}
+        for future in as_completed(cycle_lists):
+            mid_url, output_dir, phase, tsa = cycle_lists[future]
+            try:
+                test_cycles = future.result()
+            except Exception:
+                test_cycles = None
             if test_cycles is None:
-                print('"test_cycles"の取得に失敗しました。')
-                exit()
+                print('"test_cycles"の取得に失敗しました。: ' + mid_url)
+                failures.append(mid_url)
+                continue
             for cycle in test_cycles:
-                target_url = BASE_API_URL + 'api/v2/' + mid_url + '/' + str(cycle['id']) + '.csv'
-                download_data = download_csv(target_url,str(cycle['id']))
-                if download_data is None:
-                    print(target_url[2] + "のCSVデータ取得に失敗しました。")
-                    exit()
-                #出力ファイル名は「テストサイクル名」とする
-                output_path = output_dir + ensure_no_kinsoku_chars(cycle['name']) +'.xlsx' 
+                if dataset is None:
+                    #出力ファイル名は「テストサイクル名_テストサイクル番号」とする（別の割り当ての同名のテストサイクルと区別する）
+                    output_path = output_dir + ensure_no_kinsoku_chars(cycle['name']) + '_' + str(cycle['id']) + '.' + output_format
+                    save = SAVERS[output_format]
+                else:
+                    output_path = dataset.output_path(tsa['id'], cycle)
+                    save = partial(dataset.write, keys=dataset_keys(phase, tsa, cycle))
+                #大文字・小文字を区別しないファイルシステムでも重ならないようにする
+                claim_key = output_path.lower()
+                if claimed.setdefault(claim_key, cycle['id']) != cycle['id']:
+                    print(output_path + 'は別のテストサイクル（' + str(claimed[claim_key]) + '）の出力先のため、出力しません。')
+                    failures.append(output_path)
+                    continue
+                #前回から変更のないテストサイクルはスキップする
+                if manifest.is_exported(cycle, output_path):
+                    skipped += 1
+                    continue
+                exports[executor.submit(export_cycle, mid_url, cycle, output_path, manifest, save)] = output_path
+
+        for future in as_completed(exports):
+            output_path = exports[future]
+            try:
+                future.result()
                 print("output_path: ",output_path,)
-                save_vals(download_data,output_path)
+            except Exception as e:
+                print(output_path + "のCSVデータ取得に失敗しました。: " + str(e))
+                failures.append(output_path)
+
+    #型を広げた列がある場合は、古い型で書き込んだファイルを書き直す
+    if dataset is not None:
+        try:
+            rewritten = dataset.finish()
+            if rewritten > 0:
+                print('列の型を合わせるために書き直したファイル: ' + str(rewritten) + '件')
+        except Exception as e:
+            print(dataset.root + 'の列の型を合わせられませんでした。: ' + str(e))
+            failures.append(dataset.root)
+
+    print('スキップしたテストサイクル（変更なし）: ' + str(skipped) + '件')
+    return failures
 
 if __name__ == '__main__':
     # コマンドラインオプション処理
     import argparse
     ap = argparse.ArgumentParser(description='プロジェクト下の全テストフェーズの設定画面のURLを取得する。')
     ap.add_argument("-a", "--api_key", action='store', help="APIキー", required=True)
+    ap.add_argument("-p", "--pool_size", action='store', type=int, default=qf_client.DEFAULT_POOL_SIZE, help="ホストごとに保持するコネクションの最大数")
+    ap.add_argument("-r", "--rate", action='store', type=float, default=qf_client.DEFAULT_RATE, help="1秒あたりのリクエスト数")
+    ap.add_argument("-b", "--burst", action='store', type=int, default=qf_client.DEFAULT_BURST, help="連続して送信できるリクエスト数")
+    ap.add_argument("-w", "--workers", action='store', type=int, default=DEFAULT_WORKERS, help="並列でエクスポートする数")
+    ap.add_argument("--page_workers", action='store', type=int, default=DEFAULT_PAGE_WORKERS, help="一覧の2ページ目以降を並列で取得する数")
+    ap.add_argument("-m", "--manifest", action='store', default=DEFAULT_MANIFEST, help="エクスポート済みのテストサイクルを記録するファイル")
+    ap.add_argument("-f", "--format", action='store', choices=OUTPUT_FORMATS, default='xlsx', help="出力形式")
+    ap.add_argument("-d", "--dataset", action='store', help="プロジェクト全体を1つのデータセットとして出力するフォルダ")
+    ap.add_argument("--dataset_format", action='store', choices=cycle_dataset.DATASET_FORMATS, default='parquet', help="データセットの形式")
+    ap.add_argument("--no_infer_types", action='store_true', help="データセットの全ての列を文字列として出力する")
+    ap.add_argument("-u", "--base_url", action='store', default=BASE_API_URL, help="QualityForwardのURL")
+    ap.add_argument("--metrics_dir", action='store', default=DEFAULT_METRICS_DIR, help="計測結果（JSON・Prometheusのテキストファイル）の出力先")
     args = ap.parse_args()
     _api_key = strip_quotes(args.api_key)
+    _page_workers = args.page_workers
+    BASE_API_URL = args.base_url if args.base_url.endswith('/') else args.base_url + '/'
+
+    #APIのクライアントを設定する
+    qf_client.configure(pool_size=args.pool_size, rate=args.rate, burst=args.burst)
 
     test_phases = get_request_pages('test_phases', 'test_phases')
     if test_phases is None:
         print('APIキーが間違っています。')
         exit()
 
+    dataset = None
+    if args.dataset is not None:
+        try:
+            dataset = cycle_dataset.CycleDataset(args.dataset, args.dataset_format, not args.no_infer_types)
+        except Exception as e:
+            print(str(e))
+            exit()
+
     # メイン処理
-    download_under_project(test_phases)
+    failures = download_under_project(test_phases, args.workers, args.manifest, args.format, dataset)
 
+    qf_client.print_stats()
+    qf_client.export_metrics(args.metrics_dir, 'download_under_project')
+    if len(failures) > 0:
+        print('以下のエクスポートに失敗しました。再実行すると失敗した分のみ取得します。')
+        for x in failures:
+            print('  ▪ ' + x)
+        sys.exit(1)
     print('Done')
\ No newline at end of file
@@ -0,0 +1,112 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import asyncio
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+from mock_qf_server import MockQFServer, USER_ID
+
+#post_automated_test_resultsのモジュールを読み込む
+POST_RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'post_automated_test_results')
+sys.path.insert(0, POST_RESULTS_DIR)
+from modules import api, async_api
+
+# -----------------------------------------------------------
+# モックサーバ向けのconfig.iniを作成する
+#
+# Parameters:
+#  file_path（str）：作成するファイルのパス
+#  server（MockQFServer）：モックサーバ
+#  assignment（dict）：テスト結果を投入するテストスイート割り当て
+#  args（Namespace）：コマンドライン引数
+#  case_index_path（str）：テストケースの索引のキャッシュのパス（空の場合は使わない）
+# -----------------------------------------------------------
+def write_config(file_path, server, assignment, args, case_index_path=''):
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write('[QF_API]\n')
+        f.write('base_url = ' + server.base_url + '\n')
+        f.write('api_key = ' + server.api_key + '\n')
+        f.write('user_id = ' + str(USER_ID) + '\n')
+        f.write('test_suites_id = ' + str(assignment['test_suite_id']) + '\n')
+        f.write('test_suites_version_id = ' + str(assignment['test_suite_version_id']) + '\n')
+        f.write('test_phase_id = ' + str(assignment['test_phase_id']) + '\n')
+        f.write('test_suite_assignment_id = ' + str(assignment['id']) + '\n')
+        f.write('pool_size = ' + str(args.workers) + '\n')
+        f.write('rate_limit = ' + str(args.rate) + '\n')
+        f.write('rate_burst = ' + str(args.burst) + '\n')
+        f.write('max_workers = ' + str(args.workers) + '\n')
+        f.write('match_field = category1\n')
+        f.write('metrics_dir = \n')
+        f.write('case_index_path = ' + case_index_path + '\n')
+
+def make_results(cases):
+    return [{'test_method_name': case['category1'], 'result': 'pass' if case['no'] % 5 else 'fail',
+             'file_path': 'tests/test_sample.py', 'time': '0.01', 'message': ''} for case in cases]
+
+# -----------------------------------------------------------
+# 同期版のAPIでテストサイクルを作成し、テスト結果を投入する
+#
+# Returns:
+#  elapsed（float）：経過秒数
+#  test_cycle_id（int）：作成したテストサイクルの番号
+# -----------------------------------------------------------
+def run_sync(config_path, results):
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        qf_api = api.API(config_path=config_path, config_section='QF_API')
+        test_cycle_id = qf_api.create_test_cycle()
+        qf_api.post_test_results(results=iter(results), test_cycle_id=test_cycle_id)
+    return time.perf_counter() - start, test_cycle_id
+
+# -----------------------------------------------------------
+# asyncio版のAPIでテストサイクルを作成し、テスト結果を投入する
+#
+# Returns:
+#  elapsed（float）：経過秒数
+#  test_cycle_id（int）：作成したテストサイクルの番号
+# -----------------------------------------------------------
+def run_async(config_path, results):
+    async def post():
+        async with async_api.AsyncAPI(config_path=config_path, config_section='QF_API') as qf_api:
+            test_cycle_id = await qf_api.create_test_cycle()
+            await qf_api.post_test_results(results=iter(results), test_cycle_id=test_cycle_id)
+            return test_cycle_id
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        test_cycle_id = asyncio.run(post())
+    return time.perf_counter() - start, test_cycle_id
+
+if __name__ == '__main__':
+    # コマンドラインオプション処理
+    import argparse
+    ap = argparse.ArgumentParser(description='テスト結果の投入を同期版（スレッド）とasyncio版で比較する。')
+    ap.add_argument("--results", action='store', type=int, default=2000, help="テスト結果の件数")
+    ap.add_argument("--workers", action='store', type=int, default=8, help="並列で送信する数")
+    ap.add_argument("--latency", action='store', type=float, default=0.02, help="モックサーバの応答遅延秒数")
+    ap.add_argument("--rate", action='store', type=float, default=1000.0, help="1秒あたりのリクエスト数")
+    ap.add_argument("--burst", action='store', type=int, default=10, help="連続して送信できるリクエスト数")
+    args = ap.parse_args()
+
+    server = MockQFServer(latency=args.latency).start()
+    server.store.seed(phases=1, assignments=1, cycles=0, cases=args.results)
+    assignment = next(iter(server.store.test_suite_assignments.values()))
+    results = make_results(server.store.test_cases[assignment['test_suite_version_id']])
+
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, 'config.ini')
+        write_config(config_path, server, assignment, args)
+        elapsed = {}
+        for label, func in (('sync', run_sync), ('async', run_async)):
+            elapsed[label], test_cycle_id = func(config_path, results)
+            created = len(server.store.test_results[test_cycle_id])
+            if created != len(results):
+                print('投入されたテスト結果の件数が一致しません: {} {} / {}'.format(label, created, len(results)))
+                sys.exit(1)
+            print('{:<6} workers={:<3} {:8.2f}s  {:8.1f} results/s'.format(label, args.workers, elapsed[label], created / elapsed[label]))
+    server.stop()
+    print('高速化: {:.2f}倍'.format(elapsed['sync'] / elapsed['async']))
@@ -0,0 +1,82 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import os
+import sys
+import tempfile
+import time
+
+from mock_qf_server import MockQFServer
+
+#testblocker_settingのモジュールを読み込む（ログは作業フォルダに出力する）
+TESTBLOCK_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'testblocker_setting')
+sys.path.insert(0, TESTBLOCK_DIR)
+
+# -----------------------------------------------------------
+# テストスイートとテストスイートバージョンを全て取得する（起動時のカタログ取得）
+#
+# Parameters:
+#  server（MockQFServer）：モックサーバ
+#
+# Returns:
+#  elapsed（float）：経過秒数
+#  requests（int）：サーバが受けたリクエスト数
+#  catalog（array）：(テストスイート, テストスイートバージョンのリスト) のリスト
+# -----------------------------------------------------------
+def fetch_catalog(server):
+    before = server.total_requests()
+    start = time.perf_counter()
+    catalog = []
+    for ts in TestBlock.get_request_pages('test_suites', 'test_suites'):
+        catalog.append((ts, TestBlock.get_request_pages('test_suites/' + str(ts['id']) + '/test_suite_versions', 'test_suite_versions')))
+    return time.perf_counter() - start, server.total_requests() - before, catalog
+
+if __name__ == '__main__':
+    # コマンドラインオプション処理
+    import argparse
+    ap = argparse.ArgumentParser(description='テストスイート一覧の取得をキャッシュなし・再検証・TTL以内（ETagなし）で比較する。')
+    ap.add_argument("--suites", action='store', type=int, default=500, help="テストスイート数")
+    ap.add_argument("--latency", action='store', type=float, default=0.02, help="モックサーバの応答遅延秒数")
+    ap.add_argument("--ttl", action='store', type=float, default=30.0, help="ETagがない応答を新鮮とみなす秒数（キャッシュなしの取得時間より長くする）")
+    ap.add_argument("--rate", action='store', type=float, default=1000.0, help="1秒あたりのリクエスト数")
+    args = ap.parse_args()
+
+    server = MockQFServer(latency=args.latency).start()
+    server.store.seed(phases=1, assignments=args.suites, cycles=0, cases=1)
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        import TestBlock
+        import qf_client
+        TestBlock.settings.BASE_API_URL = server.base_url
+        TestBlock.settings.API_KEY = server.api_key
+        cache_path = os.path.join(tmp, 'qf_cache.sqlite3')
+
+        results = []
+        qf_client.configure(rate=args.rate)
+        results.append(('no cache',) + fetch_catalog(server))
+        qf_client.configure(rate=args.rate, cache_path=cache_path, cache_ttl=args.ttl)
+        results.append(('cold',) + fetch_catalog(server))
+        #ETagがある応答は毎回再検証する（304）
+        results.append(('revalidate',) + fetch_catalog(server))
+
+        #更新したテストスイートの一覧とバージョンだけを取得し直す
+        suite_id = results[0][3][0][0]['id']
+        TestBlock.update_request('test_suites/' + str(suite_id), 'test_suite[test_blocker_column]=1',
+                                 {'content-type': 'application/x-www-form-urlencoded'})
+        results.append(('after patch',) + fetch_catalog(server))
+
+        #ETagがない応答はTTL以内であれば送信せずに使う
+        server.etag = False
+        qf_client.get_client().cache.clear()
+        results.append(('no etag cold',) + fetch_catalog(server))
+        results.append(('no etag ttl',) + fetch_catalog(server))
+        qf_client.print_stats()
+        qf_client.get_client().close()
+
+    server.stop()
+    expected = results[0][3]
+    for label, elapsed, requests, catalog in results:
+        if label not in ('after patch', 'no etag cold', 'no etag ttl') and catalog != expected:
+            print('取得結果が一致しません: ' + label)
+            sys.exit(1)
+        print('{:<12} {:8.2f}s  requests={:<6}'.format(label, elapsed, requests))
+    print('ステータスコード: ' + str(dict(sorted(server.status_counts.items()))))
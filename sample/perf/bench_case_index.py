@@ -0,0 +1,119 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+from mock_qf_server import MockQFServer
+from bench_async import write_config, POST_RESULTS_DIR
+
+sys.path.insert(0, os.path.join(POST_RESULTS_DIR, '..', 'common'))
+import qf_client
+from modules import api, async_api
+
+# -----------------------------------------------------------
+# 1ページ目だけを取得して索引を作成する（ページングに対応する前の動作）
+# -----------------------------------------------------------
+def load_first_page(qf_api):
+    res = qf_client.get(qf_api._test_cases_url())
+    return qf_api.build_test_case_index(json.loads(res.text)['test_cases'])
+
+def load_async(config_path):
+    async def load():
+        async with async_api.AsyncAPI(config_path=config_path, config_section='QF_API') as qf_api:
+            return await qf_api.load_test_case_index()
+    return asyncio.run(load())
+
+# -----------------------------------------------------------
+# 索引を作成し、経過秒数とリクエスト数を測定する
+#
+# Parameters:
+#  server（MockQFServer）：モックサーバ
+#  config_path（str）：config.iniのパス
+#  variant（str）：測定する方法
+#
+# Returns:
+#  elapsed（float）：経過秒数
+#  requests（int）：送信したリクエスト数
+#  index（dict）：テストメソッド名 → テストケース番号
+# -----------------------------------------------------------
+def measure(server, config_path, variant):
+    before = server.total_requests()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if variant == 'async':
+            index = load_async(config_path)
+        else:
+            qf_api = api.API(config_path=config_path, config_section='QF_API')
+            if variant == 'first_page':
+                index = load_first_page(qf_api)
+            else:
+                index = qf_api.load_test_case_index()
+    return time.perf_counter() - start, server.total_requests() - before, index
+
+# -----------------------------------------------------------
+# 最後のテストケースの名前を変更する（1ページ目は変わらない）
+#   利用可のバージョンはテストケースを変更できないため、編集中に戻してから変更する
+#
+# Parameters:
+#  version（dict）：モックサーバのテストスイートバージョン
+#  cases（array）：バージョンのテストケース
+#  status（str）：変更後のバージョンの状態
+# -----------------------------------------------------------
+def edit_last_case(version, cases, status):
+    version['status'] = status
+    version['updated_at'] = datetime.now().isoformat()
+    cases[-1]['category1'] += '_renamed'
+
+if __name__ == '__main__':
+    # コマンドラインオプション処理
+    import argparse
+    ap = argparse.ArgumentParser(description='テスト結果の対応付けに使うテストケースの索引の取得方法を比較する。')
+    ap.add_argument("--cases", action='store', type=int, default=2000, help="テストケース数")
+    ap.add_argument("--per_page", action='store', type=int, default=100, help="1ページあたりの件数")
+    ap.add_argument("--workers", action='store', type=int, default=8, help="並列で取得するページ数")
+    ap.add_argument("--latency", action='store', type=float, default=0.02, help="モックサーバの応答遅延秒数")
+    ap.add_argument("--rate", action='store', type=float, default=1000.0, help="1秒あたりのリクエスト数")
+    ap.add_argument("--burst", action='store', type=int, default=10, help="連続して送信できるリクエスト数")
+    args = ap.parse_args()
+
+    server = MockQFServer(latency=args.latency, per_page=args.per_page).start()
+    server.store.seed(phases=1, assignments=1, cycles=0, cases=args.cases)
+    assignment = next(iter(server.store.test_suite_assignments.values()))
+    version = server.store.test_suite_versions[assignment['test_suite_version_id']]
+    cases = server.store.test_cases[version['id']]
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        #順番に取得（workers=1）・並列に取得・並列に取得してキャッシュに保存
+        configs = {}
+        for name, workers, cache_path in (('sequential', 1, ''), ('parallel', args.workers, ''),
+                                          ('cached', args.workers, os.path.join(tmp, 'case_index.sqlite3'))):
+            configs[name] = os.path.join(tmp, name + '.ini')
+            write_config(configs[name], server, assignment, argparse.Namespace(**dict(vars(args), workers=workers)), cache_path)
+
+        #編集中・利用可に戻した後は、最後のページだけが変わっても保存した索引を使わないことを確認する
+        variants = [('1ページ目のみ', 'sequential', 'first_page', None),
+                    ('順番', 'sequential', 'pages', None),
+                    ('並列', 'parallel', 'pages', None),
+                    ('asyncio', 'parallel', 'async', None),
+                    ('キャッシュ初回', 'cached', 'pages', None),
+                    ('キャッシュ', 'cached', 'pages', None),
+                    ('編集中', 'cached', 'pages', 'editing'),
+                    ('利用可に戻す', 'cached', 'async', 'available'),
+                    ('キャッシュ', 'cached', 'async', None)]
+        for label, config, variant, status in variants:
+            if status is not None:
+                edit_last_case(version, cases, status)
+            elapsed, requests, index = measure(server, configs[config], variant)
+            ok = len(index) == len(cases) and all(index[case['category1']] == case['no'] for case in cases)
+            failed = failed or (not ok and variant != 'first_page')
+            print('{:<10} {:8.3f}s  {:5}リクエスト  {:6}/{}件  {}'.format(label, elapsed, requests, len(index), len(cases), 'OK' if ok else 'NG'))
+    server.stop()
+    sys.exit(1 if failed else 0)
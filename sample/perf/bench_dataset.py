@@ -0,0 +1,113 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from mock_qf_server import MockQFServer
+
+#【定数】
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'cycle_export', 'download_under_project.py')
+#出力方法（テストサイクルごとのxlsx・Parquetのデータセット・Arrowのデータセット）
+VARIANTS = {
+    'xlsx': ['-f', 'xlsx'],
+    'parquet': ['-d', 'dataset', '--dataset_format', 'parquet'],
+    'arrow': ['-d', 'dataset', '--dataset_format', 'arrow'],
+}
+#集計する結果（テストスイート割り当てごとのfailの件数）
+RESULT_COLUMN = '結果'
+FAIL = 'fail'
+
+# -----------------------------------------------------------
+# プロジェクト全体のfailの件数を集計する（子プロセスで実行し、経過秒数と最大RSSを測定する）
+#
+# Parameters:
+#  variant（str）：出力方法
+#  work_dir（str）：エクスポートした作業フォルダ
+#
+# Returns:
+#  ret（dict）：行数とfailの件数
+# -----------------------------------------------------------
+def analyze(variant, work_dir):
+    if variant == 'xlsx':
+        #テストサイクルごとのエクセルファイルを全て開き直す
+        from openpyxl import load_workbook
+        rows = fails = 0
+        for root, _, files in os.walk(work_dir):
+            for name in files:
+                if not name.endswith('.xlsx'):
+                    continue
+                wb = load_workbook(os.path.join(root, name), read_only=True)
+                it = wb.active.iter_rows(values_only=True)
+                col = next(it).index(RESULT_COLUMN)
+                for row in it:
+                    rows += 1
+                    fails += row[col] == FAIL
+                wb.close()
+        return {'rows': rows, 'fails': fails}
+
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+    from pyarrow import fs
+    #Arrowはメモリマップで読み込み、必要な列だけを参照する
+    dataset = ds.dataset(os.path.join(work_dir, 'dataset'), format='ipc' if variant == 'arrow' else 'parquet',
+                         partitioning='hive', filesystem=fs.LocalFileSystem(use_mmap=variant == 'arrow'))
+    table = dataset.to_table(columns=['test_suite_assignment_id', RESULT_COLUMN])
+    per_assignment = table.filter(pc.equal(table[RESULT_COLUMN], FAIL)).group_by('test_suite_assignment_id').aggregate([([], 'count_all')])
+    return {'rows': table.num_rows, 'fails': sum(per_assignment['count_all'].to_pylist())}
+
+def run(args, cwd):
+    start = time.perf_counter()
+    proc = subprocess.Popen(args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    _, status, usage = os.wait4(proc.pid, 0)
+    output = proc.stdout.read().decode('utf-8', 'replace')
+    proc.stdout.close()
+    if os.waitstatus_to_exitcode(status) != 0:
+        print(output[-2000:])
+        sys.exit(1)
+    return time.perf_counter() - start, usage.ru_maxrss / 1024, output
+
+def output_size(work_dir):
+    return sum(os.path.getsize(os.path.join(root, x)) for root, _, files in os.walk(work_dir)
+               for x in files if x.endswith(('.xlsx', '.parquet', '.arrow')))
+
+if __name__ == '__main__':
+    # コマンドラインオプション処理
+    import argparse
+    ap = argparse.ArgumentParser(description='テストサイクルごとのxlsxとプロジェクト全体のデータセット（Parquet・Arrow）のエクスポートと集計を比較する。')
+    ap.add_argument("--phases", action='store', type=int, default=2, help="テストフェーズ数")
+    ap.add_argument("--assignments", action='store', type=int, default=4, help="テストフェーズあたりのテストスイート割り当て数")
+    ap.add_argument("--cycles", action='store', type=int, default=5, help="テストスイート割り当てあたりのテストサイクル数")
+    ap.add_argument("--cases", action='store', type=int, default=2000, help="テストスイートあたりのテストケース数")
+    ap.add_argument("--latency", action='store', type=float, default=0.005, help="モックサーバの応答遅延秒数")
+    ap.add_argument("--workers", action='store', type=int, default=4, help="並列でエクスポートする数")
+    ap.add_argument("--variants", action='store', nargs='+', choices=list(VARIANTS), default=list(VARIANTS), help="出力方法")
+    ap.add_argument("--analyze", action='store', nargs=2, metavar=('VARIANT', 'DIR'), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.analyze:
+        print(json.dumps(analyze(*args.analyze)))
+        sys.exit(0)
+
+    server = MockQFServer(latency=args.latency).start()
+    server.store.seed(phases=args.phases, assignments=args.assignments, cycles=args.cycles, cases=args.cases)
+    expected = {'rows': args.phases * args.assignments * args.cycles * args.cases,
+                'fails': args.phases * args.assignments * args.cycles * (args.cases // 5)}
+
+    failed = False
+    print('{:<8} {:>10} {:>10} {:>10} {:>12} {:>10}'.format('format', 'export(s)', 'size(MB)', 'query(s)', 'query RSS(MB)', 'rows'))
+    for variant in args.variants:
+        with tempfile.TemporaryDirectory() as work_dir:
+            export_elapsed, _, _ = run([sys.executable, os.path.abspath(SCRIPT), '-a', server.api_key, '-u', server.origin + '/',
+                                        '-r', '1000', '-b', '10', '-w', str(args.workers)] + VARIANTS[variant], work_dir)
+            query_elapsed, query_rss, output = run([sys.executable, os.path.abspath(__file__), '--analyze', variant, work_dir], work_dir)
+            result = json.loads(output.splitlines()[-1])
+            ok = result == expected
+            failed = failed or not ok
+            print('{:<8} {:10.2f} {:10.1f} {:10.2f} {:12.1f} {:>10} {}'.format(
+                variant, export_elapsed, output_size(work_dir) / 1024 / 1024, query_elapsed, query_rss, result['rows'], 'OK' if ok else 'NG'))
+    server.stop()
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,210 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import datetime
+import locale
+import os
+import random
+import sys
+import time
+
+#suites_importのモジュールを読み込む
+SUITES_IMPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'suites_import')
+sys.path.insert(0, SUITES_IMPORT_DIR)
+import format
+
+#ベンチマークで使うデータタイプと表示形式
+CELL_FORMATS = [
+    ('n', 'General'),
+    ('n', '0.00'),
+    ('n', '0.000'),
+    ('n', '#,##0'),
+    ('n', '#,##0.00'),
+    ('n', '"￥"#,##0'),
+    ('n', '0.00%'),
+    ('n', '0.0%'),
+    ('n', '0.00E+00'),
+    ('n', '# ?/?'),
+    ('n', '# ??/??'),
+    ('n', '#\\ ?/4'),
+    ('n', '#\\ ??/16'),
+    ('d', 'yyyy/mm/dd'),
+    ('d', 'yyyy/m/d h:mm'),
+    ('d', 'yyyy"年"m"月"d"日"'),
+    ('d', '[$-409]h:mm AM/PM'),
+    ('s', 'General'),
+]
+
+# -----------------------------------------------------------
+# ベンチマーク用のセルを作成する
+#
+# Parameters:
+#  count（int）：セル数
+#  seed（int）：乱数のシード
+#
+# Returns:
+#  cells（array）：(値, データタイプ, 表示形式) のリスト
+# -----------------------------------------------------------
+def make_cells(count, seed=0):
+    rnd = random.Random(seed)
+    base = datetime.datetime(2020, 1, 1)
+    cells = []
+    for _ in range(count):
+        type, fmt = CELL_FORMATS[rnd.randrange(len(CELL_FORMATS))]
+        if type == 'n':
+            val = rnd.uniform(-1000, 100000) if rnd.random() < 0.8 else rnd.randrange(100000)
+        elif type == 'd':
+            val = base + datetime.timedelta(minutes=rnd.randrange(60 * 24 * 3650))
+        else:
+            val = 'テキスト' + str(rnd.randrange(1000))
+        cells.append((val, type, fmt))
+    return cells
+
+# -----------------------------------------------------------
+# 変更前の変換（セルごとに形式を解析し、ロケールを設定する）
+#
+# Parameters:
+#  val（object）：Excelから読み取る値
+#  type（str）：データタイプ
+#  fmt（str）：Excelから読み取る形式
+#
+# Returns:
+#  変換した値
+# -----------------------------------------------------------
+def legacy_format_value(val, type, fmt):
+    data = val
+    if type == format.TYPE_NUMERIC:
+        if fmt.find('#,#') > -1:
+            data = format.format_currency(val, fmt)
+        elif fmt.find('0%') > -1:
+            data = format.format_percent(val, fmt)
+        elif fmt.find('?/') > -1:
+            data = format.format_fraction(val, fmt)
+        elif fmt.find('E+0') > -1:
+            data = format.format_scientific(val, fmt)
+        elif fmt.find('0.0') > -1:
+            data = format.format_numberic(val, fmt)
+    elif type == format.TYPE_DATE:
+        #変更前はセルごとにロケールを設定していた
+        try:
+            locale.setlocale(locale.LC_CTYPE, "Japanese_Japan.932")
+        except locale.Error:
+            pass
+        data = val.strftime(format.build_datetime_pattern(fmt))
+    return str(data)
+
+# -----------------------------------------------------------
+# 全セルを変換して経過秒数を返す
+#
+# Parameters:
+#  func（function）：変換する関数
+#  cells（array）：(値, データタイプ, 表示形式) のリスト
+#
+# Returns:
+#  elapsed（float）：経過秒数
+#  results（array）：変換した値のリスト
+# -----------------------------------------------------------
+def run_format(func, cells):
+    start = time.perf_counter()
+    results = [func(val, type, fmt) for val, type, fmt in cells]
+    return time.perf_counter() - start, results
+
+# -----------------------------------------------------------
+# セルを同じデータタイプと形式の列に分け、列ごとに一括変換する
+#
+# Parameters:
+#  cells（array）：(値, データタイプ, 表示形式) のリスト
+#  column_size（int）：1列あたりのセル数
+#
+# Returns:
+#  elapsed（float）：経過秒数
+#  results（array）：変換した値のリスト（cellsと同じ順番）
+# -----------------------------------------------------------
+def run_format_column(cells, column_size):
+    columns = {}
+    for index, (val, type, fmt) in enumerate(cells):
+        columns.setdefault((type, fmt), []).append(index)
+
+    start = time.perf_counter()
+    results = [None] * len(cells)
+    for (type, fmt), indexes in columns.items():
+        for i in range(0, len(indexes), column_size):
+            chunk = indexes[i : i + column_size]
+            if type == 's':
+                values = [str(cells[j][0]) for j in chunk]
+            else:
+                values = format.format_column([cells[j][0] for j in chunk], type, fmt)
+            for j, val in zip(chunk, values):
+                results[j] = val
+    return time.perf_counter() - start, results
+
+# -----------------------------------------------------------
+# 一括変換と1セルずつの変換をランダムな値で比較する
+#   境界に近い値（丸め・負のゼロ・大きな整数）とExcelのシリアル値を含める
+#
+# Parameters:
+#  rounds（int）：比較する列の数
+#  seed（int）：乱数のシード
+#
+# Returns:
+#  mismatches（array）：一致しなかった (値, データタイプ, 表示形式, 一括, 1セルずつ) のリスト
+# -----------------------------------------------------------
+def check_format_column(rounds, seed=0):
+    rnd = random.Random(seed)
+    specials = [0, 0.0, -0.0, 0.5, -0.5, 1.005, 2.675, 999.995, 0.125, -1e-9, 1e15, 2 ** 53, 2 ** 53 + 1]
+    base = datetime.datetime(1900, 1, 1)
+    mismatches = []
+    for _ in range(rounds):
+        type, fmt = CELL_FORMATS[rnd.randrange(len(CELL_FORMATS))]
+        size = rnd.randrange(format.COLUMN_MIN_SIZE, 500)
+        if type == 'n':
+            values = [rnd.choice([rnd.uniform(-1e7, 1e7), rnd.randrange(-10 ** 9, 10 ** 9),
+                                  round(rnd.uniform(-1000, 1000), rnd.randrange(4)), rnd.choice(specials)])
+                      for _ in range(size)]
+            expected = [format.format_value(val, type, fmt) for val in values]
+        elif type == 'd':
+            if rnd.random() < 0.5:
+                values = [base + datetime.timedelta(seconds=rnd.randrange(86400 * 365 * 200), microseconds=rnd.randrange(10 ** 6))
+                          for _ in range(size)]
+                expected = [format.format_value(val, type, fmt) for val in values]
+            else:
+                #Excelのシリアル値はopenpyxlで日時に変換した結果と比較する
+                values = [rnd.choice([rnd.uniform(1, 80000), rnd.randrange(1, 70)]) for _ in range(size)]
+                expected = [format.format_value(format.from_excel(val), type, fmt) for val in values]
+        else:
+            continue
+        for val, a, b in zip(values, format.format_column(values, type, fmt), expected):
+            if a != b:
+                mismatches.append((val, type, fmt, a, b))
+    return mismatches
+
+if __name__ == '__main__':
+    # コマンドラインオプション処理
+    import argparse
+    ap = argparse.ArgumentParser(description='セルの変換（毎回解析・コンパイル済みレンダラー・列ごとの一括変換）を比較する。')
+    ap.add_argument("--cells", action='store', type=int, default=1000000, help="セル数")
+    ap.add_argument("--seed", action='store', type=int, default=0, help="乱数のシード")
+    ap.add_argument("--column_size", action='store', type=int, default=1000, help="一括変換する1列あたりのセル数")
+    ap.add_argument("--check_rounds", action='store', type=int, default=2000, help="一括変換をランダムな値で比較する列の数")
+    args = ap.parse_args()
+
+    cells = make_cells(args.cells, args.seed)
+    legacy_elapsed, expected = run_format(legacy_format_value, cells)
+    compiled_elapsed, results = run_format(format.format_value, cells)
+    column_elapsed, column_results = run_format_column(cells, args.column_size)
+
+    #変換結果が変わっていないことを確認する
+    for cell, a, b, c in zip(cells, expected, results, column_results):
+        if a != b or a != c:
+            print('変換結果が一致しません: {} → {} / {} / {}'.format(cell, a, b, c))
+            sys.exit(1)
+    mismatches = check_format_column(args.check_rounds, args.seed)
+    for x in mismatches[:20]:
+        print('一括変換の結果が一致しません: {} {} {} → {} / {}'.format(*x))
+    if len(mismatches) > 0:
+        sys.exit(1)
+
+    print('legacy   {:8.2f}s  {:10.0f} cells/s'.format(legacy_elapsed, args.cells / legacy_elapsed))
+    print('compiled {:8.2f}s  {:10.0f} cells/s'.format(compiled_elapsed, args.cells / compiled_elapsed))
+    print('column   {:8.2f}s  {:10.0f} cells/s'.format(column_elapsed, args.cells / column_elapsed))
+    print('キャッシュ: ' + str(format.compile_format.cache_info()))
+    print('高速化: compiled {:.2f}倍、column {:.2f}倍'.format(legacy_elapsed / compiled_elapsed, legacy_elapsed / column_elapsed))
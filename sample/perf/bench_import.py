@@ -0,0 +1,102 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import contextlib
+import io
+import os
+import sys
+import tempfile
+import time
+
+from openpyxl import Workbook
+
+from mock_qf_server import MockQFServer
+
+#suites_importのモジュールを読み込む
+SUITES_IMPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'suites_import')
+sys.path.insert(0, SUITES_IMPORT_DIR)
+import ImportTestCase
+import qf_client
+from loader import parse_workbook
+
+# -----------------------------------------------------------
+# ベンチマーク用のワークブックを作成する
+#
+# Parameters:
+#  file_path（str）：作成するファイルのパス
+#  rows（int）：テストケースの行数
+#  columns（int）：「優先度」以外の列数
+# -----------------------------------------------------------
+def make_workbook(file_path, rows, columns):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Sheet1'
+    ws.append([ImportTestCase.settings.COL_TITLE_START] + ['項目' + str(j + 1) for j in range(columns)])
+    for i in range(rows):
+        values = ['ABC'[i % 3]]
+        for j in range(columns):
+            if j % 3 == 0:
+                values.append('手順' + str(i) + '-' + str(j))
+            elif j % 3 == 1:
+                values.append(i * 1.5 + j)
+            else:
+                values.append('期待結果 ' + str(i))
+        ws.append(values)
+    wb.save(file_path)
+
+# -----------------------------------------------------------
+# モックサーバに対してシートをインポートする
+#
+# Parameters:
+#  server（MockQFServer）：モックサーバ
+#  sheet（SheetModel）：シートのデータとヘッダーの位置
+#  test_suite_name（str）：テストスイート名
+#  workers（int）：テストケースを並列で作成する数
+#  rate（float）：1秒あたりのリクエスト数
+#  burst（int）：連続して送信できるリクエスト数
+#
+# Returns:
+#  elapsed（float）：経過秒数
+# -----------------------------------------------------------
+def run_import(server, sheet, test_suite_name, workers, rate, burst):
+    ImportTestCase.settings.BASE_API_URL = server.base_url
+    ImportTestCase.settings.API_KEY = server.api_key
+    ImportTestCase.settings.MAX_WORKERS = workers
+    ImportTestCase.project_id = 1
+    ImportTestCase._default_label_content = {}
+    ImportTestCase._test_suite_list = []
+    qf_client.configure(pool_size=max(workers, 1), rate=rate, burst=burst)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ImportTestCase.import_sheet(test_suite_name, sheet)
+    return time.perf_counter() - start
+
+if __name__ == '__main__':
+    # コマンドラインオプション処理
+    import argparse
+    ap = argparse.ArgumentParser(description='テストケース作成の直列と並列の処理速度を比較する。')
+    ap.add_argument("--rows", action='store', type=int, default=10000, help="テストケースの行数")
+    ap.add_argument("--columns", action='store', type=int, default=6, help="「優先度」以外の列数")
+    ap.add_argument("--workers", action='store', type=int, default=8, help="並列で作成する数")
+    ap.add_argument("--latency", action='store', type=float, default=0.01, help="モックサーバの応答遅延秒数")
+    ap.add_argument("--rate", action='store', type=float, default=500.0, help="1秒あたりのリクエスト数")
+    ap.add_argument("--burst", action='store', type=int, default=10, help="連続して送信できるリクエスト数")
+    args = ap.parse_args()
+
+    server = MockQFServer(latency=args.latency).start()
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = os.path.join(tmp, 'bench.xlsx')
+        make_workbook(file_path, args.rows, args.columns)
+        sheet = parse_workbook(file_path)[0]
+
+        results = []
+        for label, workers in (('serial', 1), ('parallel', args.workers)):
+            elapsed = run_import(server, sheet, 'bench-' + label, workers, args.rate, args.burst)
+            results.append(elapsed)
+            print('{:<9} workers={:<3} {:8.2f}s  {:8.1f} cases/s'.format(label, workers, elapsed, args.rows / elapsed))
+            qf_client.print_stats()
+
+    created = [len(cases) for cases in server.store.test_cases.values()]
+    server.stop()
+    print('作成されたテストケース数: ' + str(created))
+    print('高速化: {:.2f}倍'.format(results[0] / results[1]))
@@ -0,0 +1,77 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+#post_automated_test_resultsのモジュールを読み込む
+POST_RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'post_automated_test_results')
+sys.path.insert(0, POST_RESULTS_DIR)
+
+# -----------------------------------------------------------
+# ベンチマーク用のJUnit XMLを作成する
+#
+# Parameters:
+#  file_path（str）：作成するファイルのパス
+#  suites（int）：テストスイート数
+#  cases（int）：テストスイートあたりのテストケース数
+# -----------------------------------------------------------
+def make_junit_xml(file_path, suites, cases):
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?><testsuites>')
+        for s in range(suites):
+            f.write('<testsuite name="suite{0}" tests="{1}">'.format(s, cases))
+            for c in range(cases):
+                f.write('<testcase classname="tests.test_{0}.TestSample" name="test_{0}_{1}" '
+                        'file="tests/test_{0}.py" line="{1}" time="0.{2:03d}">'.format(s, c, c % 1000))
+                if c % 10 == 1:
+                    f.write('<failure message="assert False">' + 'E       assert False\n' * 20 + '</failure>')
+                elif c % 10 == 2:
+                    f.write('<skipped type="pytest.skip" message="unconditional skip">skip</skipped>')
+                f.write('</testcase>')
+            f.write('</testsuite>')
+        f.write('</testsuites>')
+
+# -----------------------------------------------------------
+# 子プロセスで解析を実行し、件数・経過秒数・最大RSSを表示する
+#
+# Parameters:
+#  mode（str）：legacy（parse_xml）またはstream（iter_results）
+#  file_path（str）：JUnit XMLのパス
+# -----------------------------------------------------------
+def run_parser(mode, file_path):
+    from modules import result
+    start = time.perf_counter()
+    count = 0
+    if mode == 'legacy':
+        count = len(result.parse_xml(file_path))
+    else:
+        for _ in result.iter_results(file_path):
+            count += 1
+    elapsed = time.perf_counter() - start
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print('{:<7} {:>9} cases {:8.2f}s  max RSS {:8.1f} MB'.format(mode, count, elapsed, max_rss))
+
+if __name__ == '__main__':
+    # コマンドラインオプション処理
+    import argparse
+    ap = argparse.ArgumentParser(description='JUnit XMLの一括解析とストリーミング解析を比較する。')
+    ap.add_argument("--suites", action='store', type=int, default=20, help="テストスイート数")
+    ap.add_argument("--cases", action='store', type=int, default=10000, help="テストスイートあたりのテストケース数")
+    ap.add_argument("--run", action='store', nargs=2, metavar=('MODE', 'XML'), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.run:
+        run_parser(*args.run)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        file_path = os.path.join(tmp, 'result.xml')
+        make_junit_xml(file_path, args.suites, args.cases)
+        print('XMLサイズ: {:.1f} MB'.format(os.path.getsize(file_path) / 1024 / 1024))
+        #メモリ使用量を分けて測るため、解析ごとに子プロセスで実行する
+        for mode in ('legacy', 'stream'):
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--run', mode, file_path], check=True)
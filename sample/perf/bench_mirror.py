@@ -0,0 +1,130 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import contextlib
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+from mock_qf_server import MockQFServer
+from bench_async import write_config, POST_RESULTS_DIR
+
+sys.path.insert(0, os.path.join(POST_RESULTS_DIR, '..', 'common'))
+import qf_client
+import qf_mirror
+import qf_pages
+from modules import api
+
+def measure(server, func):
+    before = server.total_requests()
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ret = func()
+    return time.perf_counter() - start, server.total_requests() - before, ret
+
+def sync(server, path, workers):
+    mirror = qf_mirror.Mirror(path)
+    runner = qf_mirror.MirrorSync(mirror, server.base_url, server.api_key, workers)
+    failures = runner.run()
+    mirror.close()
+    return runner.stats if len(failures) == 0 else None
+
+# -----------------------------------------------------------
+# ミラーの内容をモックサーバのデータと比較する
+#
+# Returns:
+#  errors（array）：一致しない種類のリスト
+# -----------------------------------------------------------
+def verify(server, path):
+    store = server.store
+    expected = {
+        'test_suites': len(store.test_suites),
+        'test_suite_versions': len(store.test_suite_versions),
+        'test_cases': sum(len(x) for x in store.test_cases.values()),
+        'test_phases': len(store.test_phases),
+        'test_suite_assignments': len(store.test_suite_assignments),
+        'test_cycles': len(store.test_cycles),
+        'test_results': sum(len(x) for x in store.test_results.values()),
+    }
+    conn = sqlite3.connect(path)
+    errors = []
+    for kind, count in expected.items():
+        actual = conn.execute('SELECT COUNT(*) FROM ' + kind).fetchone()[0]
+        if actual != count:
+            errors.append('{}: {} / {}'.format(kind, actual, count))
+    conn.close()
+    return errors
+
+# -----------------------------------------------------------
+# 各ツールの参照（テストスイートの一覧と「利用可」のバージョン・テストケースの索引）をAPIとミラーで比較する
+# -----------------------------------------------------------
+def lookup_api(server, config_path):
+    suites = qf_pages.get_pages(server.base_url + 'test_suites?api_key=' + server.api_key, 'test_suites')
+    for ts in suites:
+        qf_pages.get_pages(server.base_url + 'test_suites/' + str(ts['id']) + '/test_suite_versions?api_key=' + server.api_key,
+                           'test_suite_versions')
+    return len(api.API(config_path=config_path, config_section='QF_API').load_test_case_index())
+
+def lookup_mirror(server, path, config_path):
+    mirror = qf_mirror.open_mirror(path, server.base_url, server.api_key)
+    for ts in mirror.list('test_suites'):
+        mirror.list('test_suite_versions', ts['id'])
+    mirror.close()
+    return len(api.API(config_path=config_path, config_section='QF_API').load_test_case_index())
+
+if __name__ == '__main__':
+    # コマンドラインオプション処理
+    import argparse
+    ap = argparse.ArgumentParser(description='プロジェクトのミラーの同期（初回・変更なし・一部変更）と、APIとミラーでの参照を比較する。')
+    ap.add_argument("--phases", action='store', type=int, default=2, help="テストフェーズ数")
+    ap.add_argument("--assignments", action='store', type=int, default=10, help="テストフェーズあたりのテストスイート割り当て数")
+    ap.add_argument("--cycles", action='store', type=int, default=3, help="テストスイート割り当てあたりのテストサイクル数")
+    ap.add_argument("--cases", action='store', type=int, default=300, help="テストスイートあたりのテストケース数")
+    ap.add_argument("--latency", action='store', type=float, default=0.01, help="モックサーバの応答遅延秒数")
+    ap.add_argument("--workers", action='store', type=int, default=4, help="並列で一覧を取得する数")
+    ap.add_argument("--rate", action='store', type=float, default=1000.0, help="1秒あたりのリクエスト数")
+    ap.add_argument("--burst", action='store', type=int, default=10, help="連続して送信できるリクエスト数")
+    args = ap.parse_args()
+
+    server = MockQFServer(latency=args.latency).start()
+    server.store.seed(phases=args.phases, assignments=args.assignments, cycles=args.cycles, cases=args.cases)
+    assignment = next(iter(server.store.test_suite_assignments.values()))
+    qf_client.configure(rate=args.rate, burst=args.burst)
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'qf_mirror.sqlite3')
+        for label, change in (('初回', None), ('変更なし', None), ('結果を追加', 'result')):
+            if change == 'result':
+                #1つのテストサイクルにテスト結果を追加する（テストサイクルのupdated_atが変わる）
+                cycle = next(iter(server.store.test_cycles.values()))
+                server.store.create_result(cycle, {'test_case_no': '1', 'result': 'fail'})
+            elapsed, requests, stats = measure(server, lambda: sync(server, path, args.workers))
+            errors = ['同期に失敗しました'] if stats is None else verify(server, path)
+            failed = failed or len(errors) > 0
+            print('同期（{}）{:8.2f}s  {:5}リクエスト  書き込み {:6}件  省略した一覧 {:4}件  {}'.format(
+                label, elapsed, requests, stats['written'] if stats else 0, stats['skipped'] if stats else 0, 'OK' if not errors else 'NG'))
+            for error in errors:
+                print('  ▪ ' + error)
+
+        api_config = os.path.join(tmp, 'api.ini')
+        mirror_config = os.path.join(tmp, 'mirror.ini')
+        write_config(api_config, server, assignment, args)
+        write_config(mirror_config, server, assignment, args)
+        with open(mirror_config, 'a', encoding='utf-8') as f:
+            f.write('mirror_path = ' + path + '\n')
+        for label, func in (('API', lambda: lookup_api(server, api_config)), ('ミラー', lambda: lookup_mirror(server, path, mirror_config))):
+            elapsed, requests, count = measure(server, func)
+            ok = count == args.cases
+            failed = failed or not ok
+            print('参照（{}）{:8.3f}s  {:5}リクエスト  {}'.format(label, elapsed, requests, 'OK' if ok else 'NG'))
+        #別のAPIキー・接続先で同期したミラーは使わない
+        other = [qf_mirror.open_mirror(path, server.base_url, server.api_key + '-other'),
+                 qf_mirror.open_mirror(path, server.base_url + 'other/', server.api_key)]
+        ok = other == [None, None]
+        failed = failed or not ok
+        print('別の接続先のミラー  {}'.format('使わない OK' if ok else '使った NG'))
+    server.stop()
+    sys.exit(1 if failed else 0)
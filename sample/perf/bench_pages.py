@@ -0,0 +1,58 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import os
+import sys
+import time
+
+from mock_qf_server import MockQFServer
+
+#共通モジュール（sample/common）を読み込む
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import qf_client
+import qf_pages
+
+# -----------------------------------------------------------
+# テストスイートの一覧を全ページ取得する
+#
+# Parameters:
+#  server（MockQFServer）：モックサーバ
+#  workers（int）：並列で取得する数
+#
+# Returns:
+#  elapsed（float）：経過秒数
+#  suites（array）：テストスイートのリスト
+# -----------------------------------------------------------
+def run_pages(server, workers):
+    url = server.base_url + 'test_suites?api_key=' + server.api_key
+    start = time.perf_counter()
+    suites = qf_pages.get_pages(url, 'test_suites', workers)
+    return time.perf_counter() - start, suites
+
+if __name__ == '__main__':
+    # コマンドラインオプション処理
+    import argparse
+    ap = argparse.ArgumentParser(description='一覧の取得をnext_urlの順番と並列で比較する。')
+    ap.add_argument("--suites", action='store', type=int, default=2000, help="テストスイート数")
+    ap.add_argument("--per_page", action='store', type=int, default=25, help="1ページあたりの件数")
+    ap.add_argument("--latency", action='store', type=float, default=0.05, help="モックサーバの応答遅延秒数")
+    ap.add_argument("--workers", action='store', type=int, nargs='+', default=[1, 4, 8], help="比較する並列数")
+    ap.add_argument("--rate", action='store', type=float, default=100.0, help="1秒あたりのリクエスト数")
+    ap.add_argument("--burst", action='store', type=int, default=10, help="連続して送信できるリクエスト数")
+    args = ap.parse_args()
+
+    server = MockQFServer(latency=args.latency, per_page=args.per_page).start()
+    server.store.seed(phases=1, assignments=args.suites, cycles=0, cases=0)
+    baseline = None
+    expected = None
+    for workers in args.workers:
+        qf_client.configure(pool_size=max(workers, 1), rate=args.rate, burst=args.burst)
+        elapsed, suites = run_pages(server, workers)
+        #並列数に関係なく同じ結果（順番を含む）になることを確認する
+        if expected is None:
+            expected = suites
+        elif suites != expected:
+            print('取得結果が一致しません: workers=' + str(workers))
+            sys.exit(1)
+        baseline = baseline or elapsed
+        print('workers={:<3} {:8.2f}s  {:6}件  {:5.2f}倍'.format(workers, elapsed, len(suites), baseline / elapsed))
+    server.stop()
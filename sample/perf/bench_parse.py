@@ -0,0 +1,121 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import os
+import sys
+import tempfile
+import time
+
+from openpyxl import Workbook
+
+#suites_importのモジュールを読み込む
+SUITES_IMPORT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'suites_import')
+sys.path.insert(0, SUITES_IMPORT_DIR)
+import loader
+import settings
+from parse_cache import ParseCache
+
+# -----------------------------------------------------------
+# ベンチマーク用のワークブックを作成する（文字列・数値・指数・パーセントを含む）
+#
+# Parameters:
+#  file_path（str）：作成するファイルのパス
+#  rows（int）：テストケースの行数
+#  columns（int）：「優先度」以外の列数
+# -----------------------------------------------------------
+def make_workbook(file_path, rows, columns):
+    wb = Workbook()
+    ws = wb.active
+    ws.title = 'Sheet1'
+    ws.append([settings.COL_TITLE_START] + ['項目' + str(j + 1) for j in range(columns)])
+    for i in range(rows):
+        ws.append(['ABC'[i % 3]] + [None] * columns)
+        r = ws.max_row
+        for j in range(columns):
+            cell = ws.cell(row=r, column=j + 2)
+            kind = j % 4
+            if kind == 0:
+                cell.value = '手順' + str(i) + '-' + str(j)
+            elif kind == 1:
+                cell.value = i * 1.25 + j
+                cell.number_format = '#,##0.00'
+            elif kind == 2:
+                cell.value = (i + 1) * 12345.678
+                cell.number_format = '0.00E+00'
+            else:
+                cell.value = (i % 100) / 100
+                cell.number_format = '0.0%'
+    wb.save(file_path)
+
+# -----------------------------------------------------------
+# 指定したプロセス数で全ファイルを解析する
+#
+# Parameters:
+#  file_paths（array）：エクセルファイルのパスのリスト
+#  workers（int）：解析するプロセス数
+#  cache（ParseCache）：解析結果のキャッシュ（Noneの場合は使わない）
+#
+# Returns:
+#  elapsed（float）：経過秒数
+#  results（array）：解析結果のリスト
+# -----------------------------------------------------------
+def run_parse(file_paths, workers, cache=None):
+    start = time.perf_counter()
+    results = list(loader.parse_workbooks(file_paths, workers, cache))
+    return time.perf_counter() - start, results
+
+if __name__ == '__main__':
+    # コマンドラインオプション処理
+    import argparse
+    ap = argparse.ArgumentParser(description='Excelの解析をプロセス数ごとに比較する。')
+    ap.add_argument("--files", action='store', type=int, default=200, help="ワークブック数")
+    ap.add_argument("--rows", action='store', type=int, default=200, help="ワークブックあたりのテストケースの行数")
+    ap.add_argument("--columns", action='store', type=int, default=8, help="「優先度」以外の列数")
+    ap.add_argument("--workers", action='store', type=int, nargs='+', help="比較するプロセス数（省略時は1からCPU数まで倍々）")
+    args = ap.parse_args()
+
+    workers_list = args.workers
+    if not workers_list:
+        cpu = os.cpu_count() or 1
+        workers_list = [1]
+        while workers_list[-1] * 2 <= cpu:
+            workers_list.append(workers_list[-1] * 2)
+        if workers_list[-1] != cpu:
+            workers_list.append(cpu)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        #同じ内容のファイルをコピーしてコーパスを作る
+        template = os.path.join(tmp, 'template.xlsx')
+        make_workbook(template, args.rows, args.columns)
+        with open(template, 'rb') as f:
+            data = f.read()
+        file_paths = []
+        for n in range(args.files):
+            file_path = os.path.join(tmp, 'suite{:03d}.xlsx'.format(n))
+            with open(file_path, 'wb') as f:
+                f.write(data)
+            file_paths.append(file_path)
+
+        print('CPU数: {}  ワークブック数: {}  テストケース数: {}'.format(os.cpu_count(), args.files, args.files * args.rows))
+        baseline = None
+        expected = None
+        for workers in workers_list:
+            elapsed, results = run_parse(file_paths, workers)
+            #プロセス数に関係なく同じ解析結果になることを確認する
+            if expected is None:
+                expected = results
+            elif results != expected:
+                print('解析結果が一致しません: workers=' + str(workers))
+                sys.exit(1)
+            baseline = baseline or elapsed
+            print('workers={:<3} {:8.2f}s  {:8.1f} files/s  {:5.2f}倍'.format(workers, elapsed, args.files / elapsed, baseline / elapsed))
+
+        #解析結果のキャッシュ（初回は全て解析し、2回目は全てキャッシュから読み込む）
+        cache = ParseCache(os.path.join(tmp, 'parse_cache.sqlite3'))
+        for label in ('cache(cold)', 'cache(warm)'):
+            elapsed, results = run_parse(file_paths, workers_list[-1], cache)
+            if results != expected:
+                print('解析結果が一致しません: ' + label)
+                sys.exit(1)
+            print('{:<11} {:8.2f}s  {:8.1f} files/s  {:5.2f}倍'.format(label, elapsed, args.files / elapsed, baseline / elapsed))
+        print('キャッシュ: 使用 {}件、解析 {}件'.format(cache.hits, cache.misses))
+        cache.close()
@@ -0,0 +1,120 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from mock_qf_server import MockQFServer
+from bench_async import write_config
+
+#【定数】
+POST_RESULTS_DIR = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'post_automated_test_results'))
+#QFの結果コード（pass・fail・skip）
+QF_RESULT_PASS = 1
+QF_RESULT_FAIL = 2
+QF_RESULT_SKIP = 3
+
+# -----------------------------------------------------------
+# テストケースのcategory1と同じ名前のテスト関数を作成する
+#   5件に1件は失敗、7件に1件はスキップ、11件に1件はフィクスチャのエラーにする
+#
+# Parameters:
+#  file_path（str）：作成するファイルのパス
+#  cases（array）：テストケースのリスト
+#  test_time（float）：1件あたりの実行秒数
+#
+# Returns:
+#  expected（dict）：テスト関数名 → QFの結果コード
+# -----------------------------------------------------------
+def write_tests(file_path, cases, test_time):
+    expected = {}
+    with open(file_path, 'w', encoding='utf-8') as f:
+        f.write('import time\nimport pytest\n\n@pytest.fixture\ndef broken():\n    raise RuntimeError("broken")\n\n')
+        for case in cases:
+            name = case['category1']
+            if case['no'] % 11 == 0:
+                f.write('def {}(broken):\n    pass\n\n'.format(name))
+                expected[name] = QF_RESULT_FAIL
+            elif case['no'] % 7 == 0:
+                f.write('@pytest.mark.skip(reason="skip")\ndef {}():\n    pass\n\n'.format(name))
+                expected[name] = QF_RESULT_SKIP
+            else:
+                f.write('def {}():\n    time.sleep({})\n    assert {}\n\n'.format(name, test_time, case['no'] % 5 != 0))
+                expected[name] = QF_RESULT_PASS if case['no'] % 5 else QF_RESULT_FAIL
+    return expected
+
+def run(args, cwd):
+    start = time.perf_counter()
+    proc = subprocess.run(args, cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    return time.perf_counter() - start, proc
+
+# -----------------------------------------------------------
+# 投入されたテスト結果を期待値と比較する
+#
+# Returns:
+#  errors（array）：一致しないテストのリスト
+# -----------------------------------------------------------
+def verify(server, cycle_ids, cases, expected):
+    names = {case['no']: case['category1'] for case in cases}
+    if len(cycle_ids) != 1:
+        return ['テストサイクルが' + str(len(cycle_ids)) + '件作成されました']
+    results = server.store.test_results[cycle_ids[0]]
+    actual = {names[x['test_case_no']]: int(x['result']) for x in results}
+    errors = [name for name in expected if actual.get(name) != expected[name]]
+    if len(results) != len(expected):
+        errors.append('結果の件数: ' + str(len(results)) + ' / ' + str(len(expected)))
+    return errors
+
+if __name__ == '__main__':
+    # コマンドラインオプション処理
+    import argparse
+    ap = argparse.ArgumentParser(description='pytestの終了後に投入する場合と、プラグインで実行中に投入する場合を比較する。')
+    ap.add_argument("--tests", action='store', type=int, default=200, help="テスト数")
+    ap.add_argument("--test_time", action='store', type=float, default=0.02, help="1件あたりの実行秒数")
+    ap.add_argument("--latency", action='store', type=float, default=0.05, help="モックサーバの応答遅延秒数")
+    ap.add_argument("--workers", action='store', type=int, default=4, help="並列で投入する数")
+    ap.add_argument("--xdist", action='store', type=int, default=2, help="pytest-xdistのワーカー数（0の場合は測定しない）")
+    ap.add_argument("--rate", action='store', type=float, default=1000.0, help="1秒あたりのリクエスト数")
+    ap.add_argument("--burst", action='store', type=int, default=10, help="連続して送信できるリクエスト数")
+    args = ap.parse_args()
+
+    server = MockQFServer(latency=args.latency, per_page=max(100, args.tests)).start()
+    server.store.seed(phases=1, assignments=1, cycles=0, cases=args.tests)
+    assignment = next(iter(server.store.test_suite_assignments.values()))
+    cases = server.store.test_cases[assignment['test_suite_version_id']]
+
+    failed = False
+    with tempfile.TemporaryDirectory() as tmp:
+        config_path = os.path.join(tmp, 'config.ini')
+        write_config(config_path, server, assignment, args)
+        with open(os.path.join(tmp, 'pytest.ini'), 'w', encoding='utf-8') as f:
+            f.write('[pytest]\n')
+        test_path = os.path.join(tmp, 'test_generated.py')
+        expected = write_tests(test_path, cases, args.test_time)
+        pytest_args = [sys.executable, '-m', 'pytest', '-q', '-p', 'no:cacheprovider', '-c', os.path.join(tmp, 'pytest.ini'), test_path]
+
+        variants = [('junit+main.py', None), ('plugin', []), ('plugin+xdist', ['-n', str(args.xdist)])]
+        if args.xdist <= 0:
+            variants.pop()
+        for label, extra in variants:
+            before = set(server.store.test_cycles)
+            if extra is None:
+                #pytestの終了後にJUnit XMLを解析して投入する
+                xml_path = os.path.join(tmp, 'result.xml')
+                elapsed, proc = run(pytest_args + ['--junit-xml=' + xml_path], POST_RESULTS_DIR)
+                elapsed2, proc = run([sys.executable, os.path.join(POST_RESULTS_DIR, 'main.py'), xml_path], tmp)
+                elapsed += elapsed2
+            else:
+                elapsed, proc = run(pytest_args + ['-p', 'modules.pytest_qf', '--qf', '--qf-config', config_path] + extra, POST_RESULTS_DIR)
+            cycle_ids = [x for x in server.store.test_cycles if x not in before]
+            errors = verify(server, cycle_ids, cases, expected)
+            print('{:<14} {:8.2f}s  {}'.format(label, elapsed, 'OK' if not errors else 'NG'))
+            if errors:
+                failed = True
+                print(proc.stdout.decode('utf-8', 'replace')[-2000:])
+                for error in errors[:10]:
+                    print('  ▪ ' + error)
+    server.stop()
+    sys.exit(1 if failed else 0)
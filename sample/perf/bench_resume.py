@@ -0,0 +1,159 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import json
+import os
+import runpy
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+from mock_qf_server import MockQFServer
+from bench_parse import make_workbook
+
+#【定数】
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'suites_import', 'ImportTestCase.py')
+#中断の方法（強制終了・サーバエラー）
+MODES = ('kill', 'error')
+
+# -----------------------------------------------------------
+# 子プロセスでImportTestCase.pyを実行する
+#
+# Parameters:
+#  conf（dict）：モックサーバのURL・APIキー・作業フォルダなど
+#  resume（bool）：--resumeを指定するかどうか
+# -----------------------------------------------------------
+def run_import(conf, resume):
+    os.chdir(conf['work_dir'])
+    sys.path.insert(0, os.path.dirname(SCRIPT))
+    import settings
+    settings.BASE_API_URL = conf['base_url']
+    settings.API_KEY = conf['api_key']
+    settings.FOLDER_PATH = conf['excel_dir']
+    settings.RATE_LIMIT = conf['rate']
+    settings.RATE_BURST = conf['burst']
+    settings.MAX_WORKERS = conf['workers']
+    sys.argv = [SCRIPT] + (['--resume'] if resume else [])
+    runpy.run_path(SCRIPT, run_name='__main__')
+
+def start_import(conf, resume, log_path):
+    log = open(log_path, 'w', encoding='utf-8')
+    args = [sys.executable, os.path.abspath(__file__), '--run', json.dumps(conf)] + (['--resume'] if resume else [])
+    return subprocess.Popen(args, stdout=log, stderr=subprocess.STDOUT), log
+
+# -----------------------------------------------------------
+# インポートを途中で中断する
+#   送信されたリクエスト数がcutに達したら、子プロセスを強制終了する（kill）か、
+#   サーバが500を返すようにして失敗させる（error）
+#
+# Returns:
+#  requests（int）：中断までに送信されたリクエスト数
+# -----------------------------------------------------------
+def interrupt_import(server, conf, mode, cut, log_path):
+    before = server.total_requests()
+    proc, log = start_import(conf, False, log_path)
+    while proc.poll() is None and server.total_requests() - before < cut:
+        time.sleep(0.005)
+    if mode == 'kill':
+        proc.send_signal(signal.SIGKILL)
+        proc.wait()
+    else:
+        server.error_status = 500
+        server.error_rate = 1.0
+        proc.wait()
+        server.error_rate = 0.0
+    log.close()
+    return server.total_requests() - before
+
+def run_to_end(server, conf, resume, log_path):
+    before = server.total_requests()
+    proc, log = start_import(conf, resume, log_path)
+    proc.wait()
+    log.close()
+    if proc.returncode != 0:
+        print('インポートに失敗しました。ログ: ' + log_path)
+        sys.exit(1)
+    return server.total_requests() - before
+
+# -----------------------------------------------------------
+# 全てのテストスイートが1つずつ、利用可のバージョンに全てのテストケースが重複なく作成されたことを確認する
+#
+# Returns:
+#  errors（array）：問題のリスト
+# -----------------------------------------------------------
+def verify(server, names, rows):
+    store = server.store
+    errors = []
+    for name in names:
+        suites = [x for x in store.test_suites.values() if x['name'] == name]
+        if len(suites) != 1:
+            errors.append(name + ': テストスイートが' + str(len(suites)) + '件')
+            continue
+        versions = [v for v in store.test_suite_versions.values() if v['test_suite_id'] == suites[0]['id']]
+        if len(versions) != 1 or versions[0]['status'] != 'available':
+            errors.append(name + ': バージョン ' + str([(v['id'], v['status']) for v in versions]))
+            continue
+        nos = sorted(case['no'] for case in store.test_cases[versions[0]['id']])
+        if nos != list(range(1, rows + 1)):
+            errors.append(name + ': テストケース ' + str(len(nos)) + '件（重複 ' + str(len(nos) - len(set(nos))) + '件）')
+    return errors
+
+def prepare(work_dir, server, args):
+    excel_dir = os.path.join(work_dir, 'excel')
+    os.makedirs(excel_dir)
+    names = []
+    for n in range(args.files):
+        make_workbook(os.path.join(excel_dir, 'suite{:03d}.xlsx'.format(n)), args.rows, 4)
+        names.append('suite{:03d}-Sheet1'.format(n))
+    conf = {
+        'base_url': server.base_url,
+        'api_key': server.api_key,
+        'work_dir': work_dir,
+        'excel_dir': excel_dir,
+        'rate': args.rate,
+        'burst': args.burst,
+        'workers': args.workers,
+    }
+    return conf, names
+
+if __name__ == '__main__':
+    # コマンドラインオプション処理
+    import argparse
+    ap = argparse.ArgumentParser(description='中断したインポートを--resumeで再開した時のリクエスト数と結果を確認する。')
+    ap.add_argument("--files", action='store', type=int, default=4, help="インポートするエクセルファイル数")
+    ap.add_argument("--rows", action='store', type=int, default=200, help="テストスイートあたりのテストケース数")
+    ap.add_argument("--cut", action='store', type=float, default=0.6, help="中断するまでに送信するリクエストの割合")
+    ap.add_argument("--modes", action='store', nargs='+', choices=MODES, default=list(MODES), help="中断の方法")
+    ap.add_argument("--latency", action='store', type=float, default=0.005, help="モックサーバの応答遅延秒数")
+    ap.add_argument("--rate", action='store', type=float, default=1000.0, help="1秒あたりのリクエスト数")
+    ap.add_argument("--burst", action='store', type=int, default=10, help="連続して送信できるリクエスト数")
+    ap.add_argument("--workers", action='store', type=int, default=4, help="テストケースを並列で作成する数")
+    ap.add_argument("--run", action='store', metavar='CONF', help=argparse.SUPPRESS)
+    ap.add_argument("--resume", action='store_true', help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.run:
+        run_import(json.loads(args.run), args.resume)
+        sys.exit(0)
+
+    failed = False
+    for mode in ['full'] + args.modes:
+        server = MockQFServer(latency=args.latency).start()
+        with tempfile.TemporaryDirectory() as work_dir:
+            conf, names = prepare(work_dir, server, args)
+            if mode == 'full':
+                #中断しない場合のリクエスト数
+                total = run_to_end(server, conf, False, os.path.join(work_dir, 'full.log'))
+                print('{:<6} 中断なし        {:6}件'.format(mode, total))
+            else:
+                sent = interrupt_import(server, conf, mode, int(total * args.cut), os.path.join(work_dir, 'cut.log'))
+                resumed = run_to_end(server, conf, True, os.path.join(work_dir, 'resume.log'))
+                print('{:<6} 中断前 {:6}件  再開 {:6}件  合計 {:6}件（中断なしより {:+}件）'.format(
+                    mode, sent, resumed, sent + resumed, sent + resumed - total))
+            errors = verify(server, names, args.rows)
+            for error in errors:
+                print('  ▪ ' + error)
+            failed = failed or len(errors) > 0
+        server.stop()
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,230 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import json
+import os
+import runpy
+import subprocess
+import sys
+import tempfile
+import time
+
+from mock_qf_server import MockQFServer, USER_ID
+
+#【定数】
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+TOOLS = ('import', 'testblock', 'cycle_export', 'post_results', 'post_results_async')
+#テストブロッカー列に指定するラベル
+BLOCKER_LABEL = 'ブロッカー'
+#各ツールが出力する計測結果（作業フォルダのmetrics/<名前>.json）
+METRICS_NAMES = {
+    'import': 'import_test_case',
+    'testblock': 'test_block',
+    'cycle_export': 'download_under_project',
+    'post_results': 'post_automated_test_results',
+    'post_results_async': 'post_automated_test_results',
+}
+
+# -----------------------------------------------------------
+# 子プロセスでサンプルスクリプトを実行する
+#   設定（settings.py・config.ini・引数）をモックサーバ向けに変更してからrunpyで実行する
+#
+# Parameters:
+#  tool（str）：ツール名
+#  conf（dict）：モックサーバのURL・APIキー・作業フォルダなど
+# -----------------------------------------------------------
+def run_tool(tool, conf):
+    os.chdir(conf['work_dir'])
+    if tool == 'import':
+        script = os.path.join(SAMPLE_DIR, 'suites_import', 'ImportTestCase.py')
+        sys.path.insert(0, os.path.dirname(script))
+        import settings
+        settings.BASE_API_URL = conf['base_url']
+        settings.API_KEY = conf['api_key']
+        settings.FOLDER_PATH = conf['excel_dir']
+        settings.RATE_LIMIT = conf['rate']
+        settings.RATE_BURST = conf['burst']
+        settings.MAX_WORKERS = conf['workers']
+        settings.CACHE_PATH = conf['cache_path']
+        sys.argv = [script]
+    elif tool == 'testblock':
+        script = os.path.join(SAMPLE_DIR, 'testblocker_setting', 'TestBlock.py')
+        sys.path.insert(0, os.path.dirname(script))
+        import settings
+        settings.BASE_API_URL = conf['base_url']
+        settings.API_KEY = conf['api_key']
+        settings.RATE_LIMIT = conf['rate']
+        settings.RATE_BURST = conf['burst']
+        settings.CACHE_PATH = conf['cache_path']
+        sys.argv = [script, '-n', BLOCKER_LABEL]
+    elif tool == 'cycle_export':
+        script = os.path.join(SAMPLE_DIR, 'cycle_export', 'download_under_project.py')
+        sys.path.insert(0, os.path.dirname(script))
+        sys.argv = [script, '-a', conf['api_key'], '-u', conf['origin'] + '/', '-r', str(conf['rate']),
+                    '-b', str(conf['burst']), '-w', str(conf['workers']), '-f', 'csv']
+    else:
+        script = os.path.join(SAMPLE_DIR, 'post_automated_test_results', 'main.py')
+        sys.path.insert(0, os.path.dirname(script))
+        sys.argv = [script, conf['junit_xml']]
+        if tool == 'post_results_async':
+            sys.argv.append('--async')
+    runpy.run_path(script, run_name='__main__')
+
+# -----------------------------------------------------------
+# 子プロセスを起動し、経過秒数と最大RSSを測定する
+#
+# Parameters:
+#  tool（str）：ツール名
+#  conf（dict）：run_toolに渡す設定
+#  log_path（str）：標準出力の保存先
+#
+# Returns:
+#  returncode（int）：終了コード
+#  elapsed（float）：経過秒数
+#  max_rss（float）：最大RSS（MB）
+# -----------------------------------------------------------
+def measure_tool(tool, conf, log_path):
+    start = time.perf_counter()
+    with open(log_path, 'w', encoding='utf-8') as log:
+        proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--run', tool, json.dumps(conf)],
+                                stdout=log, stderr=subprocess.STDOUT)
+        #子プロセスごとのリソース使用量を取得する
+        _, status, usage = os.wait4(proc.pid, 0)
+    elapsed = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    return proc.returncode, elapsed, usage.ru_maxrss / 1024
+
+# -----------------------------------------------------------
+# ツールが出力した計測結果からレイテンシのp95（ミリ秒）を取得する
+#
+# Returns:
+#  p95（float）：ミリ秒（計測結果がない場合はNone）
+# -----------------------------------------------------------
+def read_p95(tool, work_dir):
+    path = os.path.join(work_dir, 'metrics', METRICS_NAMES[tool] + '.json')
+    if not os.path.exists(path):
+        return None
+    with open(path, encoding='utf-8') as f:
+        p95 = json.load(f)['total']['latency_seconds']['p95']
+    os.remove(path)
+    return None if p95 is None else p95 * 1000
+
+# -----------------------------------------------------------
+# 各ツールの入力データを作成する
+#
+# Parameters:
+#  work_dir（str）：作業フォルダ
+#  server（MockQFServer）：モックサーバ
+#  args（Namespace）：コマンドライン引数
+#
+# Returns:
+#  conf（dict）：run_toolに渡す設定
+# -----------------------------------------------------------
+def prepare(work_dir, server, args):
+    #インポートするエクセルファイル
+    excel_dir = os.path.join(work_dir, 'excel')
+    os.makedirs(excel_dir)
+    from bench_parse import make_workbook
+    for n in range(args.files):
+        make_workbook(os.path.join(excel_dir, 'suite{:03d}.xlsx'.format(n)), args.cases, 6)
+
+    #テスト結果を投入するテストスイート・テストフェーズ
+    server.store.seed(phases=args.phases, assignments=args.assignments, cycles=args.cycles, cases=args.cases, label=BLOCKER_LABEL)
+    assignment = next(iter(server.store.test_suite_assignments.values()))
+    cases = server.store.test_cases[assignment['test_suite_version_id']]
+
+    #JUnit XML（テストメソッド名はテストケースのcategory1）
+    junit_xml = os.path.join(work_dir, 'result.xml')
+    with open(junit_xml, 'w', encoding='utf-8') as f:
+        f.write('<?xml version="1.0" encoding="utf-8"?><testsuites><testsuite name="pytest">')
+        for case in cases:
+            f.write('<testcase classname="tests.test_sample" name="{0}" file="tests/test_sample.py" time="0.01">'.format(case['category1']))
+            if case['no'] % 5 == 0:
+                f.write('<failure message="assert False">assert False</failure>')
+            f.write('</testcase>')
+        f.write('</testsuite></testsuites>')
+
+    with open(os.path.join(work_dir, 'config.ini'), 'w', encoding='utf-8') as f:
+        f.write('[QF_API]\n')
+        f.write('base_url = ' + server.base_url + '\n')
+        f.write('api_key = ' + server.api_key + '\n')
+        f.write('user_id = ' + str(USER_ID) + '\n')
+        f.write('test_suites_id = ' + str(assignment['test_suite_id']) + '\n')
+        f.write('test_suites_version_id = ' + str(assignment['test_suite_version_id']) + '\n')
+        f.write('test_phase_id = ' + str(assignment['test_phase_id']) + '\n')
+        f.write('test_suite_assignment_id = ' + str(assignment['id']) + '\n')
+        f.write('rate_limit = ' + str(args.client_rate) + '\n')
+        f.write('rate_burst = ' + str(args.client_burst) + '\n')
+        f.write('max_workers = ' + str(args.workers) + '\n')
+        f.write('match_field = category1\n')
+
+    return {
+        'base_url': server.base_url,
+        'origin': server.origin,
+        'api_key': server.api_key,
+        'work_dir': work_dir,
+        'excel_dir': excel_dir,
+        'junit_xml': junit_xml,
+        'rate': args.client_rate,
+        'burst': args.client_burst,
+        'workers': args.workers,
+        #--repeatの2回目以降はAPIの応答キャッシュを使う
+        'cache_path': 'qf_cache.sqlite3',
+    }
+
+if __name__ == '__main__':
+    # コマンドラインオプション処理
+    import argparse
+    ap = argparse.ArgumentParser(description='モックサーバに対して各サンプルスクリプトを実行し、処理時間を測定する。')
+    ap.add_argument("--tools", action='store', nargs='+', choices=TOOLS, default=list(TOOLS), help="実行するツール")
+    ap.add_argument("--files", action='store', type=int, default=4, help="インポートするエクセルファイル数")
+    ap.add_argument("--cases", action='store', type=int, default=200, help="テストスイートあたりのテストケース数")
+    ap.add_argument("--phases", action='store', type=int, default=2, help="テストフェーズ数")
+    ap.add_argument("--assignments", action='store', type=int, default=3, help="テストフェーズあたりのテストスイート割り当て数")
+    ap.add_argument("--cycles", action='store', type=int, default=2, help="テストスイート割り当てあたりのテストサイクル数")
+    ap.add_argument("--latency", action='store', type=float, default=0.01, help="モックサーバの応答遅延秒数")
+    ap.add_argument("--rate_limit", action='store', type=float, help="モックサーバが1秒あたりに受け付けるリクエスト数")
+    ap.add_argument("--burst", action='store', type=int, default=10, help="モックサーバが連続して受け付けるリクエスト数")
+    ap.add_argument("--error_rate", action='store', type=float, default=0.0, help="モックサーバがエラーを返す割合（0〜1）")
+    ap.add_argument("--client_rate", action='store', type=float, default=1000.0, help="各ツールの1秒あたりのリクエスト数")
+    ap.add_argument("--client_burst", action='store', type=int, default=10, help="各ツールの連続して送信できるリクエスト数")
+    ap.add_argument("--workers", action='store', type=int, default=4, help="各ツールの並列数")
+    ap.add_argument("--repeat", action='store', type=int, default=1, help="各ツールを繰り返し実行する回数（2回目以降はキャッシュを使う）")
+    ap.add_argument("--keep", action='store', help="作業フォルダ（ログと出力）を残す場合のパス")
+    ap.add_argument("--run", action='store', nargs=2, metavar=('TOOL', 'CONF'), help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.run:
+        run_tool(args.run[0], json.loads(args.run[1]))
+        sys.exit(0)
+
+    server = MockQFServer(latency=args.latency, rate_limit=args.rate_limit, burst=args.burst, error_rate=args.error_rate).start()
+    tmp = None
+    failed = False
+    if args.keep:
+        work_dir = os.path.abspath(args.keep)
+        os.makedirs(work_dir, exist_ok=True)
+    else:
+        tmp = tempfile.TemporaryDirectory()
+        work_dir = tmp.name
+    try:
+        conf = prepare(work_dir, server, args)
+        print('{:<20} {:>4} {:>9} {:>9} {:>10} {:>9} {:>12}'.format('tool', 'exit', 'wall(s)', 'requests', 'req/s', 'p95(ms)', 'maxRSS(MB)'))
+        for n in range(args.repeat):
+            for tool in args.tools:
+                name = tool if n == 0 else tool + '#' + str(n + 1)
+                log_path = os.path.join(work_dir, name + '.log')
+                before = server.total_requests()
+                returncode, elapsed, max_rss = measure_tool(tool, conf, log_path)
+                requests = server.total_requests() - before
+                p95 = read_p95(tool, work_dir)
+                print('{:<20} {:>4} {:>9.2f} {:>9} {:>10.1f} {:>9} {:>12.1f}'.format(name, returncode, elapsed, requests, requests / elapsed,
+                                                                                   '-' if p95 is None else '{:.1f}'.format(p95), max_rss))
+                if returncode != 0:
+                    failed = True
+                    print('  ログ: ' + log_path)
+        print('ステータスコード: ' + str(dict(sorted(server.status_counts.items()))))
+    finally:
+        server.stop()
+        if tmp is not None and not failed:
+            tmp.cleanup()
+    sys.exit(1 if failed else 0)
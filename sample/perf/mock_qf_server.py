@@ -0,0 +1,552 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import csv
+import hashlib
+import io
+import json
+import math
+import random
+import re
+import sys
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+#【定数】
+API_PREFIX = '/api/v2/'
+#1ページあたりの件数
+DEFAULT_PER_PAGE = 100
+#モックサーバのプロジェクト番号
+PROJECT_ID = 1
+#モックサーバのユーザ番号
+USER_ID = 1
+#エラーを注入する時のステータスコード
+DEFAULT_ERROR_STATUS = 503
+
+# -----------------------------------------------------------
+# QualityForwardのデータをメモリ上に保持する
+# -----------------------------------------------------------
+class MockQFStore:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self._next_id = 1
+        self.project = {'id': PROJECT_ID, 'name': 'mock project'}
+        self.users = [{'id': USER_ID, 'name': 'mock user', 'email': 'mock@example.com'}]
+        self.test_suites = {}
+        self.test_suite_versions = {}
+        self.test_cases = {}
+        self.test_phases = {}
+        self.test_suite_assignments = {}
+        self.test_cycles = {}
+        self.test_results = {}
+
+    def next_id(self):
+        ret = self._next_id
+        self._next_id += 1
+        return ret
+
+    # -----------------------------------------------------------
+    # 性能測定用のデータを作成する
+    #   テストスイート（「利用可」のバージョンとテストケース付き）を作成し、
+    #   テストフェーズごとにテストスイートを割り当て、テストサイクルとテスト結果を作成する
+    #
+    # Parameters:
+    #  phases（int）：テストフェーズ数
+    #  assignments（int）：テストフェーズあたりのテストスイート割り当て数
+    #  cycles（int）：テストスイート割り当てあたりのテストサイクル数
+    #  cases（int）：テストスイートあたりのテストケース数
+    #  label（str）：テストスイートのラベル（label_content1）
+    # -----------------------------------------------------------
+    def seed(self, phases=2, assignments=3, cycles=2, cases=50, label='ブロッカー'):
+        for p in range(phases):
+            phase = {'id': self.next_id(), 'project_id': PROJECT_ID, 'name': 'フェーズ' + str(p + 1), 'test_suite_assignments': []}
+            self.test_phases[phase['id']] = phase
+            for a in range(assignments):
+                suite = {'id': self.next_id(), 'project_id': PROJECT_ID, 'name': 'スイート' + str(p + 1) + '-' + str(a + 1),
+                         'test_blocker_column': None, 'label_category1': '手順', 'label_category2': '期待結果',
+                         'label_content1': label, 'label_content2': '備考'}
+                self.test_suites[suite['id']] = suite
+                version = {'id': self.next_id(), 'test_suite_id': suite['id'], 'name': '1.0', 'status': 'available',
+                           'updated_at': datetime.now().isoformat()}
+                self.test_suite_versions[version['id']] = version
+                self.test_cases[version['id']] = [
+                    {'id': self.next_id(), 'test_suite_version_id': version['id'], 'no': n + 1, 'priority': 'ABC'[n % 3],
+                     'category1': 'test_' + str(n + 1), 'category2': '期待結果' + str(n + 1)}
+                    for n in range(cases)]
+                assignment = {'id': self.next_id(), 'test_phase_id': phase['id'], 'test_suite_id': suite['id'],
+                              'test_suite_version_id': version['id']}
+                self.test_suite_assignments[assignment['id']] = assignment
+                phase['test_suite_assignments'].append(dict(assignment))
+                for c in range(cycles):
+                    cycle = self.create_cycle(assignment['id'], {'name': 'サイクル' + str(c + 1)})
+                    for case in self.test_cases[version['id']]:
+                        self.create_result(cycle, {'test_case_no': str(case['no']), 'result': 'pass' if case['no'] % 5 else 'fail',
+                                                   'user_id': str(USER_ID)})
+
+    def create_cycle(self, assignment_id, form):
+        cycle = {'id': self.next_id(), 'test_suite_assignment_id': assignment_id, 'name': '', 'status': 'waiting_for_review'}
+        cycle.update(form)
+        cycle['updated_at'] = datetime.now().isoformat()
+        self.test_cycles[cycle['id']] = cycle
+        self.test_results[cycle['id']] = []
+        return cycle
+
+    def create_result(self, cycle, form):
+        result = {'id': self.next_id(), 'test_cycle_id': cycle['id']}
+        result.update(form)
+        if 'test_case_no' in result:
+            result['test_case_no'] = int(result['test_case_no'])
+        self.test_results[cycle['id']].append(result)
+        cycle['updated_at'] = datetime.now().isoformat()
+        return result
+
+# -----------------------------------------------------------
+# フォームデータ（test_suite[name]=... の形式）を辞書に変換する
+#
+# Parameters:
+#  body（bytes）：リクエストボディ
+#  resource（str）：リソース名（例：test_suite）
+#
+# Returns:
+#  ret（dict）：項目名 → 値
+# -----------------------------------------------------------
+def parse_form(body, resource):
+    ret = {}
+    prefix = resource + '['
+    for key, value in parse_qsl(body.decode('utf-8'), keep_blank_values=True):
+        #配列（test_cycle[target_priorities][]=A）はリストにまとめる
+        if key.startswith(prefix) and key.endswith('][]'):
+            ret.setdefault(key[len(prefix):-3], []).append(value)
+        elif key.startswith(prefix) and key.endswith(']'):
+            ret[key[len(prefix):-1]] = value
+    return ret
+
+# -----------------------------------------------------------
+# APIのルーティング
+#   ハンドラは (store, match, query, body) を受け取り (ステータス, 応答) を返す
+# -----------------------------------------------------------
+def _current_project(store, match, query, body):
+    return 200, dict(store.project)
+
+def _list_test_suites(store, match, query, body):
+    return 200, ('test_suites', list(store.test_suites.values()))
+
+def _create_test_suite(store, match, query, body):
+    form = parse_form(body, 'test_suite')
+    suite = {'id': store.next_id(), 'project_id': int(form.pop('project_id', PROJECT_ID)), 'test_blocker_column': None}
+    suite.update(form)
+    store.test_suites[suite['id']] = suite
+    return 201, suite
+
+def _update_test_suite(store, match, query, body):
+    suite = store.test_suites.get(int(match.group('suite')))
+    if suite is None:
+        return 404, {'message': 'not found'}
+    form = parse_form(body, 'test_suite')
+    if form.get('test_blocker_column'):
+        form['test_blocker_column'] = int(form['test_blocker_column'])
+    suite.update(form)
+    return 200, suite
+
+def _delete_test_suite(store, match, query, body):
+    suite_id = int(match.group('suite'))
+    if store.test_suites.pop(suite_id, None) is None:
+        return 404, {'message': 'not found'}
+    for version_id in [v['id'] for v in store.test_suite_versions.values() if v['test_suite_id'] == suite_id]:
+        store.test_suite_versions.pop(version_id)
+        store.test_cases.pop(version_id, None)
+    return 204, None
+
+def _list_versions(store, match, query, body):
+    suite_id = int(match.group('suite'))
+    if suite_id not in store.test_suites:
+        return 404, {'message': 'not found'}
+    versions = [v for v in store.test_suite_versions.values() if v['test_suite_id'] == suite_id]
+    return 200, ('test_suite_versions', versions)
+
+def _create_version(store, match, query, body):
+    suite_id = int(match.group('suite'))
+    if suite_id not in store.test_suites:
+        return 404, {'message': 'not found'}
+    form = parse_form(body, 'test_suite_version')
+    version = {'id': store.next_id(), 'test_suite_id': suite_id, 'status': 'editing'}
+    version.update(form)
+    version['updated_at'] = datetime.now().isoformat()
+    #QFと同じく、最新のバージョンのテストケースを新しいバージョンにコピーする
+    previous = [v['id'] for v in store.test_suite_versions.values() if v['test_suite_id'] == suite_id]
+    store.test_suite_versions[version['id']] = version
+    store.test_cases[version['id']] = []
+    if previous:
+        for case in store.test_cases.get(max(previous), []):
+            copied = dict(case, id=store.next_id(), test_suite_version_id=version['id'])
+            store.test_cases[version['id']].append(copied)
+    return 201, version
+
+def _update_version(store, match, query, body):
+    version = store.test_suite_versions.get(int(match.group('version')))
+    if version is None:
+        return 404, {'message': 'not found'}
+    version.update(parse_form(body, 'test_suite_version'))
+    version['updated_at'] = datetime.now().isoformat()
+    return 200, version
+
+def _list_test_cases(store, match, query, body):
+    version_id = int(match.group('version'))
+    if version_id not in store.test_cases:
+        return 404, {'message': 'not found'}
+    return 200, ('test_cases', list(store.test_cases[version_id]))
+
+def _create_test_case(store, match, query, body):
+    version_id = int(match.group('version'))
+    if version_id not in store.test_cases:
+        return 404, {'message': 'not found'}
+    form = parse_form(body, 'test_case')
+    case = {'id': store.next_id(), 'test_suite_version_id': version_id}
+    case.update(form)
+    if 'no' in case:
+        case['no'] = int(case['no'])
+    store.test_cases[version_id].append(case)
+    return 201, case
+
+def _update_test_case(store, match, query, body):
+    case = _find_test_case(store, match)
+    if case is None:
+        return 404, {'message': 'not found'}
+    form = parse_form(body, 'test_case')
+    if 'no' in form:
+        form['no'] = int(form['no'])
+    case.update(form)
+    return 200, case
+
+def _delete_test_case(store, match, query, body):
+    case = _find_test_case(store, match)
+    if case is None:
+        return 404, {'message': 'not found'}
+    store.test_cases[case['test_suite_version_id']].remove(case)
+    return 204, None
+
+def _find_test_case(store, match):
+    case_id = int(match.group('case'))
+    for case in store.test_cases.get(int(match.group('version')), []):
+        if case['id'] == case_id:
+            return case
+    return None
+
+def _list_users(store, match, query, body):
+    return 200, ('users', list(store.users))
+
+def _list_test_phases(store, match, query, body):
+    return 200, ('test_phases', [dict(p, test_suite_assignments=list(p['test_suite_assignments'])) for p in store.test_phases.values()])
+
+def _find_assignment(store, match):
+    assignment = store.test_suite_assignments.get(int(match.group('assignment')))
+    if assignment is None or assignment['test_phase_id'] != int(match.group('phase')):
+        return None
+    return assignment
+
+def _find_cycle(store, match):
+    if _find_assignment(store, match) is None:
+        return None
+    cycle = store.test_cycles.get(int(match.group('cycle')))
+    if cycle is None or cycle['test_suite_assignment_id'] != int(match.group('assignment')):
+        return None
+    return cycle
+
+def _list_assignments(store, match, query, body):
+    phase_id = int(match.group('phase'))
+    if phase_id not in store.test_phases:
+        return 404, {'message': 'not found'}
+    return 200, ('test_suite_assignments', [a for a in store.test_suite_assignments.values() if a['test_phase_id'] == phase_id])
+
+def _list_test_cycles(store, match, query, body):
+    assignment = _find_assignment(store, match)
+    if assignment is None:
+        return 404, {'message': 'not found'}
+    return 200, ('test_cycles', [c for c in store.test_cycles.values() if c['test_suite_assignment_id'] == assignment['id']])
+
+def _create_test_cycle(store, match, query, body):
+    assignment = _find_assignment(store, match)
+    if assignment is None:
+        return 404, {'message': 'not found'}
+    return 201, store.create_cycle(assignment['id'], parse_form(body, 'test_cycle'))
+
+# テストサイクルのCSV（テストケースと最新のテスト結果）
+def _download_test_cycle_csv(store, match, query, body):
+    cycle = _find_cycle(store, match)
+    if cycle is None:
+        return 404, {'message': 'not found'}
+    assignment = store.test_suite_assignments[cycle['test_suite_assignment_id']]
+    cases = store.test_cases.get(assignment['test_suite_version_id'], [])
+    latest = {}
+    for result in store.test_results[cycle['id']]:
+        latest[result.get('test_case_no')] = result
+    categories = sorted({k for case in cases for k in case if k.startswith('category')}, key=lambda k: int(k[len('category'):]))
+
+    f = io.StringIO(newline='')
+    writer = csv.writer(f)
+    writer.writerow(['No', '優先度'] + categories + ['結果', '実行者', '実行日時'])
+    for case in cases:
+        result = latest.get(case['no'], {})
+        writer.writerow([case['no'], case.get('priority', '')] + [case.get(k, '') for k in categories]
+                        + [result.get('result', ''), result.get('user_id', ''), result.get('executed_at', '')])
+    return 200, f.getvalue().encode('utf_8_sig')
+
+def _list_test_results(store, match, query, body):
+    cycle = _find_cycle(store, match)
+    if cycle is None:
+        return 404, {'message': 'not found'}
+    return 200, ('test_results', list(store.test_results[cycle['id']]))
+
+def _create_test_result(store, match, query, body):
+    cycle = _find_cycle(store, match)
+    if cycle is None:
+        return 404, {'message': 'not found'}
+    return 201, store.create_result(cycle, parse_form(body, 'test_result'))
+
+ROUTES = [
+    ('GET', r'current_project', _current_project),
+    ('GET', r'test_suites', _list_test_suites),
+    ('POST', r'test_suites', _create_test_suite),
+    ('PATCH', r'test_suites/(?P<suite>\d+)', _update_test_suite),
+    ('DELETE', r'test_suites/(?P<suite>\d+)', _delete_test_suite),
+    ('GET', r'test_suites/(?P<suite>\d+)/test_suite_versions', _list_versions),
+    ('POST', r'test_suites/(?P<suite>\d+)/test_suite_versions', _create_version),
+    ('PATCH', r'test_suites/(?P<suite>\d+)/test_suite_versions/(?P<version>\d+)', _update_version),
+    ('GET', r'test_suites/(?P<suite>\d+)/test_suite_versions/(?P<version>\d+)/test_cases', _list_test_cases),
+    ('POST', r'test_suites/(?P<suite>\d+)/test_suite_versions/(?P<version>\d+)/test_cases', _create_test_case),
+    ('PATCH', r'test_suites/(?P<suite>\d+)/test_suite_versions/(?P<version>\d+)/test_cases/(?P<case>\d+)', _update_test_case),
+    ('DELETE', r'test_suites/(?P<suite>\d+)/test_suite_versions/(?P<version>\d+)/test_cases/(?P<case>\d+)', _delete_test_case),
+    ('GET', r'users', _list_users),
+    ('GET', r'test_phases', _list_test_phases),
+    ('GET', r'test_phases/(?P<phase>\d+)/test_suite_assignments', _list_assignments),
+    ('GET', r'test_phases/(?P<phase>\d+)/test_suite_assignments/(?P<assignment>\d+)/test_cycles', _list_test_cycles),
+    ('POST', r'test_phases/(?P<phase>\d+)/test_suite_assignments/(?P<assignment>\d+)/test_cycles', _create_test_cycle),
+    ('GET', r'test_phases/(?P<phase>\d+)/test_suite_assignments/(?P<assignment>\d+)/test_cycles/(?P<cycle>\d+)\.csv', _download_test_cycle_csv),
+    ('GET', r'test_phases/(?P<phase>\d+)/test_suite_assignments/(?P<assignment>\d+)/test_cycles/(?P<cycle>\d+)/test_results', _list_test_results),
+    ('POST', r'test_phases/(?P<phase>\d+)/test_suite_assignments/(?P<assignment>\d+)/test_cycles/(?P<cycle>\d+)/test_results', _create_test_result),
+]
+_COMPILED_ROUTES = [(method, re.compile(pattern + r'$'), handler) for method, pattern, handler in ROUTES]
+
+# -----------------------------------------------------------
+# モックサーバのリクエストハンドラ
+# -----------------------------------------------------------
+class MockQFHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    #ヘッダと本文をまとめて送信する（遅延ACKによる待ちを避ける）
+    disable_nagle_algorithm = True
+    wbufsize = 64 * 1024
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PATCH(self):
+        self._dispatch('PATCH')
+
+    def do_DELETE(self):
+        self._dispatch('DELETE')
+
+    def _dispatch(self, method):
+        server = self.server
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length > 0 else b''
+        split = urlsplit(self.path)
+        query = dict(parse_qsl(split.query))
+        server.count_request(method)
+        if server.latency > 0:
+            time.sleep(server.latency)
+
+        if not split.path.startswith(API_PREFIX):
+            return self._send(404, {'message': 'not found'})
+        if query.get('api_key') != server.api_key:
+            return self._send(401, {'message': 'invalid api key'})
+        #送信制限を超えた場合は429を返す
+        wait = server.limit_rate()
+        if wait > 0:
+            return self._send(429, {'message': 'too many requests'}, {'Retry-After': str(math.ceil(wait))})
+        #エラーを注入する（処理は行わない）
+        if server.inject_error():
+            return self._send(server.error_status, {'message': 'injected error'}, {'Retry-After': '0'})
+        path = split.path[len(API_PREFIX):].rstrip('/')
+
+        for route_method, pattern, handler in _COMPILED_ROUTES:
+            match = pattern.match(path)
+            if match is None or route_method != method:
+                continue
+            with server.store.lock:
+                status, content = handler(server.store, match, query, body)
+            if isinstance(content, tuple):
+                content = self._paginate(split.path, query, *content)
+            return self._send(status, content)
+        return self._send(404, {'message': 'not found'})
+
+    # -----------------------------------------------------------
+    # 一覧をページ分割する（next_url、total_pagesを付与する）
+    # -----------------------------------------------------------
+    def _paginate(self, path, query, content_name, items):
+        per_page = self.server.per_page
+        page = max(1, int(query.get('page', 1)))
+        total_pages = (len(items) + per_page - 1) // per_page
+        next_url = None
+        if page < total_pages:
+            next_query = dict(query)
+            next_query['page'] = page + 1
+            next_url = self.server.origin + path + '?' + urlencode(next_query)
+        return {
+            content_name: items[(page - 1) * per_page: page * per_page],
+            'current_page': page,
+            'total_pages': total_pages,
+            'total_count': len(items),
+            'next_url': next_url,
+        }
+
+    def _send(self, status, content, headers=None):
+        if isinstance(content, bytes):
+            #CSVのダウンロード
+            data = content
+            content_type = 'text/csv; charset=utf-8'
+        else:
+            data = b'' if content is None else json.dumps(content, ensure_ascii=False).encode('utf-8')
+            content_type = 'application/json; charset=utf-8'
+        headers = dict(headers or {})
+        if self.command == 'GET' and status == 200 and self.server.etag:
+            #内容が変わっていない場合は304を返す（条件付きGET）
+            etag = '"' + hashlib.sha1(data).hexdigest() + '"'
+            headers['ETag'] = etag
+            if self.headers.get('If-None-Match') == etag:
+                self.server.count_status(304)
+                self.send_response(304)
+                self.send_header('ETag', etag)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+        self.server.count_status(status)
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+# -----------------------------------------------------------
+# QualityForward APIのモックサーバ
+#
+# Parameters:
+#  api_key（str）：受け付けるAPIキー
+#  latency（float）：応答ごとの遅延秒数
+#  per_page（int）：1ページあたりの件数
+#  host（str）：待ち受けるホスト
+#  port（int）：待ち受けるポート（0の場合は空きポート）
+#  rate_limit（float）：1秒あたりに受け付けるリクエスト数（Noneの場合は制限しない）
+#  burst（int）：連続して受け付けるリクエスト数
+#  error_rate（float）：エラーを返す割合（0〜1）
+#  error_status（int）：エラーを返す時のステータスコード
+#  seed（int）：エラーを注入する乱数のシード
+#  etag（bool）：GETの応答にETagを付け、条件付きGETに304を返すかどうか
+# -----------------------------------------------------------
+class MockQFServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, api_key='mock', latency=0.0, per_page=DEFAULT_PER_PAGE, host='127.0.0.1', port=0,
+                 rate_limit=None, burst=1, error_rate=0.0, error_status=DEFAULT_ERROR_STATUS, seed=0, etag=True):
+        super().__init__((host, port), MockQFHandler)
+        self.api_key = api_key
+        self.latency = latency
+        self.per_page = per_page
+        self.rate_limit = rate_limit
+        self.burst = burst
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.etag = etag
+        self.store = MockQFStore()
+        self.origin = 'http://' + host + ':' + str(self.server_address[1])
+        self.base_url = self.origin + API_PREFIX
+        self._counter_lock = threading.Lock()
+        self.request_counts = {}
+        self.status_counts = {}
+        self._random = random.Random(seed)
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._thread = None
+
+    def count_request(self, method):
+        with self._counter_lock:
+            self.request_counts[method] = self.request_counts.get(method, 0) + 1
+
+    def count_status(self, status):
+        with self._counter_lock:
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    # -----------------------------------------------------------
+    # 送信制限（トークンバケット）を確認する
+    #
+    # Returns:
+    #  受け付けられるまでの秒数（0の場合は受け付ける）
+    # -----------------------------------------------------------
+    def limit_rate(self):
+        if self.rate_limit is None:
+            return 0.0
+        with self._counter_lock:
+            now = time.monotonic()
+            self._tokens = min(float(self.burst), self._tokens + (now - self._updated) * self.rate_limit)
+            self._updated = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate_limit
+
+    def inject_error(self):
+        if self.error_rate <= 0:
+            return False
+        with self._counter_lock:
+            return self._random.random() < self.error_rate
+
+    def handle_error(self, request, client_address):
+        #クライアントが強制終了した場合の切断は無視する
+        if isinstance(sys.exc_info()[1], ConnectionError):
+            return
+        super().handle_error(request, client_address)
+
+    def total_requests(self):
+        with self._counter_lock:
+            return sum(self.request_counts.values())
+
+    def start(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+if __name__ == '__main__':
+    # コマンドラインオプション処理
+    import argparse
+    ap = argparse.ArgumentParser(description='QualityForward APIのモックサーバを起動する。')
+    ap.add_argument("-p", "--port", action='store', type=int, default=8080, help="待ち受けるポート")
+    ap.add_argument("-a", "--api_key", action='store', default='mock', help="受け付けるAPIキー")
+    ap.add_argument("-l", "--latency", action='store', type=float, default=0.0, help="応答ごとの遅延秒数")
+    ap.add_argument("-r", "--rate_limit", action='store', type=float, help="1秒あたりに受け付けるリクエスト数")
+    ap.add_argument("-b", "--burst", action='store', type=int, default=1, help="連続して受け付けるリクエスト数")
+    ap.add_argument("-e", "--error_rate", action='store', type=float, default=0.0, help="エラーを返す割合（0〜1）")
+    ap.add_argument("--seed_data", action='store_true', help="性能測定用のデータを作成する")
+    args = ap.parse_args()
+
+    server = MockQFServer(api_key=args.api_key, latency=args.latency, port=args.port,
+                          rate_limit=args.rate_limit, burst=args.burst, error_rate=args.error_rate)
+    if args.seed_data:
+        server.store.seed()
+    print('モックサーバを起動しました: ' + server.base_url)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        server.server_close()
@@ -1,3 +1,5 @@
+import argparse
+import asyncio
 import sys
 
 from requests.packages import urllib3
@@ -5,15 +7,64 @@ from requests.packages.urllib3.exceptions import InsecureRequestWarning
 
 from modules import api, result
 
+CONFIG_PATH = "config.ini"
+CONFIG_SECTION = "QF_API"
+DEFAULT_XML_PATH = "results/result.xml"
+
+
+async def post_results_async(xml_paths: list) -> None:
+    try:
+        from modules import async_api
+
+        async_api.import_aiohttp()
+    except ModuleNotFoundError as err:
+        print(
+            "「"
+            + err.name
+            + "」のモジュールが見つかりません。以下のコマンドラインでインストールしてください。"
+        )
+        print(">> pip install " + err.name)
+        sys.exit(1)
+
+    async with async_api.AsyncAPI(
+        config_path=CONFIG_PATH, config_section=CONFIG_SECTION
+    ) as qf_api:
+        try:
+            test_cycle_id = await qf_api.create_test_cycle()
+            results = (r.to_dict() for r in result.iter_results(xml_paths))
+            await qf_api.post_test_results(results=results, test_cycle_id=test_cycle_id)
+        finally:
+            qf_api.report_client_stats()
+
+
 if __name__ == "__main__":
     urllib3.disable_warnings(InsecureRequestWarning)
 
+    parser = argparse.ArgumentParser(
+        description="JUnit XMLのテスト結果をQFに投入する。"
+    )
+    parser.add_argument("xml_paths", nargs="*", help="JUnit XMLのパス")
+    parser.add_argument(
+        "--async",
+        dest="use_async",
+        action="store_true",
+        help="asyncio（aiohttp）のクライアントで送信する",
+    )
+    args = parser.parse_args()
+    xml_paths = args.xml_paths or [DEFAULT_XML_PATH]
+
     try:
-        qf_api = api.API(config_path="config.ini", config_section="QF_API")
+        if args.use_async:
+            asyncio.run(post_results_async(xml_paths))
+        else:
+            qf_api = api.API(config_path=CONFIG_PATH, config_section=CONFIG_SECTION)
 
-        test_cycle_id = qf_api.create_test_cycle()
-        results = result.parse_xml("results/result.xml")
-        qf_api.post_test_results(results=results, test_cycle_id=test_cycle_id)
+            try:
+                test_cycle_id = qf_api.create_test_cycle()
+                results = (r.to_dict() for r in result.iter_results(xml_paths))
+                qf_api.post_test_results(results=results, test_cycle_id=test_cycle_id)
+            finally:
+                qf_api.report_client_stats()
 
     except Exception as e:
         print(e)
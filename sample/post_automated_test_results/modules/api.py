@@ -1,16 +1,45 @@
 import configparser
 import json
-import time
+import os
+import sys
+from collections.abc import Iterable, Sized
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from datetime import datetime
+from typing import Optional
 
 import requests
 
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common")
+)
+import qf_client  # noqa: E402
+import qf_mirror  # noqa: E402
+import qf_pages  # noqa: E402
+
+from . import case_index  # noqa: E402
+
 
 class API:
     def __init__(self, config_path: str, config_section: str) -> None:
+        config = self._load_config(config_path, config_section)
+
+        qf_client.configure(
+            pool_size=self.pool_size,
+            verify=False,
+            rate=config.getfloat("rate_limit", fallback=qf_client.DEFAULT_RATE),
+            burst=config.getint("rate_burst", fallback=qf_client.DEFAULT_BURST),
+        )
+
+    def _load_config(
+        self, config_path: str, config_section: str
+    ) -> configparser.SectionProxy:
         self._STATUS_OK: int = 200
         self._STATUS_CREATED: int = 201
         self._CASE_NOT_FOUND: int = -1
+        self._DEFAULT_MAX_WORKERS: int = 4
+        self._DEFAULT_METRICS_DIR: str = "metrics"
+        self._DEFAULT_CASE_INDEX_MAX_AGE: float = 600.0
+        self._METRICS_TOOL: str = "post_automated_test_results"
 
         config = configparser.ConfigParser()
         config.read(config_path, encoding="utf-8")
@@ -23,19 +52,37 @@ class API:
         self.test_suites_version_id: int = int(config["test_suites_version_id"])
         self.test_phase_id: int = int(config["test_phase_id"])
         self.test_suite_assignment_id: int = int(config["test_suite_assignment_id"])
+        # テストメソッド名と照合するテストケースの項目（未設定の場合は全項目）
+        self.match_field: Optional[str] = config.get("match_field", fallback="") or None
+        self.max_workers: int = config.getint(
+            "max_workers", fallback=self._DEFAULT_MAX_WORKERS
+        )
+        self.pool_size: int = config.getint(
+            "pool_size", fallback=qf_client.DEFAULT_POOL_SIZE
+        )
+        # 計測結果（JSON・Prometheus）の出力先（空の場合は出力しない）
+        self.metrics_dir: Optional[str] = (
+            config.get("metrics_dir", fallback=self._DEFAULT_METRICS_DIR) or None
+        )
+        # テストケースの索引のキャッシュ（空の場合は毎回全ページを取得する）
+        self.case_index_path: Optional[str] = (
+            config.get("case_index_path", fallback="") or None
+        )
+        self.case_index_max_age: float = config.getfloat(
+            "case_index_max_age", fallback=self._DEFAULT_CASE_INDEX_MAX_AGE
+        )
+        # project_mirror/sync.pyで同期したミラー（空の場合は使わない）
+        self.mirror_path: Optional[str] = config.get("mirror_path", fallback="") or None
+        self.mirror_max_age: float = config.getfloat(
+            "mirror_max_age", fallback=qf_mirror.DEFAULT_MAX_AGE
+        )
+        return config
 
-    def get_users(self) -> dict:
-        qf_api_url = self.base_url + "users" + "?api_key=" + self.api_key
-
-        res = requests.get(qf_api_url, verify=False)
-        time.sleep(1)
-        if res.status_code == 200:
-            return json.loads(res.text)
-        else:
-            raise Exception("ユーザ取得に失敗しました")
+    def _users_url(self) -> str:
+        return self.base_url + "users" + "?api_key=" + self.api_key
 
-    def create_test_cycle(self) -> int:
-        qf_api_url = (
+    def _test_cycles_url(self) -> str:
+        return (
             self.base_url
             + "test_phases/"
             + str(self.test_phase_id)
@@ -46,9 +93,44 @@ class API:
             + self.api_key
         )
 
-        now = datetime.now()
+    def _test_suite_versions_url(self) -> str:
+        return (
+            self.base_url
+            + "test_suites/"
+            + str(self.test_suites_id)
+            + "/test_suite_versions"
+            + "?api_key="
+            + self.api_key
+        )
 
-        data_cycle = {
+    def _test_cases_url(self) -> str:
+        return (
+            self.base_url
+            + "test_suites/"
+            + str(self.test_suites_id)
+            + "/test_suite_versions/"
+            + str(self.test_suites_version_id)
+            + "/test_cases"
+            + "?api_key="
+            + self.api_key
+        )
+
+    def _test_results_url(self, test_cycle_id: int) -> str:
+        return (
+            self.base_url
+            + "test_phases/"
+            + str(self.test_phase_id)
+            + "/test_suite_assignments/"
+            + str(self.test_suite_assignment_id)
+            + "/test_cycles/"
+            + str(test_cycle_id)
+            + "/test_results?api_key="
+            + self.api_key
+        )
+
+    def _test_cycle_data(self) -> dict:
+        now = datetime.now()
+        return {
             "test_cycle[name]": now.strftime("自動テストサイクル %Y%m%d %H-%M-%S"),
             "test_cycle[target_priorities][]": "A",
             "test_cycle[start_on]": now,
@@ -56,13 +138,32 @@ class API:
             "test_cycle[status]": "waiting_for_review",
         }
 
-        res = requests.post(
-            qf_api_url,
+    def _test_result_data(self, test_case_no: int, result: dict) -> dict:
+        return {
+            "test_result[test_case_no]": test_case_no,
+            "test_result[result]": result["result"],
+            "test_result[user_id]": self.user_id,
+            "test_result[executed_at]": datetime.now(),
+            "test_result[content1]": result["file_path"],
+            "test_result[content2]": result["time"],
+            "test_result[content3]": result["message"],
+        }
+
+    def get_users(self) -> dict:
+        res = qf_client.get(self._users_url())
+        if res.status_code == 200:
+            return json.loads(res.text)
+        else:
+            raise Exception("ユーザ取得に失敗しました")
+
+    def create_test_cycle(self) -> int:
+        data_cycle = self._test_cycle_data()
+
+        res = qf_client.post(
+            self._test_cycles_url(),
             headers={"Content-Type": "application/x-www-form-urlencoded"},
             data=data_cycle,
-            verify=False,
         )
-        time.sleep(1)
 
         if res.status_code == self._STATUS_CREATED:
             print("テストサイクルを作成しました: " + data_cycle["test_cycle[name]"])
@@ -70,25 +171,106 @@ class API:
         else:
             raise Exception("テストサイクル作成に失敗しました")
 
-    def get_test_cases(self) -> dict:
-        qf_api_url = (
-            self.base_url
-            + "test_suites/"
-            + str(self.test_suites_id)
-            + "/test_suite_versions/"
-            + str(self.test_suites_version_id)
-            + "/test_cases"
-            + "?api_key="
-            + self.api_key
+    def get_test_cases(self) -> list:
+        # 2ページ目以降は並列で取得する
+        test_cases = qf_pages.get_pages(
+            self._test_cases_url(), "test_cases", self.max_workers
         )
+        if test_cases is None:
+            raise Exception("テストケース取得に失敗しました")
+        return test_cases
 
-        res = requests.get(qf_api_url, verify=False)
-        time.sleep(1)
+    # テストメソッド名 → テストケース番号の索引を取得する
+    # バージョンが利用可で、状態・更新日時・件数が前回と同じであれば、保存した索引を使い残りのページは取得しない
+    def load_test_case_index(self) -> dict:
+        index = self._mirror_case_index()
+        if index is not None:
+            return index
+        url = self._test_cases_url()
+        first_page = qf_pages.get_page(url)
+        if first_page is None:
+            raise Exception("テストケース取得に失敗しました")
+        fingerprint = None
+        if self.case_index_path is not None:
+            versions = qf_pages.get_pages(
+                self._test_suite_versions_url(),
+                "test_suite_versions",
+                self.max_workers,
+            )
+            fingerprint = self._case_index_fingerprint(versions, first_page)
+        index = self._lookup_case_index(fingerprint)
+        if index is not None:
+            return index
 
-        if res.status_code == self._STATUS_OK:
-            return json.loads(res.text)["test_cases"]
-        else:
+        test_cases = qf_pages.get_pages(url, "test_cases", self.max_workers, first_page)
+        if test_cases is None:
             raise Exception("テストケース取得に失敗しました")
+        return self._store_case_index(
+            fingerprint, self.build_test_case_index(test_cases)
+        )
+
+    # ミラーが最新であれば、APIを使わずにテストケースを取得する
+    def _mirror_case_index(self) -> Optional[dict]:
+        mirror = qf_mirror.open_mirror(
+            self.mirror_path, self.base_url, self.api_key, self.mirror_max_age
+        )
+        if mirror is None:
+            return None
+        try:
+            test_cases = mirror.list("test_cases", self.test_suites_version_id)
+        finally:
+            mirror.close()
+        if test_cases is None:
+            return None
+        index = self.build_test_case_index(test_cases)
+        print("テストケースの索引をミラーから読み込みました: " + str(len(index)) + "件")
+        return index
+
+    def _case_index_fingerprint(
+        self, versions: Optional[list], first_page: dict
+    ) -> Optional[str]:
+        version = None
+        for candidate in versions or []:
+            if candidate.get("id") == self.test_suites_version_id:
+                version = candidate
+        return case_index.version_fingerprint(version, first_page)
+
+    def _lookup_case_index(self, fingerprint: Optional[str]) -> Optional[dict]:
+        if self.case_index_path is None or fingerprint is None:
+            return None
+        cache = case_index.CaseIndexCache(self.case_index_path, self.case_index_max_age)
+        try:
+            index = cache.lookup(
+                case_index.cache_scope(self.base_url, self.api_key),
+                self.test_suites_version_id,
+                self.match_field,
+                fingerprint,
+            )
+        finally:
+            cache.close()
+        if index is not None:
+            print(
+                "テストケースの索引をキャッシュから読み込みました: "
+                + str(len(index))
+                + "件"
+            )
+        return index
+
+    def _store_case_index(self, fingerprint: Optional[str], index: dict) -> dict:
+        if self.case_index_path is None or fingerprint is None:
+            return index
+        cache = case_index.CaseIndexCache(self.case_index_path, self.case_index_max_age)
+        try:
+            cache.store(
+                case_index.cache_scope(self.base_url, self.api_key),
+                self.test_suites_version_id,
+                self.match_field,
+                fingerprint,
+                index,
+            )
+        finally:
+            cache.close()
+        return index
 
     def get_test_case_no_from_id(self, test_cases: dict, test_id: str) -> int:
         for case in test_cases:
@@ -97,49 +279,91 @@ class API:
         else:
             return self._CASE_NOT_FOUND
 
-    def post_test_results(self, results: dict, test_cycle_id: int) -> None:
-        qf_api_url = (
-            self.base_url
-            + "test_phases/"
-            + str(self.test_phase_id)
-            + "/test_suite_assignments/"
-            + str(self.test_suite_assignment_id)
-            + "/test_cycles/"
-            + str(test_cycle_id)
-            + "/test_results?api_key="
-            + self.api_key
+    def build_test_case_index(self, test_cases: list) -> dict:
+        index: dict = {}
+        for case in test_cases:
+            if self.match_field is None:
+                keys = [value for value in case.values() if isinstance(value, str)]
+            else:
+                keys = [case.get(self.match_field)]
+            for key in keys:
+                if key is not None:
+                    # 同じ値を持つテストケースが複数ある場合は最初のケースを使う
+                    index.setdefault(key, case["no"])
+        return index
+
+    def _post_test_result(
+        self, qf_api_url: str, test_case_no: int, result: dict
+    ) -> requests.Response:
+        return qf_client.post(
+            qf_api_url,
+            headers={"Content-Type": "application/x-www-form-urlencoded"},
+            data=self._test_result_data(test_case_no, result),
         )
 
-        test_cases = self.get_test_cases()
+    def report_client_stats(self) -> None:
+        # 通信統計を表示し、計測結果を出力する（metrics_dirが空の場合は表示のみ）
+        qf_client.print_stats()
+        qf_client.export_metrics(self.metrics_dir, self._METRICS_TOOL)
 
-        for i, result in enumerate(results):
-            test_case_no = self.get_test_case_no_from_id(
-                test_cases=test_cases,
-                test_id=result["test_method_name"],
-            )
+    def post_test_results(self, results: Iterable[dict], test_cycle_id: int) -> None:
+        qf_api_url = self._test_results_url(test_cycle_id)
+
+        test_case_index = self.load_test_case_index()
+        total = str(len(results)) if isinstance(results, Sized) else "-"
+        done = 0
+        failures: list = []
+        not_found: list = []
+
+        def collect(future: Future, result: dict) -> None:
+            nonlocal done
+            done += 1
+            try:
+                res = future.result()
+            except Exception as e:
+                failures.append(result["test_method_name"] + " : " + str(e))
+                return
+            if res.status_code == self._STATUS_CREATED:
+                print("テスト結果投入完了 : " + str(done) + " / " + total)
+            else:
+                failures.append(
+                    result["test_method_name"]
+                    + " : status_code "
+                    + str(res.status_code)
+                )
 
-            if test_case_no != self._CASE_NOT_FOUND:
-                data = {
-                    "test_result[test_case_no]": test_case_no,
-                    "test_result[result]": result["result"],
-                    "test_result[user_id]": self.user_id,
-                    "test_result[executed_at]": datetime.now(),
-                    "test_result[content1]": result["file_path"],
-                    "test_result[content2]": result["time"],
-                    "test_result[content3]": result["message"],
-                }
-
-                res = requests.post(
-                    qf_api_url,
-                    headers={"Content-Type": "application/x-www-form-urlencoded"},
-                    data=data,
-                    verify=False,
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            pending: dict = {}
+            for result in results:
+                test_case_no = test_case_index.get(
+                    result["test_method_name"], self._CASE_NOT_FOUND
                 )
-                time.sleep(1)
+                if test_case_no == self._CASE_NOT_FOUND:
+                    not_found.append(result["test_method_name"])
+                    continue
 
-                if res.status_code == self._STATUS_CREATED:
-                    print("テスト結果投入完了 : " + str(i + 1) + " / " + str(len(results)))
-                if res.status_code != self._STATUS_CREATED:
-                    raise Exception("テスト結果作成に失敗しました")
+                # 送信待ちの結果を溜め込まないように、処理中の件数を制限する
+                if len(pending) >= self.max_workers * 2:
+                    completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in completed:
+                        collect(future, pending.pop(future))
+
+                future = executor.submit(
+                    self._post_test_result, qf_api_url, test_case_no, result
+                )
+                pending[future] = result
+
+            for future in list(pending):
+                collect(future, pending.pop(future))
+
+        if len(not_found) > 0:
+            print("テストケースが見つからない結果 : " + str(len(not_found)) + "件")
+
+        if len(failures) > 0:
+            for failure in failures:
+                print("  ▪ " + failure)
+            raise Exception(
+                "テスト結果作成に失敗しました : " + str(len(failures)) + "件"
+            )
 
         print("Done")
@@ -0,0 +1,288 @@
+import asyncio
+import json
+import os
+import sys
+import time
+from collections.abc import Iterable, Sized
+from types import SimpleNamespace
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import urlencode, urlsplit
+
+from .api import API
+
+if TYPE_CHECKING:
+    import aiohttp
+
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "common")
+)
+import qf_client  # noqa: E402
+import qf_metrics  # noqa: E402
+import qf_pages  # noqa: E402
+
+
+# APIと同じ処理をasyncioで行うクライアント
+# コネクション数を制限したaiohttpのセッションを共有し、送信レートはasyncio用のレートリミッターで制限する
+# 429/503を受けた場合は同期版と同じくRetry-Afterに従って全ての送信を待機させてから再送する
+# セッションはイベントループの中で作成するため、async withで使う
+class AsyncAPI(API):
+    def __init__(self, config_path: str, config_section: str) -> None:
+        # aiohttpはasyncio版でのみ使うため（extrasのasync）、インスタンスの作成時に読み込む
+        self.aiohttp = import_aiohttp()
+        config = self._load_config(config_path, config_section)
+        self.verify: bool = False
+        self.max_retries: int = qf_client.DEFAULT_MAX_RETRIES
+        self.limiter = qf_client.AsyncRateLimiter(
+            config.getfloat("rate_limit", fallback=qf_client.DEFAULT_RATE),
+            config.getint("rate_burst", fallback=qf_client.DEFAULT_BURST),
+        )
+        self.stats = qf_client.ClientStats()
+        self.metrics = qf_metrics.Metrics()
+        self.session: Optional["aiohttp.ClientSession"] = None
+
+    async def __aenter__(self) -> "AsyncAPI":
+        # 新規に開いたコネクション数を同期版と同じ統計情報に記録する
+        aiohttp = self.aiohttp
+        trace = aiohttp.TraceConfig()
+        trace.on_request_start.append(self._remember_host)
+        trace.on_connection_create_end.append(self._count_connection)
+        connector = aiohttp.TCPConnector(
+            limit=self.pool_size, limit_per_host=self.pool_size, ssl=self.verify
+        )
+        self.session = aiohttp.ClientSession(
+            connector=connector,
+            headers={"Accept-Encoding": qf_client.ACCEPT_ENCODING},
+            trace_configs=[trace],
+        )
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.close()
+
+    async def close(self) -> None:
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+    async def _remember_host(self, session, context, params) -> None:
+        context.host = params.url.host
+
+    async def _count_connection(self, session, context, params) -> None:
+        self.stats.count_connection(context.host)
+
+    async def _request(self, method: str, url: str, **kwargs) -> SimpleNamespace:
+        host = urlsplit(url).hostname
+        attempt = 0
+        while True:
+            self.metrics.add_throttled(await self.limiter.acquire())
+            self.stats.count_request(host)
+            start = time.perf_counter()
+            try:
+                async with self.session.request(method, url, **kwargs) as res:
+                    body = await res.read()
+            except self.aiohttp.ClientError:
+                self.metrics.observe(
+                    method, url, qf_metrics.STATUS_ERROR, time.perf_counter() - start
+                )
+                raise
+            self.metrics.observe(
+                method,
+                url,
+                res.status,
+                time.perf_counter() - start,
+                res.content_length if res.content_length is not None else len(body),
+                (
+                    len(urlencode(kwargs["data"]).encode("utf-8"))
+                    if "data" in kwargs
+                    else 0
+                ),
+            )
+            retry = (
+                res.status in qf_client.RETRY_STATUS_CODES
+                and attempt < self.max_retries
+            )
+            if not retry:
+                break
+            # 送信制限を受けた場合は待機してから再送する
+            self.metrics.count_retry(method, url)
+            delay = qf_client.retry_after_seconds(res)
+            if delay is None:
+                delay = qf_client.DEFAULT_BACKOFF * (2**attempt)
+            self.limiter.backoff(delay)
+            attempt += 1
+        if res.status not in qf_client.RETRY_STATUS_CODES:
+            self.limiter.recover()
+        return SimpleNamespace(status_code=res.status, text=body.decode("utf-8"))
+
+    async def _post_form(self, url: str, data: dict) -> SimpleNamespace:
+        # aiohttpは文字列以外の値を送信できないため、requestsと同じくstrに変換する
+        return await self._request(
+            "POST", url, data={key: str(value) for key, value in data.items()}
+        )
+
+    async def get_users(self) -> dict:
+        res = await self._request("GET", self._users_url())
+        if res.status_code == 200:
+            return json.loads(res.text)
+        else:
+            raise Exception("ユーザ取得に失敗しました")
+
+    async def create_test_cycle(self) -> int:
+        data_cycle = self._test_cycle_data()
+
+        res = await self._post_form(self._test_cycles_url(), data_cycle)
+
+        if res.status_code == self._STATUS_CREATED:
+            print("テストサイクルを作成しました: " + data_cycle["test_cycle[name]"])
+            return json.loads(res.text)["id"]
+        else:
+            raise Exception("テストサイクル作成に失敗しました")
+
+    async def _get_page(self, url: str) -> Optional[dict]:
+        res = await self._request("GET", url)
+        if res.status_code != self._STATUS_OK:
+            return None
+        return json.loads(res.text)
+
+    # qf_pages.get_pagesと同じく、1ページ目のtotal_pagesから残りのページを並列で取得する
+    # 結合した結果に重複・欠落がある場合やURLを作成できない場合はnext_urlをたどる
+    async def _get_pages(
+        self, url: str, content_name: str, content: dict
+    ) -> Optional[list]:
+        if not qf_pages.has_next(content):
+            return content[content_name]
+
+        page_urls = None
+        if self.max_workers > 1:
+            page_urls = qf_pages.build_page_urls(url, content)
+        if page_urls is None:
+            return await self._follow_next_urls(content, content_name)
+
+        pages = await asyncio.gather(*(self._get_page(x) for x in page_urls))
+        if any(page is None for page in pages):
+            return None
+        ret = list(content[content_name])
+        for page in pages:
+            ret.extend(page[content_name])
+        if not qf_pages.is_complete(ret, [content] + list(pages)):
+            print("ページの取得中に一覧が変更されました。順番に取得し直します。")
+            return await self._follow_next_urls(await self._get_page(url), content_name)
+        return ret
+
+    async def _follow_next_urls(
+        self, content: Optional[dict], content_name: str
+    ) -> Optional[list]:
+        if content is None:
+            return None
+        ret = list(content[content_name])
+        while qf_pages.has_next(content):
+            content = await self._get_page(content["next_url"])
+            if content is None:
+                return None
+            ret.extend(content[content_name])
+        return ret
+
+    async def get_test_cases(self) -> list:
+        url = self._test_cases_url()
+        first_page = await self._get_page(url)
+        test_cases = None
+        if first_page is not None:
+            test_cases = await self._get_pages(url, "test_cases", first_page)
+        if test_cases is None:
+            raise Exception("テストケース取得に失敗しました")
+        return test_cases
+
+    async def load_test_case_index(self) -> dict:
+        index = self._mirror_case_index()
+        if index is not None:
+            return index
+        url = self._test_cases_url()
+        first_page = await self._get_page(url)
+        if first_page is None:
+            raise Exception("テストケース取得に失敗しました")
+        fingerprint = None
+        if self.case_index_path is not None:
+            versions_url = self._test_suite_versions_url()
+            versions = await self._get_page(versions_url)
+            if versions is not None:
+                versions = await self._get_pages(
+                    versions_url, "test_suite_versions", versions
+                )
+            fingerprint = self._case_index_fingerprint(versions, first_page)
+        index = self._lookup_case_index(fingerprint)
+        if index is not None:
+            return index
+
+        test_cases = await self._get_pages(url, "test_cases", first_page)
+        if test_cases is None:
+            raise Exception("テストケース取得に失敗しました")
+        return self._store_case_index(
+            fingerprint, self.build_test_case_index(test_cases)
+        )
+
+    def report_client_stats(self) -> None:
+        # 通信統計を表示し、計測結果を出力する（metrics_dirが空の場合は表示のみ）
+        qf_client.print_stats(self.stats)
+        qf_client.export_metrics(self.metrics_dir, self._METRICS_TOOL, self.metrics)
+
+    async def post_test_results(
+        self, results: Iterable[dict], test_cycle_id: int
+    ) -> None:
+        qf_api_url = self._test_results_url(test_cycle_id)
+
+        test_case_index = await self.load_test_case_index()
+        total = str(len(results)) if isinstance(results, Sized) else "-"
+        done = 0
+        failures: list = []
+        not_found: list = []
+        pending = iter(results)
+
+        # max_workers個のコルーチンが結果を1件ずつ取り出して送信する
+        # （結果を全て読み込んでからタスクを作らないため、メモリ使用量が件数に比例しない）
+        async def worker() -> None:
+            nonlocal done
+            for result in pending:
+                test_case_no = test_case_index.get(
+                    result["test_method_name"], self._CASE_NOT_FOUND
+                )
+                if test_case_no == self._CASE_NOT_FOUND:
+                    not_found.append(result["test_method_name"])
+                    continue
+
+                try:
+                    res = await self._post_form(
+                        qf_api_url, self._test_result_data(test_case_no, result)
+                    )
+                except Exception as e:
+                    done += 1
+                    failures.append(result["test_method_name"] + " : " + str(e))
+                    continue
+                done += 1
+                if res.status_code == self._STATUS_CREATED:
+                    print("テスト結果投入完了 : " + str(done) + " / " + total)
+                else:
+                    failures.append(
+                        result["test_method_name"]
+                        + " : status_code "
+                        + str(res.status_code)
+                    )
+
+        await asyncio.gather(*(worker() for _ in range(max(1, self.max_workers))))
+
+        if len(not_found) > 0:
+            print("テストケースが見つからない結果 : " + str(len(not_found)) + "件")
+
+        if len(failures) > 0:
+            for failure in failures:
+                print("  ▪ " + failure)
+            raise Exception(
+                "テスト結果作成に失敗しました : " + str(len(failures)) + "件"
+            )
+
+        print("Done")
+
+
+def import_aiohttp():
+    import aiohttp
+
+    return aiohttp
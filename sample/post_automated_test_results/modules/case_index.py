@@ -0,0 +1,94 @@
+import hashlib
+import json
+import sqlite3
+import time
+import zlib
+from typing import Optional
+
+# テストケースを変更できない（索引をキャッシュしてよい）テストスイートバージョンの状態
+AVAILABLE_STATUS = "available"
+
+
+# テストメソッド名 → テストケース番号の索引をテストスイートバージョンごとに保存するキャッシュ（SQLite）
+# 利用可のバージョンはテストケースを変更できないため、バージョンの状態・更新日時と
+# テストケースの件数から作った指紋が保存時と同じであれば、テストケースを取得せずに使う
+# 接続先・APIキーごとに分けて保存し、max_ageを過ぎた索引は使わない
+class CaseIndexCache:
+    def __init__(self, path: str, max_age: float) -> None:
+        self.path = path
+        self.max_age = max_age
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS test_case_indexes ("
+            "scope TEXT NOT NULL, version_id INTEGER NOT NULL, "
+            "match_field TEXT NOT NULL, fingerprint TEXT NOT NULL, "
+            "body BLOB NOT NULL, stored_at REAL NOT NULL, "
+            "PRIMARY KEY (scope, version_id, match_field))"
+        )
+
+    def lookup(
+        self,
+        scope: str,
+        version_id: int,
+        match_field: Optional[str],
+        fingerprint: str,
+    ) -> Optional[dict]:
+        row = self._conn.execute(
+            "SELECT fingerprint, body, stored_at FROM test_case_indexes "
+            "WHERE scope = ? AND version_id = ? AND match_field = ?",
+            (scope, version_id, match_field or ""),
+        ).fetchone()
+        if row is None or row[0] != fingerprint:
+            return None
+        if time.time() - row[2] > self.max_age:
+            return None
+        return json.loads(zlib.decompress(row[1]))
+
+    def store(
+        self,
+        scope: str,
+        version_id: int,
+        match_field: Optional[str],
+        fingerprint: str,
+        index: dict,
+    ) -> None:
+        body = zlib.compress(json.dumps(index, ensure_ascii=False).encode("utf-8"), 1)
+        self._conn.execute(
+            "INSERT OR REPLACE INTO test_case_indexes VALUES (?, ?, ?, ?, ?, ?)",
+            (scope, version_id, match_field or "", fingerprint, body, time.time()),
+        )
+
+    def close(self) -> None:
+        self._conn.close()
+
+
+# 接続先とAPIキーから保存先を分けるキーを作る（APIキーはハッシュ値だけを保存する）
+def cache_scope(base_url: str, api_key: str) -> str:
+    return hashlib.sha256(
+        json.dumps([base_url, api_key], ensure_ascii=False).encode("utf-8")
+    ).hexdigest()
+
+
+# テストスイートバージョンとテストケース一覧の1ページ目から指紋を作る
+# バージョンが見つからない・利用可でない（テストケースを変更できる）場合はNone（キャッシュしない）
+def version_fingerprint(version: Optional[dict], first_page: dict) -> Optional[str]:
+    if version is None or version.get("status") != AVAILABLE_STATUS:
+        return None
+    digest = hashlib.sha1()
+    digest.update(
+        json.dumps(
+            [
+                version.get("id"),
+                version.get("name"),
+                version.get("status"),
+                version.get("updated_at"),
+                first_page.get("total_count"),
+                first_page.get("total_pages"),
+            ],
+            ensure_ascii=False,
+            sort_keys=True,
+        ).encode("utf-8")
+    )
+    return digest.hexdigest()
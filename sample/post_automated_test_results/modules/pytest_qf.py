@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import queue
+import threading
+from typing import Optional
+
+import pytest
+
+from .api import API
+from .result import Result
+
+# pytestの実行中にテスト結果をQFへ投入するプラグイン
+#   python -m pytest -p modules.pytest_qf --qf
+# セッション開始時にテストサイクルを作成し、終わったテストから順にバックグラウンドで投入する
+# （投入の並列数はconfig.iniのmax_workersで制限する）
+# pytest-xdistの場合はコントローラーだけがテストサイクルを作成し、ワーカーの結果をまとめて投入する
+
+_DONE = object()
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    group = parser.getgroup("qualityforward")
+    group.addoption(
+        "--qf",
+        action="store_true",
+        dest="qf_upload",
+        help="テスト結果を実行中にQFへ投入する",
+    )
+    group.addoption(
+        "--qf-config",
+        action="store",
+        dest="qf_config",
+        default="config.ini",
+        help="QFの設定ファイル（既定値：config.ini）",
+    )
+    group.addoption(
+        "--qf-section",
+        action="store",
+        dest="qf_section",
+        default="QF_API",
+        help="設定ファイルのセクション（既定値：QF_API）",
+    )
+
+
+def pytest_configure(config: pytest.Config) -> None:
+    # xdistのワーカーは結果をコントローラーに送るだけで、投入は行わない
+    if not config.getoption("qf_upload") or hasattr(config, "workerinput"):
+        return
+    config.pluginmanager.register(QFReporter(config), "qf_reporter")
+
+
+# TestReport（setup・call・teardown）をまとめて、JUnit XMLと同じ結果にする
+# setupの失敗はerror、callの失敗はfailure、teardownの失敗はerror、skip・xfailはskippedとする
+class _Outcome:
+    def __init__(self, report: pytest.TestReport) -> None:
+        self.name: str = report.nodeid.split("::")[-1]
+        self.file_path: str = report.location[0]
+        self.result: str = "pass"
+        self.message: str = ""
+        self.time: float = 0.0
+
+    def add(self, report: pytest.TestReport) -> None:
+        self.time += getattr(report, "duration", 0.0)
+        if report.passed:
+            return
+        if report.skipped:
+            if self.result == "pass":
+                self.result = "skipped"
+                self.message = _skip_message(report)
+            return
+        if report.when == "call":
+            self.result = "failure"
+        else:
+            self.result = "error"
+        self.message = _failure_message(report)
+
+    def to_result(self) -> Result:
+        return Result(
+            name=self.name,
+            result=self.result,
+            file_path=self.file_path,
+            time=self.time,
+            message=self.message,
+        )
+
+
+def _skip_message(report: pytest.TestReport) -> str:
+    if hasattr(report, "wasxfail"):
+        return "expected test failure" + (
+            ": " + report.wasxfail if report.wasxfail else ""
+        )
+    if isinstance(report.longrepr, tuple) and len(report.longrepr) == 3:
+        return str(report.longrepr[2])
+    return ""
+
+
+def _failure_message(report: pytest.TestReport) -> str:
+    reprcrash = getattr(report.longrepr, "reprcrash", None)
+    if reprcrash is not None:
+        return reprcrash.message
+    return str(report.longrepr).splitlines()[-1] if report.longrepr else ""
+
+
+class QFReporter:
+    def __init__(self, config: pytest.Config) -> None:
+        self.config = config
+        self.qf_api: Optional[API] = None
+        self.test_cycle_id: Optional[int] = None
+        self.outcomes: dict = {}
+        self.results: queue.Queue = queue.Queue()
+        self.uploader: Optional[threading.Thread] = None
+        self.error: Optional[Exception] = None
+        self.count: int = 0
+
+    def _write_line(self, line: str) -> None:
+        reporter = self.config.pluginmanager.get_plugin("terminalreporter")
+        if reporter is not None:
+            reporter.write_line(line)
+        else:
+            print(line)
+
+    def pytest_sessionstart(self, session: pytest.Session) -> None:
+        try:
+            self.qf_api = API(
+                config_path=self.config.getoption("qf_config"),
+                config_section=self.config.getoption("qf_section"),
+            )
+            self.test_cycle_id = self.qf_api.create_test_cycle()
+        except Exception as e:
+            # QFに接続できない場合もテストは実行する（JUnit XMLからmain.pyで投入できる）
+            self._write_line("QFへの投入を行いません: " + str(e))
+            self.qf_api = None
+            return
+        self.uploader = threading.Thread(
+            target=self._upload, name="qf-uploader", daemon=True
+        )
+        self.uploader.start()
+
+    def _upload(self) -> None:
+        try:
+            self.qf_api.post_test_results(
+                results=iter(self.results.get, _DONE), test_cycle_id=self.test_cycle_id
+            )
+        except Exception as e:
+            self.error = e
+            # 投入を止めた後も結果が溜まらないように読み捨てる
+            for _ in iter(self.results.get, _DONE):
+                pass
+
+    def pytest_runtest_logreport(self, report: pytest.TestReport) -> None:
+        if self.qf_api is None:
+            return
+        outcome = self.outcomes.setdefault(report.nodeid, _Outcome(report))
+        outcome.add(report)
+        # teardownが最後の報告のため、ここで1件の結果として投入する
+        if report.when == "teardown":
+            del self.outcomes[report.nodeid]
+            self.results.put(outcome.to_result().to_dict())
+            self.count += 1
+
+    def pytest_sessionfinish(self, session: pytest.Session) -> None:
+        if self.qf_api is None:
+            return
+        # teardownまで終わらなかったテスト（中断など）も投入する
+        for outcome in self.outcomes.values():
+            self.results.put(outcome.to_result().to_dict())
+            self.count += 1
+        self.outcomes.clear()
+        self.results.put(_DONE)
+        self.uploader.join()
+        self.qf_api.report_client_stats()
+        if self.error is not None:
+            self._write_line("QFへの投入に失敗しました: " + str(self.error))
+        else:
+            self._write_line(
+                "QFへテスト結果を投入しました: "
+                + str(self.count)
+                + "件（テストサイクル "
+                + str(self.test_cycle_id)
+                + "）"
+            )
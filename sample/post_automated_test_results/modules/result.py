@@ -1,4 +1,8 @@
+import os
 import re
+import xml.etree.ElementTree as ET
+from collections.abc import Iterable, Iterator
+from typing import Union
 
 from junitparser import JUnitXml
 from junitparser.junitparser import Failure, TestCase
@@ -74,3 +78,53 @@ def parse_xml(xml_path: str) -> list[dict]:
             results.append(result.to_dict())
 
     return results
+
+
+_RESULT_TAGS = ("failure", "error", "skipped")
+
+
+def _expand_xml_paths(xml_paths: Union[str, Iterable[str]]) -> Iterator[str]:
+    if isinstance(xml_paths, str):
+        xml_paths = [xml_paths]
+    for xml_path in xml_paths:
+        if os.path.isdir(xml_path):
+            for dir_path, _, file_names in sorted(os.walk(xml_path)):
+                for file_name in sorted(file_names):
+                    if file_name.endswith(".xml"):
+                        yield os.path.join(dir_path, file_name)
+        else:
+            yield xml_path
+
+
+def _result_from_element(case: ET.Element) -> Result:
+    time = case.get("time")
+    params = {
+        "name": case.get("name"),
+        "result": "pass",
+        "file_path": case.get("file", ""),
+        "time": float(time) if time else 0.0,
+    }
+    # Failure, Error, Skipped Cases (the last one wins as in parse_xml)
+    for detail in case:
+        if detail.tag in _RESULT_TAGS:
+            params["result"] = detail.tag
+            params["message"] = detail.get("message")
+    return Result(**params)
+
+
+# xml_paths: a file, a directory of *.xml files, or a list of either
+def iter_results(xml_paths: Union[str, Iterable[str]]) -> Iterator[Result]:
+    for xml_path in _expand_xml_paths(xml_paths):
+        parents: list = []
+        for event, elem in ET.iterparse(xml_path, events=("start", "end")):
+            if event == "start":
+                parents.append(elem)
+                continue
+
+            parents.pop()
+            if elem.tag == "testcase":
+                yield _result_from_element(elem)
+            if elem.tag != "testsuite" and parents and parents[-1].tag == "testsuite":
+                # Drop processed cases so memory stays flat on large reports
+                elem.clear()
+                parents[-1].remove(elem)
@@ -0,0 +1,99 @@
+import os
+import sys
+
+import pytest
+
+# post_automated_test_resultsのモジュールを読み込む
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from modules import case_index  # noqa: E402
+
+VERSION = {
+    "id": 22,
+    "name": "1.0",
+    "status": "available",
+    "updated_at": "2024-01-01T00:00:00.000+09:00",
+}
+FIRST_PAGE = {"total_count": 250, "total_pages": 3}
+INDEX = {"test_login": 101, "test_ログアウト": 102}
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = case_index.CaseIndexCache(str(tmp_path / "case_index.sqlite3"), 3600)
+    yield cache
+    cache.close()
+
+
+def test_fingerprint_is_stable():
+    assert case_index.version_fingerprint(
+        VERSION, FIRST_PAGE
+    ) == case_index.version_fingerprint(dict(VERSION), dict(FIRST_PAGE))
+
+
+# バージョンの更新やテストケースの件数の変化で指紋が変わる
+@pytest.mark.parametrize(
+    "version, first_page",
+    [
+        (dict(VERSION, updated_at="2024-01-02T00:00:00.000+09:00"), FIRST_PAGE),
+        (dict(VERSION, name="1.1"), FIRST_PAGE),
+        (dict(VERSION, id=23), FIRST_PAGE),
+        (VERSION, dict(FIRST_PAGE, total_count=251)),
+        (VERSION, dict(FIRST_PAGE, total_pages=4)),
+    ],
+)
+def test_fingerprint_changes(version, first_page):
+    assert case_index.version_fingerprint(
+        version, first_page
+    ) != case_index.version_fingerprint(VERSION, FIRST_PAGE)
+
+
+# 利用可でないバージョンはテストケースを変更できるためキャッシュしない
+@pytest.mark.parametrize("status", ["editing", "archived", None])
+def test_fingerprint_requires_available(status):
+    assert (
+        case_index.version_fingerprint(dict(VERSION, status=status), FIRST_PAGE) is None
+    )
+    assert case_index.version_fingerprint(None, FIRST_PAGE) is None
+
+
+def test_lookup_same_fingerprint(cache):
+    scope = case_index.cache_scope("https://example.com/api/v2/", "key-a")
+    fingerprint = case_index.version_fingerprint(VERSION, FIRST_PAGE)
+    cache.store(scope, VERSION["id"], None, fingerprint, INDEX)
+    assert cache.lookup(scope, VERSION["id"], None, fingerprint) == INDEX
+
+
+# 指紋が変わった索引は使わず、保存し直すと新しい索引を返す
+def test_lookup_invalidated_by_fingerprint(cache):
+    scope = case_index.cache_scope("https://example.com/api/v2/", "key-a")
+    old = case_index.version_fingerprint(VERSION, FIRST_PAGE)
+    new = case_index.version_fingerprint(VERSION, dict(FIRST_PAGE, total_count=251))
+    cache.store(scope, VERSION["id"], None, old, INDEX)
+    assert cache.lookup(scope, VERSION["id"], None, new) is None
+    cache.store(scope, VERSION["id"], None, new, {"test_login": 201})
+    assert cache.lookup(scope, VERSION["id"], None, new) == {"test_login": 201}
+    assert cache.lookup(scope, VERSION["id"], None, old) is None
+
+
+# 接続先・APIキー・照合する項目ごとに分けて保存する
+def test_lookup_scoped(cache):
+    scope = case_index.cache_scope("https://example.com/api/v2/", "key-a")
+    fingerprint = case_index.version_fingerprint(VERSION, FIRST_PAGE)
+    cache.store(scope, VERSION["id"], None, fingerprint, INDEX)
+    for other in [
+        case_index.cache_scope("https://example.com/api/v2/", "key-b"),
+        case_index.cache_scope("https://example.org/api/v2/", "key-a"),
+    ]:
+        assert other != scope
+        assert cache.lookup(other, VERSION["id"], None, fingerprint) is None
+    assert cache.lookup(scope, VERSION["id"], "name", fingerprint) is None
+
+
+def test_lookup_expired(tmp_path):
+    cache = case_index.CaseIndexCache(str(tmp_path / "case_index.sqlite3"), -1)
+    try:
+        fingerprint = case_index.version_fingerprint(VERSION, FIRST_PAGE)
+        cache.store("scope", VERSION["id"], None, fingerprint, INDEX)
+        assert cache.lookup("scope", VERSION["id"], None, fingerprint) is None
+    finally:
+        cache.close()
@@ -0,0 +1,60 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import os
+import sys
+import time
+
+#共通モジュール（sample/common）を読み込む
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+import qf_client
+import qf_mirror
+
+#【定数】
+BASE_API_URL = 'https://cloud.veriserve.co.jp/'
+DEFAULT_METRICS_DIR = 'metrics'
+
+
+def strip_quotes(src):
+    ret = src.strip()
+    ret = ret.strip('\'')
+    ret = ret.strip('\"')
+    return ret
+
+if __name__ == '__main__':
+    # コマンドラインオプション処理
+    import argparse
+    ap = argparse.ArgumentParser(description='プロジェクトのテストデータをローカルのSQLiteに同期する。')
+    ap.add_argument("-a", "--api_key", action='store', help="APIキー", required=True)
+    ap.add_argument("-m", "--mirror", action='store', default=qf_mirror.DEFAULT_PATH, help="ミラーファイルのパス")
+    ap.add_argument("--full", action='store_true', help="updated_atに関係なく全ての一覧を取得する")
+    ap.add_argument("-p", "--pool_size", action='store', type=int, default=qf_client.DEFAULT_POOL_SIZE, help="ホストごとに保持するコネクションの最大数")
+    ap.add_argument("-r", "--rate", action='store', type=float, default=qf_client.DEFAULT_RATE, help="1秒あたりのリクエスト数")
+    ap.add_argument("-b", "--burst", action='store', type=int, default=qf_client.DEFAULT_BURST, help="連続して送信できるリクエスト数")
+    ap.add_argument("-w", "--workers", action='store', type=int, default=qf_mirror.DEFAULT_WORKERS, help="並列で一覧を取得する数")
+    ap.add_argument("-u", "--base_url", action='store', default=BASE_API_URL, help="QualityForwardのURL")
+    ap.add_argument("--metrics_dir", action='store', default=DEFAULT_METRICS_DIR, help="計測結果（JSON・Prometheusのテキストファイル）の出力先")
+    args = ap.parse_args()
+    base_url = args.base_url if args.base_url.endswith('/') else args.base_url + '/'
+
+    #APIのクライアントを設定する
+    qf_client.configure(pool_size=args.pool_size, rate=args.rate, burst=args.burst)
+
+    # メイン処理
+    start = time.perf_counter()
+    mirror = qf_mirror.Mirror(args.mirror)
+    sync = qf_mirror.MirrorSync(mirror, base_url + 'api/v2/', strip_quotes(args.api_key), args.workers, full=args.full)
+    failures = sync.run()
+    mirror.close()
+
+    print('取得した一覧: ' + str(sync.stats['fetched']) + '件（変更なし ' + str(sync.stats['unchanged'])
+          + '件）、updated_atが変わらず取得を省略した一覧: ' + str(sync.stats['skipped']) + '件')
+    print('書き込んだ要素: ' + str(sync.stats['written']) + '件、削除した要素: ' + str(sync.stats['deleted'])
+          + '件（' + '{:.2f}'.format(time.perf_counter() - start) + '秒）')
+    qf_client.print_stats()
+    qf_client.export_metrics(args.metrics_dir or None, 'project_mirror')
+    if len(failures) > 0:
+        print('以下の一覧の取得に失敗しました。再実行すると同期を完了します。')
+        for x in failures:
+            print('  ▪ ' + x)
+        sys.exit(1)
+    print('Done')
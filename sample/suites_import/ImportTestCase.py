@@ -3,15 +3,23 @@
 """ Copyright (c) 2020 VeriServe Corporation """
 try:
     import json
-    import requests
     import datetime
     import os
-    import xlrd
+    import sys
+    import hashlib
     import settings
-    import urllib.parse
-    import time
-    from openpyxl import load_workbook
-    from format import format_value
+    import journal
+    from collections import namedtuple
+    from concurrent.futures import ThreadPoolExecutor, as_completed
+    from functools import partial
+    from loader import parse_workbooks
+    from journal import ImportJournal
+    from parse_cache import ParseCache
+    from urllib.parse import parse_qsl
+    #共通モジュール（sample/common）を読み込む
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+    import qf_client
+    import qf_pages
 except ModuleNotFoundError as err:
     print('「' + err.name + '」のモジュールが見つかりません。以下のコマンドラインでインストールしてください。')
     print('>> pip install ' + err.name)
@@ -20,8 +28,17 @@ except ModuleNotFoundError as err:
 #【定数】
 NOW = datetime.datetime.now().strftime('%Y-%m-%d')
 EXCEL_EXTENSION = '.xlsx'
-#QFサービス規約対応のため
-SLEEP_TIME = 1
+
+#差分同期の計画（更新・作成・削除するテストケースと変更のない件数）
+#  updates：(テストケース番号, テストケースNo, 登録データ, 空にする項目のリスト) のリスト
+#  creates：(テストケースNo, 登録データ) のリスト
+#  deletes：テストケース番号のリスト
+SyncPlan = namedtuple('SyncPlan', ['updates', 'creates', 'deletes', 'unchanged'])
+
+#インポートのジャーナル（settings.JOURNAL_PATHを指定した場合にmainで設定する）
+_journal = None
+#中断したインポートを再開するかどうか（--resume）
+_resume = False
 
 # -----------------------------------------------------------
 # 文字列から「'」と「"」の文字を削除する
@@ -68,27 +85,8 @@ def build_url_api(mid_url):
 #  ret（array）：APIから応答された結果のリスト
 # -----------------------------------------------------------
 def get_request_pages(mid_url, content_name):
-    ret = None
-    url = build_url_api(mid_url)
-    while True:
-        #APIにリクエストを送信する
-        response = requests.get(url)
-        time.sleep(SLEEP_TIME)
-        #応答結果の確認
-        if response.status_code != 200:
-            return None
-        content = json.loads(response.content)
-        #リストに結果を格納する
-        if ret is None:
-            ret = content[content_name]
-        else:
-            ret.extend(content[content_name])
-
-        #次のページがあるかどうかをチェックする
-        if 'next_url' not in content or content['next_url'] is None or content['total_pages'] == 0:
-            break
-        url = content['next_url']
-    return ret
+    #2ページ目以降は並列で取得する
+    return qf_pages.get_pages(build_url_api(mid_url), content_name, settings.PAGE_WORKERS)
 
 # -----------------------------------------------------------
 # APIからプロジェクトの情報を取得する
@@ -103,8 +101,7 @@ def get_project_info():
     url = build_url_api('current_project')
 
     #APIにリクエストを送信する
-    response = requests.get(url)
-    time.sleep(SLEEP_TIME)
+    response = qf_client.get(url)
     #応答結果の確認
     if response.status_code != 200:
         return None
@@ -162,8 +159,7 @@ def post_request(mid_url, payload, headers):
     url = build_url_api(mid_url)
     #データのエンコード
     payload = payload.encode('utf-8')
-    response = requests.post(url, data=payload, headers=headers)
-    time.sleep(SLEEP_TIME)
+    response = qf_client.post(url, data=payload, headers=headers)
     #応答結果の確認
     if response.status_code == 201:
         content = json.loads(response.content)
@@ -188,8 +184,7 @@ def update_request(mid_url, payload, headers):
     url = build_url_api(mid_url)
     #データのエンコード
     payload = payload.encode('utf-8')
-    response = requests.patch(url, data=payload, headers=headers)
-    time.sleep(SLEEP_TIME)
+    response = qf_client.patch(url, data=payload, headers=headers)
     #応答結果の確認
     if response.status_code == 200:
         return json.loads(response.content)
@@ -210,8 +205,7 @@ def update_request(mid_url, payload, headers):
 # -----------------------------------------------------------
 def delete_request(mid_url, headers):
     url = build_url_api(mid_url)
-    response = requests.delete(url, headers=headers)
-    time.sleep(SLEEP_TIME)
+    response = qf_client.delete(url, headers=headers)
     if response.status_code == 204:
         return True
     else:
@@ -221,52 +215,51 @@ def delete_request(mid_url, headers):
 # フォルダ内のすべてのファイルをロードする
 #
 # Returns:
-#  folders（dict）：該当フォルダーのパスとファイル名のリスト
+#  folders（array）：該当フォルダーのパスとファイル名のリスト（フォルダがない場合はNone）
 # -----------------------------------------------------------
 def load_files_in_folder():
-    try:
-        folders = os.walk(settings.FOLDER_PATH)
-    except FileNotFoundError:
+    if not os.path.isdir(settings.FOLDER_PATH):
         return None
-    return folders
+    #フォルダは一度だけ走査し、結果を使い回す
+    return list(os.walk(settings.FOLDER_PATH))
 
 # -----------------------------------------------------------
-# エクセルファイルのデータを全てロードする
+# フォルダ内の全てのエクセルファイルをロードする
+#   解析はsettings.PARSE_WORKERSのプロセスで並列に行う
+#   settings.PARSE_CACHE_PATHを指定した場合は、変更のないファイルを解析しない
 #
 # Parameters:
-#  file_path（str）：エクセルファイルのパス
+#  folders（array）：該当フォルダーのパスとファイル名のリスト
 #
 # Returns:
-#  ws_rows_list（array）：各シートのデータのリスト
-#  sheet_name_list（array）：対象シート名のリスト
-#
-# Exception：ファイルが見つかった時に例外をスローする
+#  workbooks（array）：(ファイルのパス, ファイル名, シートのリスト)のリスト
 # -----------------------------------------------------------
-def load_excel(file_path, is_correct_data):
-    #各シートのデータのリスト
-    ws_rows_list = []
-    #対象シート名のリスト
-    sheet_name_list = []
-    try:
-        #データ抽出用のスプレッドシートファイルを開きます
-        wb = xlrd.open_workbook(filename=file_path)
-
-        for ws in wb._sheet_list:
-            #表示されているシートのみを取得します
-            if ws.visibility == 0:
-                if is_correct_data == False:
-                    ws_rows_list.append(list(ws._cell_values))
-                sheet_name_list.append(ws.name)
-
-        if is_correct_data:
-            wb = load_workbook(filename=file_path, read_only=True, data_only=True, keep_links=False)
-            for s in sheet_name_list:
-                ws_rows_list.append(list(wb[s].rows))
-    except FileNotFoundError:
-        print('excelインポートするファイルが見つかりません。')
-        return None
+def load_workbooks(folders):
+    file_paths = []
+    for path, subdirs, files in folders:
+        for f in files:
+            #Excel以外のファイル拡張子
+            if EXCEL_EXTENSION not in f:
+                continue
+            file_paths.append(os.path.join(path, f))
+
+    #前回から変更のないファイルは解析結果のキャッシュを使う
+    cache = None
+    if settings.PARSE_CACHE_PATH is not None:
+        cache = ParseCache(settings.PARSE_CACHE_PATH, settings.PARSE_CACHE_MAX_BYTES)
 
-    return ws_rows_list, sheet_name_list
+    workbooks = []
+    try:
+        for file_path, sheets in parse_workbooks(file_paths, settings.PARSE_WORKERS, cache):
+            if sheets is None:
+                print('excelインポートするファイルが見つかりません。')
+                continue
+            workbooks.append((file_path, os.path.basename(file_path), sheets))
+    finally:
+        if cache is not None:
+            print('解析結果のキャッシュ: 使用 ' + str(cache.hits) + '件、解析 ' + str(cache.misses) + '件')
+            cache.close()
+    return workbooks
 
 # -----------------------------------------------------------
 # テストスイートを番号で削除する
@@ -292,13 +285,13 @@ def delete_test_suite(test_suite_id):
 #
 # Parameters:
 #  test_suite_name（str）：テストスイート名
-#  ws_rows（array）：対象ヘッダデータのリスト
+#  labels（array）：ヘッダーのラベルのリスト
 #
 # Returns:
 #  test_suite_id（int）：登録されたテストスイート番号
 #  ※作成に失敗した時に処理を中断する
 # -----------------------------------------------------------
-def create_new_suite(test_suite_name, ws_rows):
+def create_new_suite(test_suite_name, labels):
     #テストスイートの存在を確認する
     test_suite_id = check_exist_test_suite(test_suite_name)
     if test_suite_id != None:
@@ -315,18 +308,9 @@ def create_new_suite(test_suite_name, ws_rows):
     payload = 'test_suite[project_id]=' + str(project_id) + '&test_suite[name]=' + test_suite_name
 
     #ヘッダデータの設定
-    j = _col_start_index    #読み取りを開始する列を指定します
-    no = 1                      #ラベルカテゴリのインデックス
-
-    #各列のデータを可能範囲で読み取る
-    while j <= _col_end_index:
-        val = ws_rows[_header_row_index][j].value
-        if val is not None and str(val).strip() != '' and str(val).strip() != settings.COL_TITLE_START:
-            #空のセルではない場合
-            payload = payload + "&test_suite[label_category" + str(no) + "]=" + str(val)
-            payload = payload + "&test_suite[use_category" + str(no) + "]=true"
-            no += 1
-        j += 1
+    for no, val in enumerate(labels, 1):
+        payload = payload + "&test_suite[label_category" + str(no) + "]=" + val
+        payload = payload + "&test_suite[use_category" + str(no) + "]=true"
     
     for x in _default_label_content:
         payload = payload + "&test_suite[label_content" + str(x) + "]=" + str(_default_label_content[x])
@@ -352,15 +336,18 @@ def create_new_suite(test_suite_name, ws_rows):
 #
 # Parameters:
 #  test_suite_id（int）：テストスイート番号
+#  tsv_name（str）：テストスイートバージョン名（省略時はsettings.TSV_NAME）
 #
 # Returns:
 #  test_suite_vs_id（int）：登録されたテストスイートバージョン番号
 #  ※作成に失敗した時に処理を中断する
 # -----------------------------------------------------------
-def create_new_tsv(test_suite_id):
+def create_new_tsv(test_suite_id, tsv_name=None):
     mid_url = 'test_suites/' + str(test_suite_id) + '/test_suite_versions'
     headers = {'content-type':'application/x-www-form-urlencoded'}
-    payload = 'test_suite_version[project_id]=' + str(project_id) + '&test_suite_version[name]=' + settings.TSV_NAME + '&test_suite_version[created_at]=' + NOW
+    if tsv_name is None:
+        tsv_name = settings.TSV_NAME
+    payload = 'test_suite_version[project_id]=' + str(project_id) + '&test_suite_version[name]=' + tsv_name + '&test_suite_version[created_at]=' + NOW
 
     content = post_request(mid_url, payload, headers)
     if content != None:
@@ -378,35 +365,18 @@ def create_new_tsv(test_suite_id):
 # Parameters:
 #  test_suite_id（int）：テストスイート番号
 #  test_suite_version_id（int）：テストスイートバージョン番号
-#  data_row（array）：対象データのリスト
+#  row_payload（str）：エンコード済みの登録データ（優先度と各カテゴリ）
+#  tc_no（int）：テストケースNo
 #
 # Returns:
 #  True（bool）：テストケースが成功した場合
 #  False（bool）：テストケースの作成に失敗した場合
 # -----------------------------------------------------------
-def create_new_tc(test_suite_id,test_suite_version_id,data_row):
+def create_new_tc(test_suite_id,test_suite_version_id,row_payload,tc_no):
     mid_url = 'test_suites/' + str(test_suite_id) + '/test_suite_versions/' + str(test_suite_version_id) + '/test_cases'
     headers = {'content-type':'application/x-www-form-urlencoded'}
-    payload = 'test_case[no]=' + str(tc_no)
-    #優先度
-    if data_row[_col_priority_index].value is not None:
-        payload = payload + '&test_case[priority]=' + data_row[_col_priority_index].value
-
-    #テストケースのデータの設定
-    i = _col_start_index    #読み取りを開始する列を指定します
-    no = 1                      #カテゴリのインデックス
-
-    #各列のデータを可能範囲で読み取る
-    while i <= _col_end_index:
-        if i != _col_priority_index:
-            if data_row[i].value is not None:
-                if data_row[i].data_type == 's':
-                    val = str(data_row[i].value)
-                else:
-                    val = format_value(data_row[i].value, data_row[i].data_type, data_row[i].number_format)
-                payload = payload + '&test_case[category' + str(no) + ']=' + urllib.parse.quote(val)
-            no += 1
-        i +=1
+    #優先度とテストケースのデータは解析時にエンコード済み
+    payload = 'test_case[no]=' + str(tc_no) + row_payload
     #作成時間を設定する
     payload = payload + '&test_case[created_at]=' + NOW
     
@@ -441,18 +411,416 @@ def update_test_suite_version(test_suite_id,test_suite_version_id):
         print('テストスイート更新に失敗しました。')
         exit()
 
+# -----------------------------------------------------------
+# ジャーナルに送信中を記録してから送信し、応答を受け取ったら完了を記録する
+#   サーバがエラーを応答した場合は作成されていないため計画済みに戻す
+#   応答を受け取れなかった場合（通信エラー・中断）は送信中のまま残し、再開時に確認する
+#
+# Parameters:
+#  key（str）：テストスイート名（Noneの場合は記録しない）
+#  op（str）：操作（journal.OP_*）
+#  seq（int）：テストケースNo（テストケースの作成以外は0）
+#  send（function）：送信する処理（作成されたIDを返す）
+#
+# Returns:
+#  sendの戻り値
+# -----------------------------------------------------------
+def journal_step(key, op, send, seq=0):
+    if _journal is None or key is None:
+        return send()
+    _journal.mark_sent(key, op, seq)
+    try:
+        ret = send()
+    except qf_client.RequestError:
+        raise
+    except Exception:
+        _journal.mark_planned(key, op, seq)
+        raise
+    if ret:
+        _journal.mark_done(key, op, seq, ret if op in (journal.OP_SUITE, journal.OP_VERSION) else None)
+    else:
+        _journal.mark_planned(key, op, seq)
+    return ret
+
+# -----------------------------------------------------------
+# テストスイートバージョンにテストケースを並列で作成する
+#   テストケースNoは行の順番で事前に決めるため、作成の完了順に関係なく同じ番号になる
+#   送信数はsettings.MAX_WORKERSで制限し、送信レートは共通のレートリミッターで制限する
+#
+# Parameters:
+#  test_suite_id（int）：テストスイート番号
+#  test_suite_version_id（int）：テストスイートバージョン番号
+#  rows（array）：テストケースごとのエンコード済みの登録データのリスト
+#  tc_nos（array）：作成するテストケースNoのリスト（省略時は全ての行）
+#  journal_key（str）：ジャーナルに記録するテストスイート名（省略時は記録しない）
+#
+# Returns:
+#  count（int）：作成したテストケースの件数
+#
+# Exception：ひとつでも作成に失敗した場合、未送信のテストケースを取り消して例外をスローする
+# -----------------------------------------------------------
+def create_test_cases(test_suite_id, test_suite_version_id, rows, tc_nos=None, journal_key=None):
+    if tc_nos is None:
+        tc_nos = range(1, len(rows) + 1)
+    count = 0
+    with ThreadPoolExecutor(max_workers=settings.MAX_WORKERS) as executor:
+        futures = {}
+        for tc_no in tc_nos:
+            send = partial(create_new_tc, test_suite_id, test_suite_version_id, rows[tc_no - 1], tc_no)
+            futures[executor.submit(journal_step, journal_key, journal.OP_CASE, send, tc_no)] = tc_no
+
+        for future in as_completed(futures):
+            tc_no = futures[future]
+            try:
+                isCreated = future.result()
+            except Exception:
+                #未送信のテストケースを取り消す
+                for f in futures:
+                    f.cancel()
+                raise
+            if isCreated:
+                print(str(tc_no) + '番目のテストケースの作成が合格しました。')
+                count += 1
+            else:
+                print(str(tc_no) + '番目のテストケースのインポートに失敗しました。')
+    return count
+
+# -----------------------------------------------------------
+# 登録データ（&test_case[項目]=値）を項目ごとに分ける
+#
+# Parameters:
+#  row_payload（str）：エンコード済みの登録データ
+#
+# Returns:
+#  fields（dict）：項目名 → 値
+# -----------------------------------------------------------
+def parse_row_payload(row_payload):
+    fields = {}
+    for key, value in parse_qsl(row_payload.lstrip('&'), keep_blank_values=True):
+        if key.startswith('test_case[') and key.endswith(']'):
+            fields[key[len('test_case['):-1]] = value
+    return fields
+
+# -----------------------------------------------------------
+# 比較する項目（優先度とカテゴリ）だけを残し、空の値を除く
+#
+# Parameters:
+#  fields（dict）：項目名 → 値（登録データ、またはAPIから取得したテストケース）
+#
+# Returns:
+#  fields（dict）：正規化した項目名 → 値
+# -----------------------------------------------------------
+def normalize_case(fields):
+    ret = {}
+    for key, value in fields.items():
+        if key != 'priority' and not (key.startswith('category') and key[len('category'):].isdigit()):
+            continue
+        if value is None or str(value) == '':
+            continue
+        ret[key] = str(value)
+    return ret
+
+def case_digest(fields):
+    return hashlib.sha1(json.dumps(sorted(fields.items()), ensure_ascii=False).encode('utf-8')).hexdigest()
+
+# -----------------------------------------------------------
+# 既存のテストケースとシートの行をテストケースNoで突き合わせ、差分同期の計画を作成する
+#   正規化した項目のハッシュが一致する行は送信しない
+#
+# Parameters:
+#  cases（array）：既存のテストケースのリスト
+#  rows（array）：テストケースごとのエンコード済みの登録データのリスト
+#
+# Returns:
+#  plan（SyncPlan）：差分同期の計画
+# -----------------------------------------------------------
+def plan_sync(cases, rows):
+    existing = {case['no']: case for case in cases}
+    updates = []
+    creates = []
+    unchanged = 0
+    for index, row_payload in enumerate(rows):
+        tc_no = index + 1
+        case = existing.get(tc_no)
+        if case is None:
+            creates.append((tc_no, row_payload))
+            continue
+        new_fields = normalize_case(parse_row_payload(row_payload))
+        old_fields = normalize_case(case)
+        if case_digest(new_fields) == case_digest(old_fields):
+            unchanged += 1
+            continue
+        #シートで空になった項目は空で更新する
+        updates.append((case['id'], tc_no, row_payload, sorted(set(old_fields) - set(new_fields))))
+    deletes = [case['id'] for tc_no, case in sorted(existing.items()) if tc_no > len(rows)]
+    return SyncPlan(updates, creates, deletes, unchanged)
+
+# -----------------------------------------------------------
+# テストスイートのラベル（label_categoryN）がシートのヘッダーと一致するかを確認する
+#
+# Parameters:
+#  ts（dict）：テストスイート
+#  labels（array）：ヘッダーのラベルのリスト
+#
+# Returns:
+#  True（bool）：一致する場合
+# -----------------------------------------------------------
+def is_same_labels(ts, labels):
+    current = []
+    for no in range(1, settings.QF_COLUMN_MAX):
+        val = ts.get('label_category' + str(no))
+        if val is not None and str(val) != '' and ts.get('use_category' + str(no)) not in (False, 'false'):
+            current.append(str(val))
+    return current == list(labels)
+
+# -----------------------------------------------------------
+# テストスイートのラベルをシートのヘッダーに合わせて更新する
+#
+# Parameters:
+#  test_suite_id（int）：テストスイート番号
+#  labels（array）：ヘッダーのラベルのリスト
+# -----------------------------------------------------------
+def update_suite_labels(test_suite_id, labels):
+    mid_url = 'test_suites/' + str(test_suite_id)
+    headers = {'content-type':'application/x-www-form-urlencoded'}
+    fields = []
+    for no in range(1, settings.QF_COLUMN_MAX):
+        if no <= len(labels):
+            fields.append('test_suite[label_category' + str(no) + ']=' + labels[no - 1])
+            fields.append('test_suite[use_category' + str(no) + ']=true')
+        else:
+            fields.append('test_suite[use_category' + str(no) + ']=false')
+    update_request(mid_url, '&'.join(fields), headers)
+
+# -----------------------------------------------------------
+# 差分同期の計画どおりにテストケースを並列で更新・作成・削除する
+#
+# Parameters:
+#  test_suite_id（int）：テストスイート番号
+#  test_suite_version_id（int）：テストスイートバージョン番号
+#  plan（SyncPlan）：差分同期の計画
+#
+# Exception：ひとつでも失敗した場合、未送信のリクエストを取り消して例外をスローする
+# -----------------------------------------------------------
+def apply_sync(test_suite_id, test_suite_version_id, plan):
+    mid_url = 'test_suites/' + str(test_suite_id) + '/test_suite_versions/' + str(test_suite_version_id) + '/test_cases'
+    headers = {'content-type':'application/x-www-form-urlencoded'}
+    with ThreadPoolExecutor(max_workers=settings.MAX_WORKERS) as executor:
+        futures = []
+        for test_case_id, tc_no, row_payload, cleared in plan.updates:
+            payload = 'test_case[no]=' + str(tc_no) + row_payload + ''.join('&test_case[' + x + ']=' for x in cleared)
+            futures.append(executor.submit(update_request, mid_url + '/' + str(test_case_id), payload, headers))
+        for tc_no, row_payload in plan.creates:
+            futures.append(executor.submit(create_new_tc, test_suite_id, test_suite_version_id, row_payload, tc_no))
+        for test_case_id in plan.deletes:
+            futures.append(executor.submit(delete_request, mid_url + '/' + str(test_case_id), headers))
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except Exception:
+                for f in futures:
+                    f.cancel()
+                raise
+
+def count_requests():
+    return sum(x['requests'] for x in qf_client.get_client().stats.snapshot().values())
+
+# -----------------------------------------------------------
+# 新しいテストスイートバージョンの名前を作成する
+#   既存のバージョン名（「2.0」「3」など）の先頭の数値の最大値＋1とする（削除済みの番号や手動の名前と重ならない）
+#
+# Parameters:
+#  versions（array）：テストスイートバージョンのリスト
+#
+# Returns:
+#  name（str）：バージョン名（例：3.0）
+# -----------------------------------------------------------
+def next_version_name(versions):
+    names = set(str(x.get('name', '')) for x in versions)
+    numbers = [0]
+    for name in names:
+        head = name.split('.')[0].strip()
+        if head.isdigit():
+            numbers.append(int(head))
+    number = max(numbers) + 1
+    while str(number) + '.0' in names:
+        number += 1
+    return str(number) + '.0'
+
+# -----------------------------------------------------------
+# 既存のテストスイートにシートの差分だけを同期する
+#   最新のテストスイートバージョンのテストケースと比較し、差分がなければシートをスキップする
+#   差分がある場合は新しいバージョンを作成し、変更・追加・削除した行だけを送信する
+#
+# Parameters:
+#  test_suite_id（int）：テストスイート番号
+#  test_suite_name（str）：テストスイート名
+#  sheet（SheetPayload）：解析済みのシート
+# -----------------------------------------------------------
+def sync_sheet(test_suite_id, test_suite_name, sheet):
+    before = count_requests()
+    versions_url = 'test_suites/' + str(test_suite_id) + '/test_suite_versions'
+    versions = get_request_pages(versions_url, 'test_suite_versions')
+    if versions is None:
+        print('テストスイートバージョンの取得に失敗しました。: ' + test_suite_name)
+        exit()
+
+    cases = []
+    if len(versions) > 0:
+        latest = max(versions, key=lambda x: x['id'])
+        cases = get_request_pages(versions_url + '/' + str(latest['id']) + '/test_cases', 'test_cases')
+        if cases is None:
+            print('テストケースの取得に失敗しました。: ' + test_suite_name)
+            exit()
+    plan = plan_sync(cases, sheet.rows)
+    ts = next(x for x in _test_suite_list if x['id'] == test_suite_id)
+    labels_changed = not is_same_labels(ts, sheet.labels)
+
+    #作り直す場合の送信数（削除・テストスイート・バージョン・全テストケース・ステータス）
+    rebuild = len(sheet.rows) + 4
+    if not labels_changed and len(plan.updates) + len(plan.creates) + len(plan.deletes) == 0:
+        sent = count_requests() - before
+        print('「' + test_suite_name + '」は変更がないためスキップしました。（リクエスト ' + str(sent)
+              + '件、作り直す場合より' + str(rebuild - sent) + '件少ない）')
+        return
+
+    if labels_changed:
+        update_suite_labels(test_suite_id, sheet.labels)
+
+    #新しいバージョンに引き継がれたテストケースと改めて比較する
+    test_suite_vs_id = create_new_tsv(test_suite_id, next_version_name(versions))
+    copied = get_request_pages(versions_url + '/' + str(test_suite_vs_id) + '/test_cases', 'test_cases')
+    if copied is None:
+        print('テストケースの取得に失敗しました。: ' + test_suite_name)
+        exit()
+    if len(copied) != len(cases):
+        #サーバがテストケースを引き継がなかった場合は、足りない分を追加として登録する
+        print('【警告】「' + test_suite_name + '」の新しいテストスイートバージョンに引き継がれたテストケースが'
+              + str(len(copied)) + '件です（前のバージョン ' + str(len(cases)) + '件）。'
+              + '新しいバージョンの内容と比較して、足りないテストケースを登録します。')
+    plan = plan_sync(copied, sheet.rows)
+    apply_sync(test_suite_id, test_suite_vs_id, plan)
+    update_test_suite_version(test_suite_id, test_suite_vs_id)
+
+    sent = count_requests() - before
+    print('「' + test_suite_name + '」を同期しました。変更 ' + str(len(plan.updates)) + '件、追加 ' + str(len(plan.creates))
+          + '件、削除 ' + str(len(plan.deletes)) + '件、変更なし ' + str(plan.unchanged) + '件（リクエスト '
+          + str(sent) + '件、作り直す場合より' + str(rebuild - sent) + '件少ない）')
+
+# -----------------------------------------------------------
+# ジャーナルに記録されたシートのインポートを再開する
+#   完了した操作は送信せず、記録済みのテストスイート番号・テストスイートバージョン番号を使う
+#   送信中のまま残った操作は、サーバに作成されていれば完了として扱う
+#
+# Parameters:
+#  test_suite_name（str）：テストスイート名
+#  sheet（SheetPayload）：解析済みのシート
+#  state（JournalSheet）：ジャーナルの記録
+# -----------------------------------------------------------
+def resume_sheet(test_suite_name, sheet, state):
+    if state.is_complete():
+        print('「' + test_suite_name + '」はインポート済みのためスキップしました。')
+        return
+    before = count_requests()
+    key = test_suite_name
+    fresh = False
+
+    test_suite_id = state.result_id(journal.OP_SUITE) if state.state(journal.OP_SUITE) == journal.STATE_DONE else None
+    if test_suite_id is None:
+        existing = check_exist_test_suite(test_suite_name)
+        if state.state(journal.OP_SUITE) == journal.STATE_SENT and existing is not None and existing != state.replaced_suite_id:
+            #作成の応答を受け取る前に中断したテストスイートを使う
+            test_suite_id = existing
+            _journal.mark_done(key, journal.OP_SUITE, result_id=test_suite_id)
+        else:
+            test_suite_id = journal_step(key, journal.OP_SUITE, lambda: create_new_suite(test_suite_name, sheet.labels))
+            fresh = True
+
+    versions_url = 'test_suites/' + str(test_suite_id) + '/test_suite_versions'
+    test_suite_vs_id = state.result_id(journal.OP_VERSION) if state.state(journal.OP_VERSION) == journal.STATE_DONE else None
+    if test_suite_vs_id is None and not fresh and state.state(journal.OP_VERSION) == journal.STATE_SENT:
+        versions = get_request_pages(versions_url, 'test_suite_versions')
+        if versions is None:
+            print('テストスイートバージョンの取得に失敗しました。: ' + test_suite_name)
+            exit()
+        if len(versions) > 0:
+            test_suite_vs_id = max(versions, key=lambda x: x['id'])['id']
+            _journal.mark_done(key, journal.OP_VERSION, result_id=test_suite_vs_id)
+    if test_suite_vs_id is None:
+        test_suite_vs_id = journal_step(key, journal.OP_VERSION, lambda: create_new_tsv(test_suite_id))
+        fresh = True
+
+    pending = state.pending_cases()
+    if not fresh and any(x[1] == journal.STATE_SENT for x in pending):
+        #送信中のまま残ったテストケースがサーバに作成されているかを確認する
+        cases = get_request_pages(versions_url + '/' + str(test_suite_vs_id) + '/test_cases', 'test_cases')
+        if cases is None:
+            print('テストケースの取得に失敗しました。: ' + test_suite_name)
+            exit()
+        created = set(x['no'] for x in cases)
+        _journal.mark_cases_done(key, [tc_no for tc_no, _ in pending if tc_no in created])
+        pending = [x for x in pending if x[0] not in created]
+
+    count = create_test_cases(test_suite_id, test_suite_vs_id, sheet.rows, [tc_no for tc_no, _ in pending], key)
+    if journal_step(key, journal.OP_STATUS, lambda: update_test_suite_version(test_suite_id, test_suite_vs_id)):
+        print('「' + test_suite_name + '」のインポートを再開して完了しました。作成 ' + str(count) + '件、作成済み '
+              + str(len(sheet.rows) - len(pending)) + '件（リクエスト ' + str(count_requests() - before) + '件）')
+
+# -----------------------------------------------------------
+# シートをテストスイートとしてインポートする
+#   ジャーナルを使う場合は、送信する全ての操作を先に記録してから送信する
+#
+# Parameters:
+#  test_suite_name（str）：テストスイート名
+#  sheet（SheetPayload）：解析済みのシート
+# -----------------------------------------------------------
+def import_sheet(test_suite_name, sheet):
+    key = None
+    if _journal is not None:
+        key = test_suite_name
+        digest = journal.sheet_digest(sheet)
+        #中断したシートは続きから再開する
+        state = _journal.load_sheet(key, digest) if _resume else None
+        if state is not None:
+            resume_sheet(test_suite_name, sheet, state)
+            return
+
+    #既存のテストスイートは差分だけを同期する
+    if settings.SYNC_EXISTING:
+        test_suite_id = check_exist_test_suite(test_suite_name)
+        if test_suite_id is not None:
+            sync_sheet(test_suite_id, test_suite_name, sheet)
+            return
+
+    if key is not None:
+        _journal.begin_sheet(key, digest, len(sheet.rows), check_exist_test_suite(test_suite_name))
+
+    #新規テストスイートを作成する
+    test_suite_id = journal_step(key, journal.OP_SUITE, lambda: create_new_suite(test_suite_name, sheet.labels))
+
+    #新規テストスイートバージョンを作成する
+    test_suite_vs_id = journal_step(key, journal.OP_VERSION, lambda: create_new_tsv(test_suite_id))
+
+    #QFにテストケースを並列で登録する
+    count = create_test_cases(test_suite_id, test_suite_vs_id, sheet.rows, journal_key=key)
+
+    #全てのテストケースの作成が終わってからavailableにstatusを編集する
+    if journal_step(key, journal.OP_STATUS, lambda: update_test_suite_version(test_suite_id, test_suite_vs_id)):
+        print('「' + test_suite_name + '」テストスイートの' + str(count) + '件のテストケース作成が完了しました。')
+
 # -----------------------------------------------------------
 # 重複ファイル名をチェックする
 #
+# Parameters:
+#  folders（array）：該当フォルダーのパスとファイル名のリスト
+#
 # Returns:
 #  重複ファイル名がある場合に処理を中断する
 #  重複ファイル名一覧を表示する
 # -----------------------------------------------------------
-def check_duplicate_file():
+def check_duplicate_file(folders):
     target_files = []
     duplicate_files = []
-     #フォルダーのパスとファイルの一覧を取得する
-    folders = load_files_in_folder()
 
     #フォルダ内のすべてのファイルを取得する
     for path, subdirs, files in folders:
@@ -474,92 +842,44 @@ def check_duplicate_file():
             print(f)
         exit()
 
+def is_resumable(test_suite_name, sheet):
+    return _resume and _journal is not None and _journal.load_sheet(test_suite_name, journal.sheet_digest(sheet)) is not None
+
 # -----------------------------------------------------------
 # ファイルのフォーマットをチェックする
 #
+# Parameters:
+#  workbooks（array）：(ファイルのパス, ファイル名, シートのリスト)のリスト
+#
 # Returns:
 #  ひとつでも読み込み不可のExcelシートがある場合は処理を中断し、エラーメッセージを表示する
 #  列の定義が設定可能範囲より多い時
 #  優先度の列が定義されていない
 # -----------------------------------------------------------
-def check_format_files():
+def check_format_files(workbooks):
     no_priority_files = []  #「優先度」無しファイルの一覧
     max_column_files = []   # QFで取り込める列の最大より大きいファイルの一覧
     test_suites_exist = []  # 存在しているテストスイートの一覧
-     #フォルダーのパスとファイルの一覧を取得する
-    folders = load_files_in_folder()
 
-    for path, subdirs, files in folders:
-        for f in files:
-            #Excel以外のファイル拡張子
-            if EXCEL_EXTENSION not in f:
+    for file_path, f, sheets in workbooks:
+        #各シートをループする
+        for sheet in sheets:
+            #シート対象ではない場合、処理を中断する
+            if sheet.is_target == False:
+                no_priority_files.append('  ▪ ' + file_path)
                 continue
 
-            #エクセルファイルのデータを全てロードする
-            ws_rows_list, _sheet_name_list = load_excel(path + '\\' + f, False)
-            sheet_index = 0
-            #各シートをループする
-            for ws_rows in ws_rows_list:
-                _header_row_index = 0
-                
-                #対象シートのフラグ
-                isTarget = False
-
-                #列インデックスの開始とヘッダー行インデックスを見つける
-                #最初の10列と10行だけを見つける
-                for r in ws_rows:
-                    #列の開始インデックスをリセットする
-                    _col_priority_index = 0
-                    for c in r:
-                        #最初の10列が終わったら、停止します
-                        if _col_priority_index > 20:
-                            break
-                        #「優先度」の列を見つけた場合
-                        if str(c).strip() == settings.COL_TITLE_START:
-                            #対象シート
-                            isTarget = True
-                            break
-                        _col_priority_index += 1
-
-                    #対象シートだ、または最初の10行が終わったら、停止します
-                    if isTarget or _header_row_index > 20:
-                        break
-                    _header_row_index += 1
-
-                #シート対象ではない場合、処理を中断する
-                if isTarget == False:
-                    no_priority_files.append('  ▪ ' + path + '\\' + f)
-                
-                #列の定義が設定可能範囲より多いかどうかチェックする
-                _col_start_index = _col_priority_index + 1
-                _col_end_index = -1
-                _col_import_num = 0
-                i = _col_start_index
-
-                #列インポートの数を数える
-                while i < len(ws_rows[_header_row_index]):
-                    #セルが空の場合は、停止します
-                    if _col_start_index != -1 and str(ws_rows[_header_row_index][i]).strip() == '':
-                        _col_end_index = i - 1
-                        break
-                    elif i == len(ws_rows[_header_row_index]) - 1:
-                        _col_end_index = i
-                    i += 1
-                _col_import_num = _col_end_index - _col_start_index + 1
-
-                #列の定義が設定可能範囲より多い時に処理を中断し、エラーメッセージを表示する
-                if _col_import_num >= settings.QF_COLUMN_MAX:
-                    max_column_files.append('  ▪ ' + path + '\\' + f)
-
-                #存在しているテストスイートがあるかどうかチェックする
-                if settings.TEST_SUITE_DELETE_FLG == 0:
-                    test_suite_name = f[0:f.rindex('.')] + '-' + _sheet_name_list[sheet_index]
-                    test_suite_id = check_exist_test_suite(test_suite_name)
-                    #存在の場合
-                    if test_suite_id != None:
-                        test_suites_exist.append('  ▪ ' + test_suite_name)
-                #シートの次
-                sheet_index += 1
+            #列の定義が設定可能範囲より多い時に処理を中断し、エラーメッセージを表示する
+            if sheet.col_import_num >= settings.QF_COLUMN_MAX:
+                max_column_files.append('  ▪ ' + file_path)
+
+            #存在しているテストスイートがあるかどうかチェックする
+            if settings.TEST_SUITE_DELETE_FLG == 0 and not settings.SYNC_EXISTING:
+                test_suite_name = f[0:f.rindex('.')] + '-' + sheet.name
+                test_suite_id = check_exist_test_suite(test_suite_name)
+                #存在の場合（再開するシートで作成したテストスイートは除く）
+                if test_suite_id != None and not is_resumable(test_suite_name, sheet):
+                    test_suites_exist.append('  ▪ ' + test_suite_name)
     isExit = False
     #優先度の列が定義されていない場合にメセージエラーを表示する
     if len(no_priority_files) > 0:
@@ -588,25 +908,37 @@ def check_format_files():
 # マイン関数
 # -----------------------------------------------------------
 if __name__ == '__main__':
-    global _header_row_index
-    global _col_start_index
-    global _col_end_index
-    global _col_priority_index
     global _default_label_content
 
+    # コマンドラインオプション処理
+    import argparse
+    ap = argparse.ArgumentParser(description='指定した全てのファイルをテストスイートに追加する。')
+    ap.add_argument("--resume", action='store_true', help="中断したインポートをジャーナルから再開する（完了した操作は送信しない）")
+    args = ap.parse_args()
+
+    #送信する操作をジャーナルに記録する（再開しない場合は前回の記録を破棄する）
+    if settings.JOURNAL_PATH is not None:
+        _journal = ImportJournal(settings.JOURNAL_PATH)
+        if not args.resume:
+            _journal.clear()
+    elif args.resume:
+        print('--resumeを指定する場合はsettings.pyのJOURNAL_PATHを設定してください。')
+        exit()
+    _resume = args.resume
+
+    #APIのクライアントを設定する
+    qf_client.configure(pool_size=settings.POOL_SIZE, rate=settings.RATE_LIMIT, burst=settings.RATE_BURST,
+                        cache_path=settings.CACHE_PATH, cache_ttl=settings.CACHE_TTL)
+
     #project_idを取得する
     project_id, _default_label_content = get_project_info()
     if project_id is None:
         print('APIキーが不正です。')
         exit()
 
-    #QFから全てのテストスイートを取得する
+    #QFから全てのテストスイートを取得する（作成・削除の判断に使うため、ミラーではなく毎回APIから取得する）
     _test_suite_list = get_request_pages('test_suites', 'test_suites')
 
-    #重複ファイル名をチェックする
-    check_duplicate_file()
-    #ひとつでも読み込み不可のExcelシートがある場合は処理を中断し、エラーメッセージを表示する
-    check_format_files()
     #フォルダーのパスとファイルの一覧を取得する
     folders = load_files_in_folder()
 
@@ -615,100 +947,21 @@ if __name__ == '__main__':
         print('対象ファイルが見つかりません。')
         exit()
 
+    #重複ファイル名をチェックする
+    check_duplicate_file(folders)
+    #全てのエクセルファイルを一度だけロードする
+    workbooks = load_workbooks(folders)
+    #ひとつでも読み込み不可のExcelシートがある場合は処理を中断し、エラーメッセージを表示する
+    check_format_files(workbooks)
+
     #各ファイルをループする
-    for path, subdirs, files in folders:
-        for f in files:
-            #Excel以外のファイル拡張子
-            if EXCEL_EXTENSION not in f:
-                continue
+    for file_path, f, sheets in workbooks:
+        #各シートをループする
+        for sheet in sheets:
+            _test_suite_name = f[0:f.rindex('.')] + '-' + sheet.name
+            import_sheet(_test_suite_name, sheet)
 
-            #エクセルファイルのデータを全てロードする
-            ws_rows_list, _sheet_name_list = load_excel(path + '\\' + f, True)
-            sheet_index = 0
-
-            #各シートをループする
-            for ws_rows in ws_rows_list:
-                _header_row_index = 0
-                
-                #対象シートのフラグ
-                isTarget = False
-
-                #列インデックスの開始とヘッダー行インデックスを見つける
-                #最初の10列と10行だけを見つける
-                for r in ws_rows:
-                    #列の開始インデックスをリセットする
-                    _col_priority_index = 0
-                    for c in r:
-                        #最初の10列が終わったら、停止します
-                        if _col_priority_index > 20:
-                            break
-                        #「優先度」の列を見つけた場合
-                        if str(c.value).strip() == settings.COL_TITLE_START:
-                            #対象シート
-                            isTarget = True
-                            break
-                        _col_priority_index += 1
-
-                    #対象シートだ、または最初の10行が終わったら、停止します
-                    if isTarget or _header_row_index > 20:
-                        break
-                    _header_row_index += 1
-                
-                #列の定義が設定可能範囲より多いかどうかチェックする
-                _col_start_index = _col_priority_index + 1
-                _col_end_index = -1
-                i = _col_start_index
-
-                #列インポートの数を数える
-                while i < len(ws_rows[_header_row_index]):
-                    #セルが空の場合は、停止します
-                    if _col_start_index != -1 and (ws_rows[_header_row_index][i].value is None or str(ws_rows[_header_row_index][i].value).strip() == ''):
-                        _col_end_index = i - 1
-                        break
-                    elif i == len(ws_rows[_header_row_index]) - 1:
-                        _col_end_index = i
-                    i += 1
-                #新規テストスイートを作成する
-                _test_suite_name = f[0:f.rindex('.')] + '-' + _sheet_name_list[sheet_index]
-                test_suite_id = create_new_suite(_test_suite_name, ws_rows)
-
-                #新規テストスイートバージョンを作成する
-                test_suite_vs_id = create_new_tsv(test_suite_id)
-
-                #QFにテストケースを登録する
-                i = _header_row_index + 1   #読み取りを開始する行を指定します（ヘッダの行の次の行から）
-                tc_no = 1                   #テストケースNo
-
-                #各行をループして、QFに登録する
-                while i < len(ws_rows):
-                    #テストケースのフラグ
-                    isTestCase = False
-                    #テストケースかどうかをチェックする
-                    for c in ws_rows[i]:
-                        #空でないセルが少なくとも1つある場合、テストケースになります。
-                        if c.value is not None and str(c.value).strip() != '':
-                            isTestCase = True
-                            break
-                    #対象テストケースの場合
-                    if isTestCase:
-                        #テストケースを作成する
-                        if create_new_tc(test_suite_id, test_suite_vs_id, ws_rows[i]):
-                            print(str(i - _header_row_index) + '番目のテストケースの作成が合格しました。')
-                            tc_no += 1
-                        else:
-                            print(str(i - _header_row_index) + '番目のテストケースのインポートに失敗しました。')
-                    else:
-                        #対象外テストケースの場合、終了する
-                        break
-
-                    i += 1
-
-                #availableにstatusを編集する
-                if update_test_suite_version(test_suite_id, test_suite_vs_id):
-                    print('「' + _test_suite_name + '」テストスイートの' + str(i - _header_row_index - 1) + '件のテストケース作成が完了しました。')
-                
-                #シートの次
-                sheet_index += 1
-            
     print('テストケースのインポートが完了しました。')
+    qf_client.print_stats()
+    qf_client.export_metrics(settings.METRICS_DIR, 'import_test_case')
     exit()
\ No newline at end of file
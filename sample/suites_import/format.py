@@ -1,14 +1,24 @@
 try:
     from fractions import Fraction
     import datetime
+    import functools
     import locale
     import platform
     import math
+    import operator
+    import re
+    from openpyxl.utils.datetime import from_excel
 except ModuleNotFoundError as err:
     print('「' + err.name + '」のモジュールが見つかりません。以下のコマンドラインでインストールしてください。')
     print('>> pip install ' + err.name)
     exit()
 
+#列ごとの一括変換にのみ使う（ない場合は1セルずつ変換する）
+try:
+    import numpy as np
+except ModuleNotFoundError:
+    np = None
+
 #組み込みフォーマットの分数の定義
 BUILTIN_FORMATS_FRACTION = {
     '# ?/?' : 10,               #Up to one digit
@@ -25,6 +35,21 @@ BUILTIN_FORMATS_FRACTION = {
 TYPE_NUMERIC = 'n'
 #データ型は日付です
 TYPE_DATE = 'd'
+#コンパイルしたレンダラーを保持する数
+RENDERER_CACHE_SIZE = 1024
+#一括変換する最小のセル数（これより少ない場合は1セルずつ変換する）
+COLUMN_MIN_SIZE = 16
+#floatで正確に表せる整数の最大値
+MAX_EXACT_INT = 2 ** 53
+#Excelのシリアル値の基準日（1900年日付システム）
+EXCEL_EPOCH = datetime.datetime(1899, 12, 30)
+#strftimeの形式の分割（%で始まる指定子と、それ以外の文字列）
+DATE_TOKEN = re.compile(r'%[-#]?[A-Za-z%]|[^%]+')
+#一括変換できるstrftimeの指定子 → 日時の項目名
+DATE_FIELDS = {'Y': 'year', 'y': 'year2', 'm': 'month', 'd': 'day', 'H': 'hour', 'M': 'minute', 'S': 'second'}
+
+#ロケールを設定済みかどうか
+_locale_ready = False
 
 # -----------------------------------------------------------
 # 値をパーセント形式に変換する
@@ -51,20 +76,7 @@ def format_percent(val, format):
 #  変換した値
 # -----------------------------------------------------------
 def format_fraction(val, format):
-    whole = math.floor(Fraction(val))
-    frac = val - whole
-    fmt = BUILTIN_FORMATS_FRACTION[format]
-    if format.find('?/?') > -1:
-        return str(whole) + ' ' + str(Fraction(frac).limit_denominator(fmt))
-    else:
-        if (frac * fmt) - math.floor(frac * fmt) < 0.5:
-            #端数を切り捨てる
-            numerator = math.floor(frac * fmt)
-        else:
-            #端数を切り上げする
-            numerator = math.ceil(frac * fmt)
-        denominator = fmt
-        return str(whole) + ' ' + str(numerator) + '/' + str(denominator)
+    return compile_fraction(format)(val)
 
 # -----------------------------------------------------------
 # 値を数値形式に変換する
@@ -77,17 +89,7 @@ def format_fraction(val, format):
 #  変換した値
 # -----------------------------------------------------------
 def format_numberic(val, format):
-    comma_index = format.find('.')
-    digits = 0
-    i = comma_index + 1
-    #ドットの後の数を数える
-    while i < len(format):
-        if format[i] == '0':
-            digits += 1
-        else:
-            break
-        i += 1
-    return ('{:.' + str(digits) + 'f}').format(val)
+    return ('{:.' + str(count_decimal_digits(format)) + 'f}').format(val)
 
 # -----------------------------------------------------------
 # 値を科学形式に変換する
@@ -100,17 +102,7 @@ def format_numberic(val, format):
 #  変換した値
 # -----------------------------------------------------------
 def format_scientific(val, format):
-    comma_index = format.find('.')
-    digits = 0
-    i = comma_index + 1
-    #ドットの後の数を数える
-    while i < len(format):
-        if format[i] == '0':
-            digits += 1
-        else:
-            break
-        i += 1
-    return ('{:.' + str(digits) + 'E}').format(val)
+    return ('{:.' + str(count_decimal_digits(format)) + 'E}').format(val)
 
 # -----------------------------------------------------------
 # 値を通貨形式に変換する
@@ -123,42 +115,34 @@ def format_scientific(val, format):
 #  変換した値
 # -----------------------------------------------------------
 def format_currency(val, format):
-    comma_index = format.find('.')
-    digits = 0
-    i = comma_index + 1
-    #ドットの後の数を数える
-    while i < len(format):
-        if format[i] == '0':
-            digits += 1
-        else:
-            break
-        i += 1
-
-    #通貨のユニット（例：￥）
-    prex = ''
+    #通貨のユニット（例：￥）を付ける
+    return (get_currency_unit(format) + '{:,.' + str(count_decimal_digits(format)) + 'f}').format(val)
 
-    #通貨のユニットを取得する
-    if format.find('"') > -1:
-        j = format.find('"') + 1
-        while j < len(format):
-            if format[j] == '"':
-                break
-            prex = format[j]
-            j += 1
-    return (prex + '{:,.' + str(digits) + 'f}').format(val)
+# -----------------------------------------------------------
+# 日付の表示形式を読み込み、ロケールを一度だけ設定する
+#   Windowsでは日本語の表示形式をstrftimeで扱うためにcp932を設定する
+#   それ以外の環境では設定できないため、そのままの設定を使う
+# -----------------------------------------------------------
+def setup_locale():
+    global _locale_ready
+    if _locale_ready:
+        return
+    _locale_ready = True
+    try:
+        locale.setlocale(locale.LC_CTYPE, "Japanese_Japan.932")
+    except locale.Error:
+        pass
 
 # -----------------------------------------------------------
-# 値を日付形式に変換する
+# Excelの日付形式をstrftimeの形式に変換する
 #
 # Parameters:
-#  val（float）：Excelから読み取る値
 #  format（str）：Excelから読み取る形式
 #
 # Returns:
-#  変換した値
+#  fmt（str）：strftimeの形式
 # -----------------------------------------------------------
-def format_datetime(val, format):
-    locale.setlocale(locale.LC_CTYPE, "Japanese_Japan.932")
+def build_datetime_pattern(format):
     if platform.system() == 'Windows':
         padding = '#'
     else:
@@ -213,39 +197,298 @@ def format_datetime(val, format):
     if fmt.find(']') > -1:
         fmt = fmt[fmt.index(']') + 1 : len(fmt)]
 
-    return val.strftime(fmt)
+    return fmt
 
 # -----------------------------------------------------------
-# 値をExcelの形式に変換する
+# 値を日付形式に変換する
 #
 # Parameters:
 #  val（float）：Excelから読み取る値
-#  type（str）：データタイプ
 #  format（str）：Excelから読み取る形式
 #
 # Returns:
 #  変換した値
 # -----------------------------------------------------------
-def format_value(val, type, format):
-    data = val
+def format_datetime(val, format):
+    setup_locale()
+    return val.strftime(build_datetime_pattern(format))
+
+# -----------------------------------------------------------
+# 小数点の後の「0」の数を数える
+#
+# Parameters:
+#  format（str）：Excelから読み取る形式
+#
+# Returns:
+#  digits（int）：小数点以下の桁数
+# -----------------------------------------------------------
+def count_decimal_digits(format):
+    comma_index = format.find('.')
+    digits = 0
+    i = comma_index + 1
+    #ドットの後の数を数える
+    while i < len(format):
+        if format[i] == '0':
+            digits += 1
+        else:
+            break
+        i += 1
+    return digits
+
+# -----------------------------------------------------------
+# 通貨のユニット（例：￥）を取得する
+#
+# Parameters:
+#  format（str）：Excelから読み取る形式
+#
+# Returns:
+#  prex（str）：通貨のユニット
+# -----------------------------------------------------------
+def get_currency_unit(format):
+    prex = ''
+    if format.find('"') > -1:
+        j = format.find('"') + 1
+        while j < len(format):
+            if format[j] == '"':
+                break
+            prex = format[j]
+            j += 1
+    return prex
+
+# -----------------------------------------------------------
+# 分数形式のレンダラーを作成する
+#
+# Parameters:
+#  format（str）：Excelから読み取る形式
+#
+# Returns:
+#  render（function）：値を受け取り、変換した文字列を返す関数
+# -----------------------------------------------------------
+def compile_fraction(format):
+    fmt = BUILTIN_FORMATS_FRACTION[format]
+    if format.find('?/?') > -1:
+        def render(val):
+            whole = math.floor(Fraction(val))
+            return str(whole) + ' ' + str(Fraction(val - whole).limit_denominator(fmt))
+    else:
+        def render(val):
+            whole = math.floor(Fraction(val))
+            frac = val - whole
+            if (frac * fmt) - math.floor(frac * fmt) < 0.5:
+                #端数を切り捨てる
+                numerator = math.floor(frac * fmt)
+            else:
+                #端数を切り上げする
+                numerator = math.ceil(frac * fmt)
+            return str(whole) + ' ' + str(numerator) + '/' + str(fmt)
+    return render
+
+# -----------------------------------------------------------
+# データタイプと形式から値を変換する関数（レンダラー）を作成する
+#   形式の解析はキー（データタイプ, 形式）ごとに一度だけ行い、結果をキャッシュする
+#
+# Parameters:
+#  type（str）：データタイプ
+#  format（str）：Excelから読み取る形式
+#
+# Returns:
+#  render（function）：値を受け取り、変換した文字列を返す関数
+# -----------------------------------------------------------
+@functools.lru_cache(maxsize=RENDERER_CACHE_SIZE)
+def compile_format(type, format):
     #数値の場合
     if type == TYPE_NUMERIC:
         if format.find('#,#') > -1:
             #通貨の形式の場合
-            data = format_currency(val, format)
+            return (get_currency_unit(format) + '{:,.' + str(count_decimal_digits(format)) + 'f}').format
         elif format.find('0%') > -1:
             #パーセントの形式の場合
-            data = format_percent(val, format)
+            num = len(format[format.rindex('.') + 1 : format.rindex('%')])
+            return ('{:.' + str(num) + '%}').format
         elif format.find('?/') > -1:
             #分数の形式の場合
-            data = format_fraction(val, format)
+            return compile_fraction(format)
         elif format.find('E+0') > -1:
             #科学の形式の場合
-            data = format_scientific(val, format)
+            return ('{:.' + str(count_decimal_digits(format)) + 'E}').format
         elif format.find('0.0') > -1:
             #数値の形式の場合
-            data = format_numberic(val, format)
+            return ('{:.' + str(count_decimal_digits(format)) + 'f}').format
     #日付の場合
     elif type == TYPE_DATE:
-        data = format_datetime(val, format)
-    return str(data)
\ No newline at end of file
+        setup_locale()
+        pattern = build_datetime_pattern(format)
+        return lambda val: val.strftime(pattern)
+    return str
+
+# -----------------------------------------------------------
+# 値をExcelの形式に変換する
+#
+# Parameters:
+#  val（float）：Excelから読み取る値
+#  type（str）：データタイプ
+#  format（str）：Excelから読み取る形式
+#
+# Returns:
+#  変換した値
+# -----------------------------------------------------------
+def format_value(val, type, format):
+    return compile_format(type, format)(val)
+
+# -----------------------------------------------------------
+# 同じデータタイプと形式の値をまとめて変換する（列単位）
+#   結果はformat_valueで1セルずつ変換した文字列と同じになる
+#   ・分数：整数部と端数をNumPyで一括計算する
+#   ・日付：strftimeの形式を「%」の書式に変換し、日時の各項目から一括で作成する
+#           Excelのシリアル値はNumPyで日時の各項目を計算する
+#   ・それ以外：コンパイル済みのレンダラーを列に適用する
+#     （str.formatの方がNumPyの文字列変換より速いため）
+#
+# Parameters:
+#  values（array）：Excelから読み取る値のリスト（日付はExcelのシリアル値も可）
+#  type（str）：データタイプ
+#  format（str）：Excelから読み取る形式
+#
+# Returns:
+#  変換した値のリスト
+# -----------------------------------------------------------
+def format_column(values, type, format):
+    values = list(values)
+    ret = None
+    if type == TYPE_DATE:
+        ret = _format_date_column(values, format)
+        if ret is None:
+            #Excelのシリアル値は日時に変換する
+            values = [from_excel(val) if isinstance(val, (int, float)) else val for val in values]
+    elif type == TYPE_NUMERIC and _is_fraction_format(format):
+        ret = _format_fraction_column(values, format)
+    if ret is not None:
+        return ret
+    return list(map(compile_format(type, format), values))
+
+# -----------------------------------------------------------
+# compile_formatで分数の形式として扱われるかどうか
+# -----------------------------------------------------------
+def _is_fraction_format(format):
+    return format.find('#,#') == -1 and format.find('0%') == -1 and format.find('?/') > -1
+
+# -----------------------------------------------------------
+# 値のリストをfloatの配列に変換する
+#   floatで正確に表せない値がある場合はNoneを返す
+# -----------------------------------------------------------
+def _to_float_array(values):
+    for val in values:
+        if type(val) is float:
+            continue
+        if type(val) is not int or abs(val) > MAX_EXACT_INT:
+            return None
+    return np.array(values, dtype=np.float64)
+
+# -----------------------------------------------------------
+# 分数の列を一括変換する
+#   「?/?」の形式は同じ端数ごとに一度だけFractionで近似する
+# -----------------------------------------------------------
+def _format_fraction_column(values, format):
+    if np is None or len(values) < COLUMN_MIN_SIZE:
+        return None
+    arr = _to_float_array(values)
+    if arr is None:
+        return None
+    fmt = BUILTIN_FORMATS_FRACTION[format]
+    whole = np.floor(arr)
+    frac = arr - whole
+    wholes = whole.astype(np.int64).tolist()
+    if format.find('?/?') > -1:
+        uniq, inverse = np.unique(frac, return_inverse=True)
+        fractions = [str(Fraction(f).limit_denominator(fmt)) for f in uniq.tolist()]
+        return [str(w) + ' ' + fractions[k] for w, k in zip(wholes, inverse.reshape(-1).tolist())]
+    scaled = frac * fmt
+    floor = np.floor(scaled)
+    #端数を切り捨てる、または切り上げする
+    numerators = np.where(scaled - floor < 0.5, floor, np.ceil(scaled)).astype(np.int64).tolist()
+    denominator = '/' + str(fmt)
+    return [str(w) + ' ' + str(n) + denominator for w, n in zip(wholes, numerators)]
+
+# -----------------------------------------------------------
+# strftimeの形式を「%」の書式と日時の項目名に変換する
+#   数字だけの指定子（年・月・日・時・分・秒）で構成される形式のみ変換する
+#
+# Parameters:
+#  format（str）：Excelから読み取る形式
+#
+# Returns:
+#  template（str）：「%」の書式（変換できない場合はNone）
+#  fields（tuple）：書式に渡す日時の項目名
+# -----------------------------------------------------------
+@functools.lru_cache(maxsize=RENDERER_CACHE_SIZE)
+def compile_date_template(format):
+    pattern = build_datetime_pattern(format)
+    tokens = DATE_TOKEN.findall(pattern)
+    if ''.join(tokens) != pattern:
+        return None, ()
+    template = ''
+    fields = []
+    for token in tokens:
+        if token == '%%':
+            template += '%%'
+        elif token.startswith('%'):
+            if token[-1] not in DATE_FIELDS:
+                return None, ()
+            fields.append(DATE_FIELDS[token[-1]])
+            #「%-m」「%#m」は0埋めしない
+            template += '%02d' if len(token) == 2 and token[-1] != 'Y' else '%d'
+        else:
+            template += token.replace('%', '%%')
+    return template, tuple(fields)
+
+# -----------------------------------------------------------
+# 日付の列を一括変換する
+#   datetime（またはdate）とExcelのシリアル値（1以上）を受け付ける
+#   変換できない値が含まれる場合はNoneを返す
+# -----------------------------------------------------------
+def _format_date_column(values, format):
+    template, fields = compile_date_template(format)
+    if template is None or len(values) == 0:
+        return None
+
+    if all(type(val) is datetime.datetime for val in values) or (
+            all(type(val) is datetime.date for val in values) and not set(fields) & {'hour', 'minute', 'second'}):
+        #strftimeの年の桁数が環境によって異なるため、4桁の年のみ一括変換する
+        if 'year' in fields and not all(1000 <= val.year <= 9999 for val in values):
+            return None
+        if len(fields) > 1 and 'year2' not in fields:
+            rows = map(operator.attrgetter(*fields), values)
+        else:
+            getters = [(lambda val: val.year % 100) if f == 'year2' else operator.attrgetter(f) for f in fields]
+            rows = (tuple(get(val) for get in getters) for val in values)
+        return [template % row for row in rows]
+
+    #Excelのシリアル値
+    if np is None or len(values) < COLUMN_MIN_SIZE:
+        return None
+    serial = _to_float_array(values)
+    #1未満は時刻のみ（datetime.time）になるため一括変換しない
+    if serial is None or serial.min() < 1:
+        return None
+    day = np.floor(serial)
+    millis = np.round((serial - day) * 86400 * 1000).astype(np.int64)
+    #1900年2月29日（60）より前はExcelの日付が1日ずれる
+    day = np.where(serial < 60, day + 1, day).astype(np.int64)
+    dt = (np.datetime64(EXCEL_EPOCH, 'ms') + day.astype('timedelta64[D]') + millis.astype('timedelta64[ms]'))
+
+    years = dt.astype('datetime64[Y]').astype(np.int64) + 1970
+    if years.min() < 1000 or years.max() > 9999:
+        return None
+    seconds = (dt - dt.astype('datetime64[D]')).astype('timedelta64[s]').astype(np.int64)
+    columns = {
+        'year': years,
+        'year2': years % 100,
+        'month': dt.astype('datetime64[M]').astype(np.int64) % 12 + 1,
+        'day': (dt.astype('datetime64[D]') - dt.astype('datetime64[M]')).astype(np.int64) + 1,
+        'hour': seconds // 3600,
+        'minute': seconds // 60 % 60,
+        'second': seconds % 60,
+    }
+    if not fields:
+        return [template % ()] * len(values)
+    return [template % row for row in zip(*[columns[f].tolist() for f in fields])]
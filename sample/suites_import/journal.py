@@ -0,0 +1,173 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+#【定数】
+#記録する操作（テストスイート作成・テストスイートバージョン作成・テストケース作成・ステータス更新）
+OP_SUITE = 'create_suite'
+OP_VERSION = 'create_version'
+OP_CASE = 'create_case'
+OP_STATUS = 'update_status'
+#操作の状態（計画済み・送信中・完了）
+#  送信中のまま残った操作は、サーバに反映されたかどうかが分からないため再開時に確認する
+STATE_PLANNED = 'planned'
+STATE_SENT = 'sent'
+STATE_DONE = 'done'
+
+# -----------------------------------------------------------
+# シートの内容のハッシュを計算する（ラベルと各行の登録データ）
+#
+# Parameters:
+#  sheet（SheetPayload）：解析済みのシート
+#
+# Returns:
+#  digest（str）：SHA-1
+# -----------------------------------------------------------
+def sheet_digest(sheet):
+    return hashlib.sha1(json.dumps([sheet.labels, sheet.rows], ensure_ascii=False).encode('utf-8')).hexdigest()
+
+# -----------------------------------------------------------
+# ジャーナルに記録されたシートのインポートの進み具合
+#
+# Parameters:
+#  key（str）：テストスイート名
+#  replaced_suite_id（int）：インポート開始時に存在した同名のテストスイート番号（ない場合はNone）
+#  operations（dict）：(操作, 番号) → (状態, 作成されたID)
+# -----------------------------------------------------------
+class JournalSheet:
+    def __init__(self, key, replaced_suite_id, operations):
+        self.key = key
+        self.replaced_suite_id = replaced_suite_id
+        self.operations = operations
+
+    def state(self, op, seq=0):
+        return self.operations.get((op, seq), (STATE_PLANNED, None))[0]
+
+    def result_id(self, op, seq=0):
+        return self.operations.get((op, seq), (STATE_PLANNED, None))[1]
+
+    # -----------------------------------------------------------
+    # 完了していないテストケースの作成
+    #
+    # Returns:
+    #  ret（array）：(テストケースNo, 状態)のリスト（テストケースNo順）
+    # -----------------------------------------------------------
+    def pending_cases(self):
+        return sorted((seq, state) for (op, seq), (state, _) in self.operations.items()
+                      if op == OP_CASE and state != STATE_DONE)
+
+    def is_complete(self):
+        return self.state(OP_STATUS) == STATE_DONE
+
+# -----------------------------------------------------------
+# テストスイートのインポートの先行書き込みジャーナル（SQLite）
+#   シートごとに全ての操作を送信前に計画済みとして記録し、
+#   送信直前に送信中、応答を受け取ったら作成されたIDと共に完了にする
+#   中断した場合は、完了していない操作だけを記録済みのIDを使って再開できる
+#
+# Parameters:
+#  path（str）：ジャーナルファイルのパス
+# -----------------------------------------------------------
+class ImportJournal:
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        #テストケースの作成は複数のスレッドから記録する
+        self._conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS sheets ('
+                           'key TEXT PRIMARY KEY, digest TEXT NOT NULL, replaced_suite_id INTEGER, started_at REAL NOT NULL)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS operations ('
+                           'key TEXT NOT NULL, op TEXT NOT NULL, seq INTEGER NOT NULL, state TEXT NOT NULL, '
+                           'result_id INTEGER, updated_at REAL NOT NULL, PRIMARY KEY (key, op, seq)) WITHOUT ROWID')
+
+    # -----------------------------------------------------------
+    # 全ての記録を削除する（再開しない実行の開始時）
+    # -----------------------------------------------------------
+    def clear(self):
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.execute('DELETE FROM operations')
+            self._conn.execute('DELETE FROM sheets')
+            self._conn.execute('COMMIT')
+
+    # -----------------------------------------------------------
+    # シートのインポートで送信する全ての操作を計画済みとして記録する
+    #   同じシートの以前の記録は置き換える
+    #
+    # Parameters:
+    #  key（str）：テストスイート名
+    #  digest（str）：シートの内容のハッシュ
+    #  row_count（int）：テストケースの件数
+    #  replaced_suite_id（int）：同名の既存テストスイート番号（ない場合はNone）
+    # -----------------------------------------------------------
+    def begin_sheet(self, key, digest, row_count, replaced_suite_id):
+        now = time.time()
+        operations = [(key, OP_SUITE, 0, STATE_PLANNED, None, now), (key, OP_VERSION, 0, STATE_PLANNED, None, now)]
+        operations.extend((key, OP_CASE, tc_no, STATE_PLANNED, None, now) for tc_no in range(1, row_count + 1))
+        operations.append((key, OP_STATUS, 0, STATE_PLANNED, None, now))
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.execute('DELETE FROM operations WHERE key = ?', (key,))
+            self._conn.execute('INSERT OR REPLACE INTO sheets VALUES (?, ?, ?, ?)', (key, digest, replaced_suite_id, now))
+            self._conn.executemany('INSERT INTO operations VALUES (?, ?, ?, ?, ?, ?)', operations)
+            self._conn.execute('COMMIT')
+
+    # -----------------------------------------------------------
+    # シートの記録を取得する
+    #
+    # Parameters:
+    #  key（str）：テストスイート名
+    #  digest（str）：シートの内容のハッシュ
+    #
+    # Returns:
+    #  sheet（JournalSheet）：記録（ない場合、またはシートの内容が変わった場合はNone）
+    # -----------------------------------------------------------
+    def load_sheet(self, key, digest):
+        with self._lock:
+            row = self._conn.execute('SELECT digest, replaced_suite_id FROM sheets WHERE key = ?', (key,)).fetchone()
+            if row is None or row[0] != digest:
+                return None
+            operations = {(op, seq): (state, result_id) for op, seq, state, result_id in
+                          self._conn.execute('SELECT op, seq, state, result_id FROM operations WHERE key = ?', (key,))}
+        return JournalSheet(key, row[1], operations)
+
+    def mark_sent(self, key, op, seq=0):
+        self._mark(key, op, seq, STATE_SENT, None)
+
+    def mark_done(self, key, op, seq=0, result_id=None):
+        self._mark(key, op, seq, STATE_DONE, result_id)
+
+    # -----------------------------------------------------------
+    # 送信に失敗した（サーバがエラーを応答した）操作を計画済みに戻す
+    # -----------------------------------------------------------
+    def mark_planned(self, key, op, seq=0):
+        self._mark(key, op, seq, STATE_PLANNED, None)
+
+    # -----------------------------------------------------------
+    # 複数のテストケースの作成を完了にする（再開時にサーバで確認できたもの）
+    #
+    # Parameters:
+    #  key（str）：テストスイート名
+    #  tc_nos（array）：テストケースNoのリスト
+    # -----------------------------------------------------------
+    def mark_cases_done(self, key, tc_nos):
+        now = time.time()
+        with self._lock:
+            self._conn.execute('BEGIN')
+            self._conn.executemany('UPDATE operations SET state = ?, updated_at = ? WHERE key = ? AND op = ? AND seq = ?',
+                                   [(STATE_DONE, now, key, OP_CASE, tc_no) for tc_no in tc_nos])
+            self._conn.execute('COMMIT')
+
+    def close(self):
+        self._conn.close()
+
+    def _mark(self, key, op, seq, state, result_id):
+        with self._lock:
+            self._conn.execute('UPDATE operations SET state = ?, result_id = ?, updated_at = ? WHERE key = ? AND op = ? AND seq = ?',
+                               (state, result_id, time.time(), key, op, seq))
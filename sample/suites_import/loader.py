@@ -0,0 +1,275 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+try:
+    import os
+    import urllib.parse
+    from collections import namedtuple
+    from concurrent.futures import ProcessPoolExecutor
+    from openpyxl import load_workbook
+    import settings
+    from format import format_column
+except ModuleNotFoundError as err:
+    print('「' + err.name + '」のモジュールが見つかりません。以下のコマンドラインでインストールしてください。')
+    print('>> pip install ' + err.name)
+    exit()
+
+#【定数】
+#ヘッダー行と「優先度」の列を探す範囲
+HEADER_SEARCH_LIMIT = 20
+
+#セルの値・データ型・表示形式
+Cell = namedtuple('Cell', ['value', 'data_type', 'number_format'])
+
+#解析済みのシート（プロセス間で受け渡すため、文字列とリストだけを持つ）
+#  name：シート名
+#  is_target：「優先度」の列があるかどうか
+#  col_import_num：インポートする列の数
+#  labels：ヘッダーのラベル（「優先度」と空のセルを除く）
+#  rows：テストケースごとのエンコード済みの登録データ（優先度と各カテゴリ）
+SheetPayload = namedtuple('SheetPayload', ['name', 'is_target', 'col_import_num', 'labels', 'rows'])
+
+# -----------------------------------------------------------
+# シートのデータとヘッダーの位置
+#
+# Parameters:
+#  name（str）：シート名
+#  rows（array）：各行のセル（Cell）のリスト
+# -----------------------------------------------------------
+class SheetModel:
+    def __init__(self, name, rows):
+        self.name = name
+        self.rows = rows
+        self.is_target = False          #「優先度」の列があるかどうか
+        self.header_row_index = 0       #ヘッダー行のインデックス
+        self.col_priority_index = 0     #「優先度」の列のインデックス
+        self.col_start_index = 0        #読み取りを開始する列のインデックス
+        self.col_end_index = -1         #読み取りを終了する列のインデックス
+        self._find_header()
+
+    # -----------------------------------------------------------
+    # ヘッダー行と読み取る列の範囲を見つける
+    # -----------------------------------------------------------
+    def _find_header(self):
+        #列インデックスの開始とヘッダー行インデックスを見つける
+        #最初の20列と20行だけを見つける
+        for r in self.rows:
+            #列の開始インデックスをリセットする
+            self.col_priority_index = 0
+            for c in r:
+                #最初の20列が終わったら、停止します
+                if self.col_priority_index > HEADER_SEARCH_LIMIT:
+                    break
+                #「優先度」の列を見つけた場合
+                if str(c.value).strip() == settings.COL_TITLE_START:
+                    #対象シート
+                    self.is_target = True
+                    break
+                self.col_priority_index += 1
+
+            #対象シートだ、または最初の20行が終わったら、停止します
+            if self.is_target or self.header_row_index > HEADER_SEARCH_LIMIT:
+                break
+            self.header_row_index += 1
+
+        if self.is_target == False:
+            return
+
+        #読み取る列の範囲を見つける
+        header = self.rows[self.header_row_index]
+        self.col_start_index = self.col_priority_index + 1
+        i = self.col_start_index
+        while i < len(header):
+            #セルが空の場合は、停止します
+            if header[i].value is None or str(header[i].value).strip() == '':
+                self.col_end_index = i - 1
+                break
+            elif i == len(header) - 1:
+                self.col_end_index = i
+            i += 1
+
+    # -----------------------------------------------------------
+    # インポートする列の数
+    # -----------------------------------------------------------
+    @property
+    def col_import_num(self):
+        return self.col_end_index - self.col_start_index + 1
+
+# -----------------------------------------------------------
+# エクセルファイルを一度だけ開き、表示されている全シートを読み込む
+#
+# Parameters:
+#  file_path（str）：エクセルファイルのパス
+#
+# Returns:
+#  sheets（array）：表示されているシート（SheetModel）のリスト
+#
+# Exception：ファイルが見つからない時にFileNotFoundErrorをスローする
+# -----------------------------------------------------------
+def load_sheets(file_path):
+    sheets = []
+    wb = load_workbook(filename=file_path, read_only=True, data_only=True, keep_links=False)
+    try:
+        for ws in wb.worksheets:
+            #表示されているシートのみを取得します
+            if ws.sheet_state != 'visible':
+                continue
+            rows = [[Cell(c.value, c.data_type, c.number_format) for c in r] for r in ws.rows]
+            sheets.append(SheetModel(ws.title, rows))
+    finally:
+        wb.close()
+    return sheets
+
+# -----------------------------------------------------------
+# シートのヘッダーとテストケースを登録データにエンコードする
+#
+# Parameters:
+#  sheet（SheetModel）：シートのデータとヘッダーの位置
+#
+# Returns:
+#  payload（SheetPayload）：解析済みのシート
+# -----------------------------------------------------------
+def encode_sheet(sheet):
+    labels = []
+    rows = []
+    if sheet.is_target == False:
+        return SheetPayload(sheet.name, False, sheet.col_import_num, labels, rows)
+
+    #ヘッダーのラベルを取得する
+    header = sheet.rows[sheet.header_row_index]
+    for j in range(sheet.col_start_index, sheet.col_end_index + 1):
+        val = header[j].value
+        if val is not None and str(val).strip() != '' and str(val).strip() != settings.COL_TITLE_START:
+            labels.append(str(val))
+
+    #登録対象の行を集める
+    target_rows = []
+    i = sheet.header_row_index + 1   #読み取りを開始する行を指定します（ヘッダの行の次の行から）
+    while i < len(sheet.rows):
+        #空でないセルが少なくとも1つある場合、テストケースになります。
+        isTestCase = False
+        for c in sheet.rows[i]:
+            if c.value is not None and str(c.value).strip() != '':
+                isTestCase = True
+                break
+        #対象外テストケースの場合、終了する
+        if isTestCase == False:
+            break
+        target_rows.append(sheet.rows[i])
+        i += 1
+
+    #優先度
+    for data_row in target_rows:
+        if data_row[sheet.col_priority_index].value is not None:
+            rows.append('&test_case[priority]=' + str(data_row[sheet.col_priority_index].value))
+        else:
+            rows.append('')
+
+    no = 1  #カテゴリのインデックス
+    #各列のデータを可能範囲で列ごとに変換する
+    for j in range(sheet.col_start_index, sheet.col_end_index + 1):
+        if j == sheet.col_priority_index:
+            continue
+        key = '&test_case[category' + str(no) + ']='
+        texts = format_cells([data_row[j] for data_row in target_rows])
+        for r, val in enumerate(texts):
+            if val is not None:
+                rows[r] = rows[r] + key + urllib.parse.quote(val)
+        no += 1
+    return SheetPayload(sheet.name, True, sheet.col_import_num, labels, rows)
+
+# -----------------------------------------------------------
+# 列のセルを文字列に変換する
+#   列の中で同じデータタイプと形式のセルをまとめてformat_columnで変換する
+#
+# Parameters:
+#  cells（array）：列のセル（Cell）のリスト
+#
+# Returns:
+#  texts（array）：変換した値のリスト（空のセルはNone）
+# -----------------------------------------------------------
+def format_cells(cells):
+    texts = [None] * len(cells)
+    groups = {}
+    for r, c in enumerate(cells):
+        if c.value is None:
+            continue
+        if c.data_type == 's':
+            texts[r] = str(c.value)
+        else:
+            groups.setdefault((c.data_type, c.number_format), []).append(r)
+
+    for (data_type, number_format), indexes in groups.items():
+        values = format_column([cells[r].value for r in indexes], data_type, number_format)
+        for r, val in zip(indexes, values):
+            texts[r] = val
+    return texts
+
+# -----------------------------------------------------------
+# エクセルファイルを読み込み、全シートを登録データにエンコードする
+#
+# Parameters:
+#  file_path（str）：エクセルファイルのパス
+#
+# Returns:
+#  payloads（array）：解析済みのシート（SheetPayload）のリスト
+#
+# Exception：ファイルが見つからない時にFileNotFoundErrorをスローする
+# -----------------------------------------------------------
+def parse_workbook(file_path):
+    return [encode_sheet(sheet) for sheet in load_sheets(file_path)]
+
+# -----------------------------------------------------------
+# 複数のエクセルファイルをプロセスプールで並列に解析する
+#   子プロセスからはエンコード済みの文字列だけを返すため、セルの情報は親プロセスに転送しない
+#   キャッシュを指定した場合は、前回から変更のないファイルを解析せずにキャッシュから返す
+#
+# Parameters:
+#  file_paths（array）：エクセルファイルのパスのリスト
+#  workers（int）：解析するプロセス数（0の場合はCPU数、1の場合は並列化しない）
+#  cache（ParseCache）：解析結果のキャッシュ（Noneの場合は使わない）
+#
+# Returns:
+#  (ファイルのパス, 解析済みのシートのリスト) をファイルの順番で返す
+#  ※ファイルが見つからない時はシートのリストがNone
+# -----------------------------------------------------------
+def parse_workbooks(file_paths, workers=0, cache=None):
+    if cache is None:
+        yield from _parse_all(file_paths, workers)
+        return
+
+    cached = {}
+    digests = {}
+    for file_path in file_paths:
+        payloads, digests[file_path] = cache.lookup(file_path)
+        if payloads is not None:
+            cached[file_path] = payloads
+    #キャッシュにないファイルだけを解析し、元の順番に戻す
+    parsed = _parse_all([x for x in file_paths if x not in cached], workers)
+    for file_path in file_paths:
+        if file_path in cached:
+            yield file_path, cached[file_path]
+            continue
+        _, payloads = next(parsed)
+        if payloads is not None and digests[file_path] is not None:
+            cache.store(digests[file_path], payloads)
+        yield file_path, payloads
+
+def _parse_all(file_paths, workers):
+    if workers <= 0:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(file_paths))
+    if workers <= 1:
+        for file_path in file_paths:
+            yield file_path, _parse_or_none(file_path)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        #ファイル数が多い場合はまとめて渡し、プロセス間の通信回数を減らす
+        chunksize = max(1, len(file_paths) // (workers * 4))
+        for file_path, payloads in zip(file_paths, executor.map(_parse_or_none, file_paths, chunksize=chunksize)):
+            yield file_path, payloads
+
+def _parse_or_none(file_path):
+    try:
+        return parse_workbook(file_path)
+    except FileNotFoundError:
+        return None
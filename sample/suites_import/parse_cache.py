@@ -0,0 +1,147 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import hashlib
+import marshal
+import os
+import sqlite3
+import time
+import zlib
+
+import settings
+from loader import SheetPayload
+
+#【定数】
+#キャッシュの最大サイズ（超えた場合は最後に使ってから最も古いものを削除する）
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+#ファイルのハッシュを計算する1回あたりのバイト数
+HASH_CHUNK_SIZE = 1024 * 1024
+#解析結果に影響するモジュールと設定（変わった場合はキャッシュを使わない）
+RULE_MODULES = ('loader.py', 'format.py', 'parse_cache.py')
+RULE_SETTINGS = ('COL_TITLE_START',)
+
+# -----------------------------------------------------------
+# 解析ルールのバージョンを計算する
+#   loader.py・format.pyの内容と解析に使う設定値のハッシュ
+#
+# Returns:
+#  version（str）：バージョン
+# -----------------------------------------------------------
+def rules_version():
+    digest = hashlib.sha1()
+    base_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in RULE_MODULES:
+        with open(os.path.join(base_dir, name), 'rb') as f:
+            digest.update(f.read())
+    for name in RULE_SETTINGS:
+        digest.update(repr(getattr(settings, name)).encode('utf-8'))
+    return digest.hexdigest()
+
+# -----------------------------------------------------------
+# ファイルの内容のハッシュを計算する
+#
+# Parameters:
+#  file_path（str）：ファイルのパス
+#
+# Returns:
+#  digest（str）：SHA-256
+# -----------------------------------------------------------
+def file_digest(file_path):
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+# -----------------------------------------------------------
+# 解析済みのシートをバイト列に変換する（marshal＋zlib）
+# -----------------------------------------------------------
+def dump_payloads(payloads):
+    return zlib.compress(marshal.dumps([tuple(x) for x in payloads]), 1)
+
+def load_payloads(body):
+    return [SheetPayload(*x) for x in marshal.loads(zlib.decompress(body))]
+
+# -----------------------------------------------------------
+# エクセルファイルの解析結果をSQLiteに保存するキャッシュ
+#   パス・サイズ・更新日時が前回と同じファイルはハッシュを計算せずに使う
+#   変わっていた場合は内容のハッシュで引き直す（内容が同じなら解析しない）
+#   解析ルールのバージョンが変わった場合は全て破棄する
+#
+# Parameters:
+#  path（str）：キャッシュファイルのパス
+#  max_bytes（int）：キャッシュの最大サイズ
+# -----------------------------------------------------------
+class ParseCache:
+    def __init__(self, path, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.version = rules_version()
+        self.hits = 0
+        self.misses = 0
+        self._conn = sqlite3.connect(path, isolation_level=None)
+        self._conn.execute('PRAGMA journal_mode=WAL')
+        self._conn.execute('PRAGMA synchronous=NORMAL')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS files ('
+                           'path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, digest TEXT NOT NULL)')
+        self._conn.execute('CREATE TABLE IF NOT EXISTS workbooks ('
+                           'digest TEXT PRIMARY KEY, version TEXT NOT NULL, body BLOB NOT NULL, '
+                           'size INTEGER NOT NULL, accessed_at REAL NOT NULL)')
+        self._conn.execute('CREATE INDEX IF NOT EXISTS workbooks_accessed ON workbooks (accessed_at)')
+        #解析ルールが変わった解析結果を破棄する
+        self._conn.execute('DELETE FROM workbooks WHERE version != ?', (self.version,))
+
+    # -----------------------------------------------------------
+    # 解析結果を取得する
+    #
+    # Parameters:
+    #  file_path（str）：エクセルファイルのパス
+    #
+    # Returns:
+    #  payloads（array）：解析済みのシートのリスト（キャッシュにない場合はNone）
+    #  digest（str）：ファイルの内容のハッシュ（storeに渡す。ファイルがない場合はNone）
+    # -----------------------------------------------------------
+    def lookup(self, file_path):
+        try:
+            stat = os.stat(file_path)
+        except FileNotFoundError:
+            return None, None
+        key = os.path.abspath(file_path)
+        row = self._conn.execute('SELECT size, mtime_ns, digest FROM files WHERE path = ?', (key,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            digest = row[2]
+        else:
+            digest = file_digest(file_path)
+            self._conn.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)', (key, stat.st_size, stat.st_mtime_ns, digest))
+        row = self._conn.execute('SELECT body FROM workbooks WHERE digest = ?', (digest,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None, digest
+        self._conn.execute('UPDATE workbooks SET accessed_at = ? WHERE digest = ?', (time.time(), digest))
+        self.hits += 1
+        return load_payloads(row[0]), digest
+
+    # -----------------------------------------------------------
+    # 解析結果を保存する（最大サイズを超えた場合は古いものから削除する）
+    #
+    # Parameters:
+    #  digest（str）：lookupで取得したファイルの内容のハッシュ
+    #  payloads（array）：解析済みのシートのリスト
+    # -----------------------------------------------------------
+    def store(self, digest, payloads):
+        body = dump_payloads(payloads)
+        self._conn.execute('INSERT OR REPLACE INTO workbooks VALUES (?, ?, ?, ?, ?)',
+                           (digest, self.version, body, len(body), time.time()))
+        self._evict()
+
+    def close(self):
+        self._conn.close()
+
+    def _evict(self):
+        total = self._conn.execute('SELECT COALESCE(SUM(size), 0) FROM workbooks').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for digest, size in self._conn.execute('SELECT digest, size FROM workbooks ORDER BY accessed_at').fetchall():
+            self._conn.execute('DELETE FROM workbooks WHERE digest = ?', (digest,))
+            total -= size
+            if total <= self.max_bytes:
+                break
@@ -5,4 +5,17 @@ TSV_NAME                = '1.0'
 QF_COLUMN_MAX           = 21                                                    #QFで取り込める列の最大（テスト定義の自由項目数 +「優先度」列）
 TSV_STATUS              = 'available'                                           #テストスイートバージョンのステータスの値（利用可）
 COL_TITLE_START         = '優先度'                                              #ヘッダーの最初の列のタイトル
-TEST_SUITE_DELETE_FLG   = 1                                                     #1：削除する、0：削除しない
\ No newline at end of file
+TEST_SUITE_DELETE_FLG   = 1                                                     #1：削除する、0：削除しない
+SYNC_EXISTING           = 0                                                     #1：既存のテストスイートは差分だけを新しいバージョンに同期する（TEST_SUITE_DELETE_FLGより優先）
+POOL_SIZE               = 10                                                    #ホストごとに保持するコネクションの最大数
+RATE_LIMIT              = 1.0                                                   #1秒あたりのリクエスト数（QFサービス規約対応のため）
+RATE_BURST              = 1                                                     #連続して送信できるリクエスト数
+MAX_WORKERS             = 4                                                     #テストケースを並列で作成する数
+PAGE_WORKERS            = 4                                                     #一覧の2ページ目以降を並列で取得する数（1：next_urlを順番にたどる）
+PARSE_WORKERS           = 0                                                     #Excelを並列で解析するプロセス数（0：CPU数、1：並列化しない）
+PARSE_CACHE_PATH        = 'parse_cache.sqlite3'                                 #Excelの解析結果をキャッシュするファイル（None：キャッシュしない）
+PARSE_CACHE_MAX_BYTES   = 200 * 1024 * 1024                                     #解析結果のキャッシュの最大サイズ（バイト）
+JOURNAL_PATH            = 'import_journal.sqlite3'                              #送信する操作を記録するジャーナル（--resumeで中断したインポートを再開する。None：記録しない）
+CACHE_PATH              = None                                                  #APIの応答をキャッシュするファイル（例：'qf_cache.sqlite3'。None：キャッシュしない）
+CACHE_TTL               = 600                                                   #ETag/Last-Modifiedがない応答を再検証せずに使う秒数（ある応答は毎回再検証する）
+METRICS_DIR             = 'metrics'                                             #計測結果（JSON・Prometheusのテキストファイル）の出力先（None：出力しない）
\ No newline at end of file
@@ -0,0 +1,93 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import datetime
+import os
+import random
+import sys
+
+import pytest
+
+#suites_importのモジュールを読み込む
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import format
+from loader import Cell, format_cells
+
+#数値の表示形式（一括変換する分数の形式を含む）
+NUMERIC_FORMATS = ['General', '0.00', '0.000', '#,##0', '#,##0.00', '"￥"#,##0', '0.00%', '0.0%', '0.00E+00',
+                   '# ?/?', '# ??/??', '#\\ ???/???', '#\\ ?/2', '#\\ ?/4', '#\\ ?/8', '#\\ ??/16', '#\\ ?/10', '#\\ ??/100']
+#日付の表示形式（一括変換できない形式を含む）
+DATE_FORMATS = ['yyyy/mm/dd', 'yyyy/m/d', 'yyyy/m/d h:mm', 'yyyy-mm-dd hh:mm:ss', 'yy/mm/dd', 'yyyy"年"m"月"d"日"',
+                'm"月"d"日"', 'h:mm', '[$-409]h:mm AM/PM', 'mmm d, yyyy', '@']
+#丸め・符号・floatで正確に表せない整数などの境界値
+NUMERIC_SPECIALS = [0, 0.0, -0.0, 0.5, -0.5, 1.005, 2.675, 999.995, 0.125, -1e-9, 1e15, 1e-300,
+                    2 ** 53, 2 ** 53 + 1, -(2 ** 53) - 1, 10 ** 20, True, False]
+#日付の境界値（4桁でない年・1900年2月29日前後・1未満のシリアル値）
+DATE_SPECIALS = [datetime.datetime(1, 1, 1), datetime.datetime(999, 12, 31, 23, 59, 59),
+                 datetime.datetime(9999, 12, 31, 23, 59, 59, 999999), datetime.date(2020, 2, 29),
+                 59, 60, 61, 1, 0.5, 2958465.99999]
+SEEDS = range(20)
+
+def random_numbers(rnd, size):
+    return [rnd.choice([rnd.uniform(-1e7, 1e7), rnd.randrange(-10 ** 9, 10 ** 9), round(rnd.uniform(-1000, 1000), rnd.randrange(4)),
+                        rnd.choice(NUMERIC_SPECIALS)]) for _ in range(size)]
+
+def random_dates(rnd, size):
+    base = datetime.datetime(1900, 1, 1)
+    kind = rnd.randrange(4)
+    if kind == 0:
+        return [base + datetime.timedelta(seconds=rnd.randrange(86400 * 365 * 200), microseconds=rnd.randrange(10 ** 6))
+                for _ in range(size)]
+    if kind == 1:
+        return [datetime.date(1900, 1, 1) + datetime.timedelta(days=rnd.randrange(365 * 200)) for _ in range(size)]
+    if kind == 2:
+        return [rnd.choice([rnd.uniform(1, 80000), rnd.randrange(1, 70)]) for _ in range(size)]
+    return [rnd.choice(DATE_SPECIALS) for _ in range(size)]
+
+# 1セルずつ変換した値（Excelのシリアル値はopenpyxlで日時に変換する）
+def format_scalar(val, type, fmt):
+    if type == format.TYPE_DATE and isinstance(val, (int, float)):
+        val = format.from_excel(val)
+    return format.format_value(val, type, fmt)
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('fmt', NUMERIC_FORMATS)
+def test_numeric_column_matches_scalar(seed, fmt):
+    rnd = random.Random(seed)
+    #一括変換する最小のセル数の前後を含める
+    values = random_numbers(rnd, rnd.choice([0, 1, format.COLUMN_MIN_SIZE - 1, format.COLUMN_MIN_SIZE, 300]))
+    assert format.format_column(values, format.TYPE_NUMERIC, fmt) == [format_scalar(x, format.TYPE_NUMERIC, fmt) for x in values]
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('fmt', DATE_FORMATS)
+def test_date_column_matches_scalar(seed, fmt):
+    rnd = random.Random(seed)
+    values = random_dates(rnd, rnd.choice([1, format.COLUMN_MIN_SIZE - 1, format.COLUMN_MIN_SIZE, 300]))
+    assert format.format_column(values, format.TYPE_DATE, fmt) == [format_scalar(x, format.TYPE_DATE, fmt) for x in values]
+
+def test_column_without_numpy_matches_scalar(monkeypatch):
+    monkeypatch.setattr(format, 'np', None)
+    rnd = random.Random(0)
+    for fmt in ['# ?/?', '#\\ ??/16']:
+        values = random_numbers(rnd, 100)
+        assert format.format_column(values, format.TYPE_NUMERIC, fmt) == [format_scalar(x, format.TYPE_NUMERIC, fmt) for x in values]
+    values = [rnd.uniform(1, 80000) for _ in range(100)]
+    assert format.format_column(values, format.TYPE_DATE, 'yyyy/m/d h:mm') == [format_scalar(x, format.TYPE_DATE, 'yyyy/m/d h:mm') for x in values]
+
+# 空のセル・文字列・数値・日付が混在する列を、1セルずつ変換した結果と比較する
+@pytest.mark.parametrize('seed', SEEDS)
+def test_format_cells_matches_scalar(seed):
+    rnd = random.Random(seed)
+    cells = []
+    for _ in range(rnd.randrange(200)):
+        kind = rnd.randrange(4)
+        if kind == 0:
+            cells.append(Cell(None, rnd.choice(['n', 'd', 's']), 'General'))
+        elif kind == 1:
+            cells.append(Cell(rnd.choice(['テキスト', '', ' ', '0.5', '2020/01/01']), 's', 'General'))
+        elif kind == 2:
+            cells.append(Cell(random_numbers(rnd, 1)[0], 'n', rnd.choice(NUMERIC_FORMATS)))
+        else:
+            cells.append(Cell(random_dates(rnd, 1)[0], 'd', rnd.choice(DATE_FORMATS)))
+    expected = [None if c.value is None else str(c.value) if c.data_type == 's' else format_scalar(c.value, c.data_type, c.number_format)
+                for c in cells]
+    assert format_cells(cells) == expected
@@ -0,0 +1,118 @@
+# coding: utf-8
+""" Copyright (c) 2020 VeriServe Corporation """
+import os
+import sys
+
+import pytest
+
+#suites_importのモジュールを読み込む
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import ImportTestCase
+import journal
+from loader import SheetPayload
+
+SUITE_NAME = 'テストスイート'
+SUITE_ID = 11
+VERSION_ID = 22
+
+def make_sheet(count):
+    return SheetPayload(SUITE_NAME, True, 2, ['手順', '期待結果'], ['&row=' + str(i) for i in range(1, count + 1)])
+
+@pytest.fixture
+def importer(tmp_path, monkeypatch):
+    _journal = journal.ImportJournal(str(tmp_path / 'import_journal.sqlite3'))
+    monkeypatch.setattr(ImportTestCase, '_journal', _journal)
+    monkeypatch.setattr(ImportTestCase, '_resume', True)
+    monkeypatch.setattr(ImportTestCase.settings, 'MAX_WORKERS', 2)
+    sent = []
+
+    def fail(name):
+        def send(*args):
+            raise AssertionError(name + 'を送信しました')
+        return send
+
+    def create_new_tc(test_suite_id, test_suite_version_id, row_payload, tc_no):
+        sent.append(('create_case', test_suite_id, test_suite_version_id, tc_no))
+        return True
+
+    def update_test_suite_version(test_suite_id, test_suite_version_id):
+        sent.append(('update_status', test_suite_id, test_suite_version_id))
+        return True
+    monkeypatch.setattr(ImportTestCase, 'create_new_suite', fail('テストスイートの作成'))
+    monkeypatch.setattr(ImportTestCase, 'create_new_tsv', fail('テストスイートバージョンの作成'))
+    monkeypatch.setattr(ImportTestCase, 'create_new_tc', create_new_tc)
+    monkeypatch.setattr(ImportTestCase, 'update_test_suite_version', update_test_suite_version)
+    monkeypatch.setattr(ImportTestCase, 'get_request_pages', fail('一覧の取得'))
+    yield _journal, sent
+    _journal.close()
+
+# テストスイートとバージョンを作成し、テストケースの一部を作成したところで中断した記録を作る
+def interrupt(_journal, sheet, done_cases, sent_cases=()):
+    key = SUITE_NAME
+    _journal.begin_sheet(key, journal.sheet_digest(sheet), len(sheet.rows), None)
+    _journal.mark_done(key, journal.OP_SUITE, result_id=SUITE_ID)
+    _journal.mark_done(key, journal.OP_VERSION, result_id=VERSION_ID)
+    for tc_no in done_cases:
+        _journal.mark_done(key, journal.OP_CASE, tc_no)
+    for tc_no in sent_cases:
+        _journal.mark_sent(key, journal.OP_CASE, tc_no)
+
+def test_load_sheet_requires_same_digest(importer):
+    _journal, _ = importer
+    sheet = make_sheet(3)
+    interrupt(_journal, sheet, [1])
+    assert _journal.load_sheet(SUITE_NAME, journal.sheet_digest(sheet)).pending_cases() == [(2, journal.STATE_PLANNED), (3, journal.STATE_PLANNED)]
+    assert _journal.load_sheet(SUITE_NAME, journal.sheet_digest(make_sheet(4))) is None
+    assert _journal.load_sheet('別のテストスイート', journal.sheet_digest(sheet)) is None
+
+# 完了したテストスイート・バージョン・テストケースは送信せず、残りだけを作成する
+def test_resume_skips_completed_steps(importer):
+    _journal, sent = importer
+    sheet = make_sheet(5)
+    interrupt(_journal, sheet, [1, 2, 4])
+    ImportTestCase.import_sheet(SUITE_NAME, sheet)
+    assert sorted(sent) == [('create_case', SUITE_ID, VERSION_ID, 3), ('create_case', SUITE_ID, VERSION_ID, 5),
+                            ('update_status', SUITE_ID, VERSION_ID)]
+    state = _journal.load_sheet(SUITE_NAME, journal.sheet_digest(sheet))
+    assert state.pending_cases() == []
+    assert state.is_complete()
+
+# 送信中のまま残ったテストケースは、サーバに作成済みであれば送信しない
+def test_resume_checks_sent_cases(importer, monkeypatch):
+    _journal, sent = importer
+    sheet = make_sheet(4)
+    interrupt(_journal, sheet, [1], sent_cases=[2, 3])
+    urls = []
+
+    def get_request_pages(mid_url, content_name):
+        urls.append(mid_url)
+        return [{'no': 1}, {'no': 2}]
+    monkeypatch.setattr(ImportTestCase, 'get_request_pages', get_request_pages)
+    ImportTestCase.import_sheet(SUITE_NAME, sheet)
+    assert urls == ['test_suites/' + str(SUITE_ID) + '/test_suite_versions/' + str(VERSION_ID) + '/test_cases']
+    assert sorted(sent) == [('create_case', SUITE_ID, VERSION_ID, 3), ('create_case', SUITE_ID, VERSION_ID, 4),
+                            ('update_status', SUITE_ID, VERSION_ID)]
+
+# インポート済みのシートは何も送信しない
+def test_resume_skips_completed_sheet(importer):
+    _journal, sent = importer
+    sheet = make_sheet(2)
+    interrupt(_journal, sheet, [1, 2])
+    _journal.mark_done(SUITE_NAME, journal.OP_STATUS)
+    ImportTestCase.import_sheet(SUITE_NAME, sheet)
+    assert sent == []
+
+# --resumeを指定しない場合は記録があっても最初から作成する
+def test_without_resume_starts_over(importer, monkeypatch):
+    _journal, sent = importer
+    sheet = make_sheet(2)
+    interrupt(_journal, sheet, [1, 2])
+    monkeypatch.setattr(ImportTestCase, '_resume', False)
+    monkeypatch.setattr(ImportTestCase.settings, 'SYNC_EXISTING', False)
+    monkeypatch.setattr(ImportTestCase, 'check_exist_test_suite', lambda name: None)
+    monkeypatch.setattr(ImportTestCase, 'create_new_suite', lambda name, labels: SUITE_ID + 1)
+    monkeypatch.setattr(ImportTestCase, 'create_new_tsv', lambda test_suite_id: VERSION_ID + 1)
+    ImportTestCase.import_sheet(SUITE_NAME, sheet)
+    assert sorted(sent) == [('create_case', SUITE_ID + 1, VERSION_ID + 1, 1), ('create_case', SUITE_ID + 1, VERSION_ID + 1, 2),
+                            ('update_status', SUITE_ID + 1, VERSION_ID + 1)]
+    assert _journal.load_sheet(SUITE_NAME, journal.sheet_digest(sheet)).result_id(journal.OP_SUITE) == SUITE_ID + 1
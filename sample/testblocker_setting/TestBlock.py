@@ -3,19 +3,27 @@
 """ Copyright (c) 2020 VeriServe Corporation """
 try:
     import json
-    import requests
     import datetime
     import os
+    import sys
     import settings
-    import time
     import logging
+    import csv
+    from concurrent.futures import ThreadPoolExecutor
+    #共通モジュール（sample/common）を読み込む
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+    import qf_client
+    import qf_pages
+    import qf_mirror
 except ModuleNotFoundError as err:
     print('「' + err.name + '」のモジュールが見つかりません。以下のコマンドラインでインストールしてください。')
     print('>> pip install ' + err.name)
     exit()
 
-#QFサービス規約対応のため
-SLEEP_TIME = 1
+#【定数】
+#ラベルのキー名（label_content1〜label_contentN）
+LABEL_CONTENT = 'label_content'
+
 #ログの設定
 logging.basicConfig(filename='app_{0}.log'.format(datetime.datetime.now().strftime('%Y%m%d')), 
                     filemode='a', 
@@ -66,27 +74,8 @@ def build_url_api(mid_url):
 #  ret（array）：APIから応答された結果のリスト
 # -----------------------------------------------------------
 def get_request_pages(mid_url, content_name):
-    ret = None
-    url = build_url_api(mid_url)
-    while True:
-        #APIにリクエストを送信する
-        response = requests.get(url)
-        time.sleep(SLEEP_TIME)
-        #応答結果の確認
-        if response.status_code != 200:
-            return None
-        content = json.loads(response.content)
-        #リストに結果を格納する
-        if ret is None:
-            ret = content[content_name]
-        else:
-            ret.extend(content[content_name])
-
-        #次のページがあるかどうかをチェックする
-        if 'next_url' not in content or content['next_url'] is None or content['total_pages'] == 0:
-            break
-        url = content['next_url']
-    return ret
+    #2ページ目以降は並列で取得する
+    return qf_pages.get_pages(build_url_api(mid_url), content_name, settings.PAGE_WORKERS)
 
 # -----------------------------------------------------------
 # APIからプロジェクトの情報を取得する
@@ -100,8 +89,7 @@ def get_project_info():
     url = build_url_api('current_project')
 
     #APIにリクエストを送信する
-    response = requests.get(url)
-    time.sleep(SLEEP_TIME)
+    response = qf_client.get(url)
     #応答結果の確認
     if response.status_code != 200:
         return None
@@ -128,8 +116,7 @@ def post_request(mid_url, payload, headers):
     url = build_url_api(mid_url)
     #データのエンコード
     payload = payload.encode('utf-8')
-    response = requests.post(url, data=payload, headers=headers)
-    time.sleep(SLEEP_TIME)
+    response = qf_client.post(url, data=payload, headers=headers)
     #応答結果の確認
     if response.status_code == 201:
         content = json.loads(response.content)
@@ -154,8 +141,7 @@ def update_request(mid_url, payload, headers):
     url = build_url_api(mid_url)
     #データのエンコード
     payload = payload.encode('utf-8')
-    response = requests.patch(url, data=payload, headers=headers)
-    time.sleep(SLEEP_TIME)
+    response = qf_client.patch(url, data=payload, headers=headers)
     #応答結果の確認
     if response.status_code == 200:
         return json.loads(response.content)
@@ -176,8 +162,7 @@ def update_request(mid_url, payload, headers):
 # -----------------------------------------------------------
 def delete_request(mid_url, headers):
     url = build_url_api(mid_url)
-    response = requests.delete(url, headers=headers)
-    time.sleep(SLEEP_TIME)
+    response = qf_client.delete(url, headers=headers)
     if response.status_code == 204:
         return True
     else:
@@ -220,18 +205,127 @@ def update_test_block(col_block_index, test_suite_id):
         print('テストブロッカー列に指定に失敗しました。')
         exit()
 
+# -----------------------------------------------------------
+# ラベル名からテストスイートと項目Nを引く索引を作成する
+#   全テストスイートのlabel_contentNを1回だけ走査する
+#   同じテストスイートに同じラベル名が複数ある場合は最初の項目を使う
+#
+# Parameters:
+#  test_suites（array）：テストスイートのリスト
+#
+# Returns:
+#  index（dict）：ラベル名 → (テストスイート, 項目N) のリスト
+# -----------------------------------------------------------
+def build_label_index(test_suites):
+    index = {}
+    for ts in test_suites:
+        seen = set()
+        for key, value in ts.items():
+            if not key.startswith(LABEL_CONTENT) or not key[len(LABEL_CONTENT):].isdigit() or value is None or value in seen:
+                continue
+            seen.add(value)
+            index.setdefault(value, []).append((ts, int(key[len(LABEL_CONTENT):])))
+    return index
+
+# -----------------------------------------------------------
+# テストスイート名とラベル名の対応ファイル（CSV：テストスイート名,ラベル名）を読み込む
+#
+# Parameters:
+#  file_path（str）：対応ファイルのパス
+#
+# Returns:
+#  mapping（dict）：テストスイート名 → ラベル名
+# -----------------------------------------------------------
+def load_label_mapping(file_path):
+    mapping = {}
+    try:
+        with open(file_path, encoding='utf_8_sig', newline='') as f:
+            for row in csv.reader(f):
+                if len(row) < 2 or row[0].strip() == '':
+                    continue
+                mapping[strip_quotes(row[0])] = strip_quotes(row[1])
+    except FileNotFoundError:
+        print('ファイルが見つかりません。: ' + file_path)
+        exit()
+    return mapping
+
+# -----------------------------------------------------------
+# テストスイートごとにテストブロッカー列に指定する項目Nを決める
+#   対応ファイルにあるテストスイートは対応するラベル名だけを使い、
+#   それ以外は指定したラベル名のうち先に指定したものを優先する
+#
+# Parameters:
+#  test_suites（array）：テストスイートのリスト
+#  index（dict）：build_label_indexで作成した索引
+#  label_names（array）：ラベル名のリスト
+#  label_mapping（dict）：テストスイート名 → ラベル名
+#
+# Returns:
+#  targets（array）：(テストスイート, 項目N) のリスト（テストスイートの順番）
+# -----------------------------------------------------------
+def plan_test_blocks(test_suites, index, label_names, label_mapping):
+    columns = {}
+    for label in label_names:
+        for ts, column in index.get(label, []):
+            if ts['name'] not in label_mapping:
+                columns.setdefault(ts['id'], column)
+    for label in set(label_mapping.values()):
+        for ts, column in index.get(label, []):
+            if label_mapping.get(ts['name']) == label:
+                columns[ts['id']] = column
+    return [(ts, columns[ts['id']]) for ts in test_suites if ts['id'] in columns]
+
+# -----------------------------------------------------------
+# 「利用可」のテストスイートバージョンが存在するかを確認する
+#   見つかった時点で残りのページは取得しない
+#
+# Parameters:
+#  test_suite_id（int）：テストスイート番号
+#  mirror（Mirror）：最新のミラー（ミラーに「利用可」のバージョンがあればAPIから取得しない）
+#
+# Returns:
+#  available（bool）：存在する場合はTrue（取得に失敗した場合はNone）
+#  skipped_pages（int）：取得せずに済んだページ数
+# -----------------------------------------------------------
+def has_available_version(test_suite_id, mirror=None):
+    #ミラーは同期した時点の内容のため、見つからない場合は同期後に利用可になったバージョンをAPIで確認する
+    versions = mirror.list('test_suite_versions', test_suite_id) if mirror is not None else None
+    if versions is not None and any(tsv['status'] == settings.TSV_STATUS for tsv in versions):
+        return True, 0
+    url = build_url_api('test_suites/' + str(test_suite_id) + '/test_suite_versions')
+    fetched = 0
+    while True:
+        content = qf_pages.get_page(url)
+        if content is None:
+            return None, 0
+        fetched += 1
+        for tsv in content['test_suite_versions']:
+            if tsv['status'] == settings.TSV_STATUS:
+                return True, max(0, content.get('total_pages', fetched) - fetched)
+        if not qf_pages.has_next(content):
+            return False, 0
+        url = content['next_url']
+
 # -----------------------------------------------------------
 # マイン関数
 # -----------------------------------------------------------
 if __name__ == '__main__':
-    global _target_index
-
     # コマンドラインオプション処理
     import argparse
     ap = argparse.ArgumentParser(description='Quality Forwardのテスト結果文字列を置換する。')
-    ap.add_argument("-n", "--label_name", action='store', help="ラベル名を指定する", required=True)
+    ap.add_argument("-n", "--label_name", action='store', nargs='+', default=[], help="ラベル名を指定する（複数指定した場合は先に指定したものを優先する）")
+    ap.add_argument("-f", "--label_file", action='store', help="テストスイート名とラベル名の対応ファイル（CSV：テストスイート名,ラベル名）")
     args = ap.parse_args()
-    _label_name = strip_quotes(args.label_name)
+    if len(args.label_name) == 0 and args.label_file is None:
+        ap.error('-n または -f を指定してください。')
+    _label_names = [strip_quotes(x) for x in args.label_name]
+    _label_mapping = {}
+    if args.label_file is not None:
+        _label_mapping = load_label_mapping(args.label_file)
+
+    #APIのクライアントを設定する
+    qf_client.configure(pool_size=settings.POOL_SIZE, rate=settings.RATE_LIMIT, burst=settings.RATE_BURST,
+                        cache_path=settings.CACHE_PATH, cache_ttl=settings.CACHE_TTL)
 
     #project_idを取得する
     project_id = get_project_info()
@@ -239,40 +333,41 @@ if __name__ == '__main__':
         print('APIキーが不正です。')
         exit()
 
-    #QFから全てのテストスイートを取得する
+    #QFから全てのテストスイートを取得する（更新の判断に使うため、ミラーではなくAPIから取得する）
     _test_suite_list = get_request_pages('test_suites', 'test_suites')
+    project_suites = [ts for ts in _test_suite_list if ts['project_id'] == project_id]
+    other_project = len(_test_suite_list) - len(project_suites)
 
-    for ts in _test_suite_list:
-        if ts['project_id'] != project_id:
-            continue
-        isTarget = False
-        #QFから全てのテストスイートバージョンを取得する
-        _test_suite_vs_list = get_request_pages('test_suites/' + str(ts['id']) + '/test_suite_versions', 'test_suite_versions')
-        #「利用可」のテストスイートバージョンが存在する
+    #ラベル名の索引から対象を決め、既に同じ列が指定されているテストスイートは除く
+    targets = plan_test_blocks(project_suites, build_label_index(project_suites), _label_names, _label_mapping)
+    no_label = len(project_suites) - len(targets)
+    candidates = [(ts, column) for ts, column in targets if str(ts.get('test_blocker_column')) != str(column)]
+    unchanged = len(targets) - len(candidates)
 
-        for tsv in _test_suite_vs_list:
-            if tsv['status'] == settings.TSV_STATUS:
-                isTarget = True
-                break
-        if isTarget == False:
-            continue
+    #「利用可」のテストスイートバージョンの有無を並列で確認する（最新のミラーに利用可のバージョンがあればAPIを使わない）
+    mirror = qf_mirror.open_mirror(settings.MIRROR_PATH, settings.BASE_API_URL, settings.API_KEY, settings.MIRROR_MAX_AGE)
+    with ThreadPoolExecutor(max_workers=max(1, settings.MAX_WORKERS)) as executor:
+        results = list(executor.map(lambda x: has_available_version(x[0]['id'], mirror), candidates))
+    if mirror is not None:
+        mirror.close()
 
-        _target_index = 0
-
-        keys = ts.keys()
-        label_content_list = list(filter(lambda x: x.find('label_content') != -1, keys))
-
-        #同ラベル名が存在するテストスイートの項目Nを見つける
-        for label in label_content_list:
-            if ts[label] == _label_name:
-                _target_index = int(label.replace('label_content', ''))
-                break
-
-        if _target_index > 0:
-            update_test_block(_target_index, ts['id'])
-            logging.info('設定を有効にしたテストスイート名：' + ts['name'])
-            print('設定を有効にしたテストスイート名：' + ts['name'])
+    skipped_pages = 0
+    for (ts, column), (available, skipped) in zip(candidates, results):
+        skipped_pages += skipped
+        if available is None:
+            print('テストスイートバージョンの取得に失敗しました。: ' + ts['name'])
+            continue
+        if not available:
+            continue
+        update_test_block(column, ts['id'])
+        logging.info('設定を有効にしたテストスイート名：' + ts['name'])
+        print('設定を有効にしたテストスイート名：' + ts['name'])
 
+    print('バージョンの確認を省略したテストスイート: ' + str(other_project + no_label + unchanged) + '件（他プロジェクト '
+          + str(other_project) + '件、ラベルなし ' + str(no_label) + '件、変更なし ' + str(unchanged)
+          + '件）、取得を省略したページ: ' + str(skipped_pages) + '件')
     print('テストブロッカー指定が完了しました。')
+    qf_client.print_stats()
+    qf_client.export_metrics(settings.METRICS_DIR, 'test_block')
 
-    exit()
\ No newline at end of file
+    exit()
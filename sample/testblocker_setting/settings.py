@@ -1,3 +1,13 @@
 BASE_API_URL = 'https://cloud.veriserve.co.jp/api/v2/'         #APIのパス
 API_KEY = 'xxxxx'    #APIのキー
 TSV_STATUS = 'available'         #テストスイートバージョンのステータスの値（利用可）
+POOL_SIZE = 10         #ホストごとに保持するコネクションの最大数
+RATE_LIMIT = 1.0       #1秒あたりのリクエスト数（QFサービス規約対応のため）
+RATE_BURST = 1         #連続して送信できるリクエスト数
+PAGE_WORKERS = 4         #一覧の2ページ目以降を並列で取得する数（1：next_urlを順番にたどる）
+MAX_WORKERS = 4         #テストスイートバージョンを並列で確認する数
+CACHE_PATH = None         #APIの応答をキャッシュするファイル（例：'qf_cache.sqlite3'。None：キャッシュしない）
+CACHE_TTL = 600         #ETag/Last-Modifiedがない応答を再検証せずに使う秒数（ある応答は毎回再検証する）
+MIRROR_PATH = None         #project_mirror/sync.pyで同期したミラー（最新の場合は「利用可」のバージョンがあるテストスイートの確認にAPIを使わない。None：使わない）
+MIRROR_MAX_AGE = 3600         #ミラーを最新とみなす最後の同期からの秒数
+METRICS_DIR = 'metrics'         #計測結果（JSON・Prometheusのテキストファイル）の出力先（None：出力しない）
\ No newline at end of file